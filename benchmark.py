@@ -0,0 +1,328 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+# -----------------------------------------------------------
+# I. CORPUS FIXO DE TEXTOS AGRONÔMICOS
+# -----------------------------------------------------------
+
+CORPUS = [
+    "ORONDIS® é um fungicida indicado para o controle do míldio na cultura da batata. "
+    "Deve ser aplicado de forma preventiva, respeitando o intervalo entre aplicações recomendado em bula.",
+
+    "O manejo de soja exige atenção à ferrugem asiática. O monitoramento semanal da lavoura "
+    "e a rotação de mecanismos de ação ajudam a evitar a resistência do fungo aos fungicidas.",
+
+    "Milho safrinha semeado após a soja precisa de adubação nitrogenada em cobertura. "
+    "A aplicação deve ocorrer entre os estádios V4 e V6 para melhor aproveitamento do nutriente.",
+
+    "Manual de identificação de plantas daninhas: buva, capim-amargoso e caruru são as principais "
+    "espécies resistentes ao glifosato no Brasil e exigem manejo integrado com herbicidas pré-emergentes.",
+
+    "Miravis Pro é um fungicida para o controle de manchas foliares no trigo. "
+    "A dose recomendada deve ser conferida na bula, e a aplicação deve ser feita com boa cobertura.",
+
+    "\n\n".join([
+        "A cultura do café no cerrado mineiro tem alta produtividade quando irrigada corretamente.",
+        "O bicho-mineiro é a principal praga e deve ser monitorado durante a estação seca, quando as "
+        "populações crescem rapidamente e as folhas minadas caem, reduzindo a área fotossintética.",
+        "A ferrugem do cafeeiro é controlada com fungicidas cúpricos e triazóis, aplicados de acordo com o "
+        "histórico da lavoura e a carga pendente de frutos.",
+        "O manejo nutricional com potássio e boro é determinante para o enchimento dos grãos, e a análise "
+        "foliar deve ser realizada anualmente para ajustar as doses.",
+        "A colheita seletiva melhora a qualidade da bebida, e a secagem em terreiro suspenso reduz defeitos.",
+    ] * 3),
+]
+
+INSTRUCOES = [
+    "Mude o tom para formal.",
+    "Aumente o segundo parágrafo em 30 palavras.",
+    "",
+]
+
+
+# -----------------------------------------------------------
+# II. SERVIDORES LOCAIS (OpenAI e Astra) E GEMINI FALSO
+# -----------------------------------------------------------
+
+class ConfiguracaoFalsa:
+    """Latência (ms) e taxa de falhas de cada serviço falso, além dos bytes trafegados."""
+    def __init__(self, latencia_ms: float, jitter_ms: float, taxa_falhas: float):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.taxa_falhas = taxa_falhas
+        self.bytes = 0
+        self.requisicoes = 0
+        self._lock = threading.Lock()
+
+    def esperar(self, extra_ms: float = 0.0) -> None:
+        time.sleep(max(0.0, self.latencia_ms + extra_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+    def falhou(self) -> bool:
+        return random.random() < self.taxa_falhas
+
+    def contar(self, n_bytes: int) -> None:
+        with self._lock:
+            self.bytes += n_bytes
+            self.requisicoes += 1
+
+
+def _vetor_deterministico(texto: str, dimensoes: int = 1536) -> List[float]:
+    semente = int(hashlib.sha256(texto.encode("utf-8")).hexdigest()[:8], 16)
+    gerador = random.Random(semente)
+    return [gerador.uniform(-1, 1) for _ in range(dimensoes)]
+
+
+class _HandlerBase(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: ConfiguracaoFalsa = None
+
+    def _ler_json(self) -> Dict:
+        corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._bytes_entrada = len(corpo)
+        return json.loads(corpo or b"{}")
+
+    def _responder(self, status: int, dados: Dict) -> None:
+        corpo = json.dumps(dados).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+        self.config.contar(self._bytes_entrada + len(corpo))
+
+    def log_message(self, *args):
+        pass
+
+
+class HandlerOpenAI(_HandlerBase):
+    """Imita /v1/embeddings e /v1/chat/completions (inclusive streaming SSE)."""
+    ms_por_token = 0.0
+
+    def do_POST(self):
+        dados = self._ler_json()
+        if self.config.falhou():
+            self.config.esperar()
+            return self._responder(503, {"error": {"message": "falha simulada", "type": "server_error"}})
+
+        if self.path.endswith("/embeddings"):
+            entradas = dados["input"] if isinstance(dados["input"], list) else [dados["input"]]
+            self.config.esperar()
+            return self._responder(200, {
+                "object": "list",
+                "model": dados.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": _vetor_deterministico(t)}
+                         for i, t in enumerate(entradas)],
+                "usage": {"prompt_tokens": sum(len(t) // 4 for t in entradas),
+                          "total_tokens": sum(len(t) // 4 for t in entradas)},
+            })
+
+        prompt = dados["messages"][-1]["content"]
+        texto = "Texto revisado com terminologia técnica precisa. " * max(1, len(prompt) // 400)
+        if dados.get("response_format", {}).get("type") == "json_object":
+            resposta = json.dumps({"texto_revisado": texto.strip(), "fontes": [1],
+                                   "ajustes": ["Termo vago substituído (Fonte 1)."]}, ensure_ascii=False)
+        else:
+            resposta = texto
+        tokens_resposta = len(resposta) // 4
+        base = {"id": "bench", "created": int(time.time()), "model": dados.get("model")}
+        self.config.esperar(extra_ms=tokens_resposta * self.ms_por_token)
+
+        if not dados.get("stream"):
+            return self._responder(200, dict(base, object="chat.completion", choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": resposta},
+            }], usage={"prompt_tokens": len(prompt) // 4, "completion_tokens": tokens_resposta,
+                       "total_tokens": len(prompt) // 4 + tokens_resposta}))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        enviados = 0
+        for i in range(0, len(resposta), 40):
+            chunk = dict(base, object="chat.completion.chunk", choices=[{
+                "index": 0, "delta": {"content": resposta[i:i + 40]}, "finish_reason": None}])
+            linha = f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+            self.wfile.write(linha)
+            enviados += len(linha)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.config.contar(self._bytes_entrada + enviados)
+        self.close_connection = True
+
+
+class HandlerAstra(_HandlerBase):
+    """Imita o comando find do Data API (com ordenação por $vector)."""
+    tamanho_documento = 1500
+
+    def do_POST(self):
+        dados = self._ler_json()
+        self.config.esperar()
+        if self.config.falhou():
+            return self._responder(503, {"errors": [{"message": "falha simulada"}]})
+        find = dados.get("find", {})
+        limite = find.get("options", {}).get("limit", 10)
+        colecao = self.path.rstrip("/").split("/")[-1]
+        documentos = [{
+            "_id": f"{colecao}-{i}",
+            "content": f"Referência técnica {i} da coleção {colecao}. " + "x" * self.tamanho_documento,
+            "metadata": {"fonte": f"{colecao.lower()}_{i}.pdf"},
+            "$similarity": round(0.95 - i * 0.02, 4),
+        } for i in range(limite)]
+        self._responder(200, {"data": {"documents": documentos, "nextPageState": None}})
+
+
+class GeminiFalso:
+    """Substitui classificacao.model com latência e falhas configuráveis."""
+    def __init__(self, config: ConfiguracaoFalsa):
+        self.config = config
+
+    def generate_content(self, prompt: str):
+        self.config.esperar()
+        self.config.contar(len(prompt.encode("utf-8")))
+        if self.config.falhou():
+            raise RuntimeError("falha simulada do Gemini")
+
+        class _Resposta:
+            text = random.choice(["PRODUTO", "CULTURA", "OUTROS"])
+        return _Resposta()
+
+
+def _subir_servidor(handler_cls, config: ConfiguracaoFalsa) -> ThreadingHTTPServer:
+    handler = type(handler_cls.__name__, (handler_cls,), {"config": config})
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# -----------------------------------------------------------
+# III. EXECUÇÃO DO BENCHMARK
+# -----------------------------------------------------------
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def executar(args) -> List[Dict]:
+    configs = {
+        "openai": ConfiguracaoFalsa(args.latencia_openai_ms, args.jitter_ms, args.taxa_falhas),
+        "astra": ConfiguracaoFalsa(args.latencia_astra_ms, args.jitter_ms, args.taxa_falhas),
+        "gemini": ConfiguracaoFalsa(args.latencia_gemini_ms, args.jitter_ms, args.taxa_falhas),
+    }
+    HandlerOpenAI.ms_por_token = args.ms_por_token
+    servidor_openai = _subir_servidor(HandlerOpenAI, configs["openai"])
+    servidor_astra = _subir_servidor(HandlerAstra, configs["astra"])
+
+    # O ambiente precisa estar pronto antes de importar os módulos do pipeline
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{servidor_openai.server_port}/v1",
+        "GEMINI_API_KEY": "benchmark",
+        "ASTRA_DB_APPLICATION_TOKEN": "benchmark",
+        "ASTRA_DB_API_ENDPOINT": f"http://127.0.0.1:{servidor_astra.server_port}",
+        "ASTRA_DB_NAMESPACE": "benchmark",
+        "REVISOR_CACHE_DIR": tempfile.mkdtemp(prefix="revisor_bench_"),
+    })
+    if not args.com_cache:
+        os.environ["REVISOR_CACHE_RESPOSTAS"] = "0"
+        os.environ["REVISOR_CACHE_SEMANTICO"] = "0"
+        os.environ["REVISOR_CONTEXTO_QUENTE"] = "0"
+
+    import classificacao
+    import revisor
+    from cache import CacheEmbeddings, CacheLRU
+    classificacao.provedor_modelo.definir(GeminiFalso(configs["gemini"]))
+    if not args.com_cache:
+        # Caches sem chave de ativação: capacidade zero, nenhum item fica guardado
+        revisor.provedor_cache_embeddings.definir(CacheEmbeddings(max_itens=0, max_mb=0))
+        classificacao._cache_memoria = CacheLRU(max_itens=0)
+        classificacao._provedor_cache_disco.definir(None)
+
+    resultados = []
+    for concorrencia in args.concorrencia:
+        for config in configs.values():
+            config.bytes = config.requisicoes = 0
+
+        def revisar(i: int) -> Dict:
+            texto = CORPUS[i % len(CORPUS)]
+            if not args.com_cache:
+                # Torna cada texto único para medir o caminho sem cache
+                texto = f"{texto}\n(Ref. benchmark {concorrencia}-{i})"
+            instrucao = INSTRUCOES[i % len(INSTRUCOES)]
+            inicio = time.perf_counter()
+            revisao = revisor.reescrever_revisor(texto)
+            erro = not revisao.ok
+            if instrucao and not erro:
+                revisor.ajuste_incremental(revisao.texto, instrucao)
+            return {"latencia_s": time.perf_counter() - inicio, "erro": erro}
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            medicoes = list(executor.map(revisar, range(args.requisicoes)))
+        duracao = time.perf_counter() - inicio
+
+        latencias = [m["latencia_s"] for m in medicoes]
+        resultados.append({
+            "concorrencia": concorrencia,
+            "requisicoes": len(medicoes),
+            "erros": sum(m["erro"] for m in medicoes),
+            "p50_ms": round(_percentil(latencias, 0.50) * 1000, 1),
+            "p95_ms": round(_percentil(latencias, 0.95) * 1000, 1),
+            "p99_ms": round(_percentil(latencias, 0.99) * 1000, 1),
+            "vazao_rps": round(len(medicoes) / duracao, 2),
+            "bytes": {nome: config.bytes for nome, config in configs.items()},
+            "chamadas": {nome: config.requisicoes for nome, config in configs.items()},
+        })
+
+    servidor_openai.shutdown()
+    servidor_astra.shutdown()
+    return resultados
+
+
+def imprimir_tabela(resultados: List[Dict]) -> None:
+    print("\n" + "=" * 100)
+    print(f"{'conc.':>6} {'req':>5} {'erros':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} "
+          f"{'KB openai':>10} {'KB astra':>10} {'KB gemini':>10}")
+    for r in resultados:
+        print(f"{r['concorrencia']:>6} {r['requisicoes']:>5} {r['erros']:>6} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+              f"{r['p99_ms']:>9} {r['vazao_rps']:>8} {r['bytes']['openai'] / 1024:>10.1f} "
+              f"{r['bytes']['astra'] / 1024:>10.1f} {r['bytes']['gemini'] / 1024:>10.1f}")
+    print("=" * 100)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark offline do pipeline RAG com OpenAI, Gemini e Astra simulados localmente.")
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requisicoes", type=int, default=48, help="Requisições por nível de concorrência.")
+    parser.add_argument("--latencia-openai-ms", type=float, default=150)
+    parser.add_argument("--latencia-astra-ms", type=float, default=80)
+    parser.add_argument("--latencia-gemini-ms", type=float, default=300)
+    parser.add_argument("--ms-por-token", type=float, default=0.5, help="Latência extra da geração por token de saída.")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--taxa-falhas", type=float, default=0.0, help="Fração de requisições que falham (0 a 1).")
+    parser.add_argument("--com-cache", action="store_true", help="Repete os textos e mantém os caches ativos (sem a opção, todos os caches ficam desligados).")
+    parser.add_argument("--saida-json", default=None, help="Grava os resultados em JSON neste arquivo.")
+    args = parser.parse_args()
+
+    resultados = executar(args)
+    imprimir_tabela(resultados)
+    if args.saida_json:
+        with open(args.saida_json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,365 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+import hashlib
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO CACHE
+# -----------------------------------------------------------
+
+CACHE_DIR = os.getenv(
+    "REVISOR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+# Itens mantidos na memória do processo (LRU na frente do disco)
+CACHE_EMBEDDING_MAX_ITENS = int(os.getenv("CACHE_EMBEDDING_MAX_ITENS", "2048"))
+# Limite de tamanho do arquivo SQLite de embeddings (em MB)
+CACHE_EMBEDDING_MAX_MB = float(os.getenv("CACHE_EMBEDDING_MAX_MB", "256"))
+
+# Cache de respostas completas do pipeline (revisão e ajuste incremental)
+CACHE_RESPOSTAS_MAX_ITENS = int(os.getenv("CACHE_RESPOSTAS_MAX_ITENS", "256"))
+CACHE_RESPOSTAS_MAX_MB = float(os.getenv("CACHE_RESPOSTAS_MAX_MB", "128"))
+CACHE_RESPOSTAS_TTL_S = float(os.getenv("CACHE_RESPOSTAS_TTL_S", str(24 * 3600)))
+
+# Cache semântico (textos quase idênticos reaproveitam classificação e contexto RAG)
+CACHE_SEMANTICO_MAX_ITENS = int(os.getenv("CACHE_SEMANTICO_MAX_ITENS", "1024"))
+CACHE_SEMANTICO_LIMIAR = float(os.getenv("CACHE_SEMANTICO_LIMIAR", "0.97"))
+CACHE_SEMANTICO_TTL_S = float(os.getenv("CACHE_SEMANTICO_TTL_S", str(6 * 3600)))
+
+# Intervalo mínimo entre atualizações do último acesso de um item em disco: leituras
+# repetidas do mesmo item não geram uma escrita cada (o LRU só precisa de precisão aproximada)
+CACHE_DISCO_INTERVALO_ACESSO_S = float(os.getenv("CACHE_DISCO_INTERVALO_ACESSO_S", "60"))
+
+
+# -----------------------------------------------------------
+# II. CLASSE CacheLRU (Camada em memória)
+# -----------------------------------------------------------
+
+class CacheLRU:
+    """Cache em memória com política LRU, limite de itens e TTL opcional (thread-safe)."""
+    def __init__(self, max_itens: int = 1024, ttl: Optional[float] = None):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave: str):
+        with self._lock:
+            if chave not in self._dados:
+                return None
+            expira_em, valor = self._dados[chave]
+            if expira_em is not None and expira_em < time.time():
+                del self._dados[chave]
+                return None
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave: str, valor) -> None:
+        with self._lock:
+            expira_em = time.time() + self.ttl if self.ttl else None
+            self._dados[chave] = (expira_em, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_itens:
+                self._dados.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+
+# -----------------------------------------------------------
+# III. CLASSE CacheDisco (Camada persistente em SQLite)
+# -----------------------------------------------------------
+
+class CacheDisco:
+    """
+    Armazena valores binários em SQLite, com remoção dos itens menos
+    acessados quando o tamanho total ultrapassa max_bytes e TTL opcional.
+    O tamanho total fica numa tabela de uma linha, atualizada na mesma transação
+    das inclusões e remoções: vale para todos os processos que usam o arquivo
+    (UI, workers da fila, lote, ingestão) sem varrer a tabela a cada gravação.
+    """
+    def __init__(self, caminho: str, max_bytes: int, ttl: Optional[float] = None):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                chave TEXT PRIMARY KEY,
+                valor BLOB NOT NULL,
+                tamanho INTEGER NOT NULL,
+                acessado_em REAL NOT NULL,
+                expira_em REAL
+            )"""
+        )
+        colunas = [linha[1] for linha in self._conn.execute("PRAGMA table_info(cache)")]
+        if "expira_em" not in colunas:
+            # Arquivos criados antes do suporte a TTL
+            self._conn.execute("ALTER TABLE cache ADD COLUMN expira_em REAL")
+        # Remoção dos menos acessados e dos expirados sem varrer a tabela
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_acessado_em ON cache (acessado_em)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expira_em ON cache (expira_em)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 1), tamanho INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+        # Arquivos criados antes do total persistido: soma uma única vez
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("INSERT OR IGNORE INTO total (id, tamanho) SELECT 1, COALESCE(SUM(tamanho), 0) FROM cache")
+        self._conn.commit()
+
+    def get(self, chave: str) -> Optional[bytes]:
+        with self._lock:
+            agora = time.time()
+            linha = self._conn.execute(
+                "SELECT valor, acessado_em FROM cache WHERE chave = ? AND (expira_em IS NULL OR expira_em > ?)",
+                (chave, agora)
+            ).fetchone()
+            if linha is None:
+                return None
+            if agora - linha[1] >= CACHE_DISCO_INTERVALO_ACESSO_S:
+                self._conn.execute("UPDATE cache SET acessado_em = ? WHERE chave = ?", (agora, chave))
+                self._conn.commit()
+            return linha[0]
+
+    def set(self, chave: str, valor: bytes) -> None:
+        with self._lock:
+            agora = time.time()
+            # Transação de escrita desde a leitura do total: outros processos esperam a vez
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                anterior = self._conn.execute("SELECT tamanho FROM cache WHERE chave = ?", (chave,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (chave, valor, tamanho, acessado_em, expira_em) VALUES (?, ?, ?, ?, ?)",
+                    (chave, sqlite3.Binary(valor), len(valor), agora, agora + self.ttl if self.ttl else None)
+                )
+                total = self._conn.execute("SELECT tamanho FROM total WHERE id = 1").fetchone()[0]
+                total = self._remover_excedente(total + len(valor) - (anterior[0] if anterior else 0))
+                self._conn.execute("UPDATE total SET tamanho = ? WHERE id = 1", (total,))
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+
+    def _remover_excedente(self, total: int) -> int:
+        """
+        Remove os itens expirados e, depois, os menos acessados até o total caber em max_bytes.
+        Recebe e retorna o tamanho total armazenado (chamado dentro da transação de set).
+        """
+        agora = time.time()
+        expirados = self._conn.execute(
+            "SELECT COALESCE(SUM(tamanho), 0) FROM cache WHERE expira_em <= ?", (agora,)
+        ).fetchone()[0]
+        if expirados:
+            self._conn.execute("DELETE FROM cache WHERE expira_em <= ?", (agora,))
+            total -= expirados
+        if total <= self.max_bytes:
+            return total
+        excedente = total - self.max_bytes
+        removidos = []
+        for chave, tamanho in self._conn.execute(
+            "SELECT chave, tamanho FROM cache ORDER BY acessado_em ASC"
+        ):
+            removidos.append((chave,))
+            excedente -= tamanho
+            total -= tamanho
+            if excedente <= 0:
+                break
+        self._conn.executemany("DELETE FROM cache WHERE chave = ?", removidos)
+        return total
+
+
+# -----------------------------------------------------------
+# IV. CLASSE CacheEmbeddings (LRU + SQLite, endereçado por conteúdo)
+# -----------------------------------------------------------
+
+class CacheEmbeddings:
+    """
+    Cache de embeddings endereçado pelo hash de (modelo, texto).
+    Os vetores são guardados no disco como float32 para economizar espaço.
+    """
+    def __init__(self, caminho: Optional[str] = None,
+                 max_itens: int = CACHE_EMBEDDING_MAX_ITENS,
+                 max_mb: float = CACHE_EMBEDDING_MAX_MB):
+        caminho = caminho or os.path.join(CACHE_DIR, "embeddings.sqlite3")
+        self.memoria = CacheLRU(max_itens)
+        try:
+            self.disco = CacheDisco(caminho, int(max_mb * 1024 * 1024))
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ Cache de embeddings em disco indisponível, usando apenas memória: {e}")
+            self.disco = None
+
+    @staticmethod
+    def chave(modelo: str, texto: str) -> str:
+        return hashlib.sha256(f"{modelo}\x00{texto}".encode("utf-8")).hexdigest()
+
+    def get(self, modelo: str, texto: str) -> Optional[List[float]]:
+        chave = self.chave(modelo, texto)
+        embedding = self.memoria.get(chave)
+        if embedding is not None:
+            return embedding
+        if self.disco is None:
+            return None
+        try:
+            bruto = self.disco.get(chave)
+        except sqlite3.Error as e:
+            print(f"⚠️ Falha ao ler cache de embeddings: {e}")
+            return None
+        if bruto is None:
+            return None
+        embedding = array("f", bruto).tolist()
+        self.memoria.set(chave, embedding)
+        return embedding
+
+    def set(self, modelo: str, texto: str, embedding: List[float]) -> None:
+        chave = self.chave(modelo, texto)
+        self.memoria.set(chave, embedding)
+        if self.disco is None:
+            return
+        try:
+            self.disco.set(chave, array("f", embedding).tobytes())
+        except sqlite3.Error as e:
+            print(f"⚠️ Falha ao gravar cache de embeddings: {e}")
+
+
+# -----------------------------------------------------------
+# V. CLASSE CacheRespostas (Respostas completas do pipeline)
+# -----------------------------------------------------------
+
+class CacheRespostas:
+    """
+    Cache em duas camadas (LRU em memória + SQLite com TTL) para as respostas
+    de reescrever_revisor e ajuste_incremental.
+    """
+    def __init__(self, caminho: Optional[str] = None,
+                 max_itens: int = CACHE_RESPOSTAS_MAX_ITENS,
+                 max_mb: float = CACHE_RESPOSTAS_MAX_MB,
+                 ttl: float = CACHE_RESPOSTAS_TTL_S):
+        caminho = caminho or os.path.join(CACHE_DIR, "respostas.sqlite3")
+        self.memoria = CacheLRU(max_itens, ttl=ttl)
+        try:
+            self.disco = CacheDisco(caminho, int(max_mb * 1024 * 1024), ttl=ttl)
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ Cache de respostas em disco indisponível, usando apenas memória: {e}")
+            self.disco = None
+
+    @staticmethod
+    def chave(*partes) -> str:
+        return hashlib.sha256(json.dumps(partes, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, chave: str) -> Tuple[Optional[str], Optional[str]]:
+        """Retorna (resposta, origem), com origem "memoria", "disco" ou None (miss)."""
+        resposta = self.memoria.get(chave)
+        if resposta is not None:
+            return resposta, "memoria"
+        if self.disco is None:
+            return None, None
+        try:
+            bruto = self.disco.get(chave)
+        except sqlite3.Error as e:
+            print(f"⚠️ Falha ao ler cache de respostas: {e}")
+            return None, None
+        if bruto is None:
+            return None, None
+        resposta = bruto.decode("utf-8")
+        self.memoria.set(chave, resposta)
+        return resposta, "disco"
+
+    def set(self, chave: str, resposta: str) -> None:
+        self.memoria.set(chave, resposta)
+        if self.disco is None:
+            return
+        try:
+            self.disco.set(chave, resposta.encode("utf-8"))
+        except sqlite3.Error as e:
+            print(f"⚠️ Falha ao gravar cache de respostas: {e}")
+
+
+# -----------------------------------------------------------
+# VI. CLASSE CacheSemantico (Textos quase idênticos, por similaridade)
+# -----------------------------------------------------------
+
+class CacheSemantico:
+    """
+    Guarda, para cada texto já revisado, o embedding normalizado, a coleção usada
+    e os documentos recuperados. Uma consulta com similaridade de cosseno acima
+    do limiar reaproveita esse resultado (a geração do LLM continua sendo feita).
+    Os vetores ficam numa matriz de tamanho fixo em memória; com a matriz cheia,
+    a entrada acessada há mais tempo é substituída.
+    """
+    def __init__(self, max_itens: int = CACHE_SEMANTICO_MAX_ITENS,
+                 limiar: float = CACHE_SEMANTICO_LIMIAR,
+                 ttl: Optional[float] = CACHE_SEMANTICO_TTL_S):
+        self.max_itens = max_itens
+        self.limiar = limiar
+        self.ttl = ttl
+        self._vetores: Optional[np.ndarray] = None  # alocada no primeiro set (dimensão do modelo)
+        self._entradas: List[Optional[Dict]] = [None] * max_itens
+        self._colecoes = np.array([""] * max_itens, dtype=object)
+        self._acessado_em = np.zeros(max_itens)  # 0 = posição livre
+        self._criado_em = np.zeros(max_itens)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalizar(vetor) -> Optional[np.ndarray]:
+        v = np.asarray(vetor, dtype=np.float32)
+        norma = float(np.linalg.norm(v))
+        return v / norma if norma else None
+
+    def buscar(self, vetor, colecao: Optional[str] = None) -> Tuple[Optional[Dict], float]:
+        """
+        Retorna (entrada, similaridade) do texto mais parecido acima do limiar,
+        ou (None, melhor_similaridade). Com colecao, só considera entradas dessa coleção.
+        """
+        v = self._normalizar(vetor)
+        with self._lock:
+            if v is None or self._vetores is None or self._vetores.shape[1] != v.shape[0]:
+                return None, 0.0
+            agora = time.time()
+            validos = self._acessado_em > 0
+            if self.ttl:
+                expirados = validos & (self._criado_em + self.ttl <= agora)
+                self._acessado_em[expirados] = 0
+                validos &= ~expirados
+            if colecao:
+                validos &= self._colecoes == colecao
+            if not validos.any():
+                return None, 0.0
+            similaridades = np.where(validos, self._vetores @ v, -np.inf)
+            indice = int(np.argmax(similaridades))
+            melhor = float(similaridades[indice])
+            if melhor < self.limiar:
+                return None, melhor
+            self._acessado_em[indice] = agora
+            return self._entradas[indice], melhor
+
+    def set(self, vetor, colecao: str, documentos: List[Dict]) -> None:
+        v = self._normalizar(vetor)
+        if v is None:
+            return
+        with self._lock:
+            if self._vetores is None or self._vetores.shape[1] != v.shape[0]:
+                self._vetores = np.zeros((self.max_itens, v.shape[0]), dtype=np.float32)
+                self._acessado_em[:] = 0
+            # Posição livre ou, se não houver, a menos recentemente acessada
+            indice = int(np.argmin(self._acessado_em))
+            agora = time.time()
+            self._vetores[indice] = v
+            self._entradas[indice] = {"colecao": colecao, "documentos": documentos}
+            self._colecoes[indice] = colecao
+            self._acessado_em[indice] = agora
+            self._criado_em[indice] = agora
+
+    def __len__(self) -> int:
+        return int((self._acessado_em > 0).sum())
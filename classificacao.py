@@ -1,44 +1,206 @@
-import google.generativeai as genai
 import os
-import textwrap
-from typing import Optional
+import re
+import json
+import inspect
+import hashlib
+import unicodedata
+from functools import lru_cache
+from typing import Optional, Dict, Tuple
 
+from cache import CacheLRU, CacheDisco, CACHE_DIR
+import limites
+from metricas import span
+from provedores import Provedor
 
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
+
+# -----------------------------------------------------------
+# I. MODELO GEMINI (Criado sob demanda)
+# -----------------------------------------------------------
+
+GEMINI_MODELO = "gemini-2.0-flash"
+
+
+def _criar_modelo():
+    """Configura a API do Gemini e cria o modelo no primeiro uso."""
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key:
+        print("❌ ERRO: Variável GEMINI_API_KEY não encontrada no ambiente.")
+        return None
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
+        import google.generativeai as genai
+        genai.configure(api_key=gemini_api_key)
         # Definindo o modelo como no seu notebook
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        modelo = genai.GenerativeModel(GEMINI_MODELO)
         print("✅ Gemini configurado com sucesso.")
+        return modelo
     except Exception as e:
-        print(f"❌ ERRO: Falha ao configurar a API do Gemini. Erro: {e}")
-        model = None
-else:
-    print("❌ ERRO: Variável GEMINI_API_KEY não encontrada no ambiente.")
-    model = None
+        print(f"❌ ERRO: Falha ao configurar a API do Gemini. Verifique sua API_KEY. Erro: {e}")
+        return None
+
 
+provedor_modelo = Provedor(_criar_modelo, "Gemini")
 
 
-try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    # Definindo o modelo como no seu notebook
-    model = genai.GenerativeModel('gemini-2.0-flash')
-except Exception as e:
-    print(f"❌ ERRO: Falha ao configurar a API do Gemini. Verifique sua API_KEY. Erro: {e}")
-    model = None
+def get_model():
+    """Modelo Gemini compartilhado (None se indisponível)."""
+    return provedor_modelo.get()
 
 
 # -----------------------------------------------------------
-# II. FUNÇÃO DE CLASSIFICAÇÃO (Adaptada do seu código anexo)
+# II. PRÉ-CLASSIFICADOR LOCAL (Regras por palavras-chave)
+# -----------------------------------------------------------
+
+# Confiança mínima (fração do peso total) para dispensar a chamada ao Gemini
+CONFIANCA_MINIMA_LOCAL = float(os.getenv("CONFIANCA_MINIMA_LOCAL", "0.75"))
+# Peso mínimo absoluto da categoria vencedora
+PESO_MINIMO_LOCAL = int(os.getenv("PESO_MINIMO_LOCAL", "3"))
+
+# (padrão, peso) por categoria. Os textos são comparados sem acentos e em minúsculas.
+REGRAS_LOCAIS: Dict[str, list] = {
+    "PRODUTO": [
+        (r"\b(orondis|polytrin|miravis|yieldon|seeker|curyom)\b", 3),
+        (r"®", 2),
+        (r"\bargumentario\b", 2),
+        (r"\bficha tecnica\b|\bfolheto\b|\bapresentacao tecnica\b", 1),
+        (r"\bfungicida\b|\binseticida\b|\bherbicida\b|\bnematicida\b", 1),
+    ],
+    "CULTURA": [
+        (r"\b(soja|milho|arroz|trigo|cafe|algodao|cana|feijao)\b", 2),
+        (r"\b(manejo|cultivo|plantio|lavoura|safra)\b", 1),
+    ],
+    "OUTROS": [
+        (r"\b(manual|livro|artigo|guia|norma|regulamento|edital)\b", 2),
+        (r"\b(publicacao|pesquisa|fisiologia|boas praticas)\b", 1),
+    ],
+}
+_REGRAS_COMPILADAS = {
+    categoria: [(re.compile(padrao), peso) for padrao, peso in regras]
+    for categoria, regras in REGRAS_LOCAIS.items()
+}
+
+
+def _sem_acentos(texto: str) -> str:
+    normalizado = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in normalizado if not unicodedata.combining(c))
+
+
+def pre_classificar(texto: str) -> Tuple[Optional[str], float]:
+    """
+    Classificação local barata por palavras-chave.
+    Retorna (categoria, confiança); categoria é None se nenhuma regra casar.
+    """
+    alvo = _sem_acentos(texto)
+    pesos = {
+        categoria: sum(peso * len(regra.findall(alvo)) for regra, peso in regras)
+        for categoria, regras in _REGRAS_COMPILADAS.items()
+    }
+    total = sum(pesos.values())
+    if total == 0:
+        return None, 0.0
+    categoria = max(pesos, key=pesos.get)
+    if pesos[categoria] < PESO_MINIMO_LOCAL:
+        return categoria, 0.0
+    return categoria, pesos[categoria] / total
+
+
+# -----------------------------------------------------------
+# III. CACHE DE CLASSIFICAÇÃO (Memória + SQLite)
+# -----------------------------------------------------------
+
+_cache_memoria = CacheLRU(max_itens=4096)
+
+
+def _criar_cache_disco() -> Optional[CacheDisco]:
+    try:
+        return CacheDisco(os.path.join(CACHE_DIR, "classificacao.sqlite3"), max_bytes=16 * 1024 * 1024)
+    except Exception as e:
+        print(f"⚠️ Cache de classificação em disco indisponível, usando apenas memória: {e}")
+        return None
+
+
+_provedor_cache_disco = Provedor(_criar_cache_disco, "cache de classificação")
+
+
+@lru_cache(maxsize=None)
+def _impressao_classificacao() -> str:
+    """Hash das regras locais, dos limiares, do modelo e do prompt do Gemini: mudar qualquer um invalida o cache."""
+    configuracao = json.dumps([REGRAS_LOCAIS, CONFIANCA_MINIMA_LOCAL, PESO_MINIMO_LOCAL, GEMINI_MODELO], ensure_ascii=False)
+    return hashlib.sha256((configuracao + inspect.getsource(_classificar_gemini)).encode("utf-8")).hexdigest()[:16]
+
+
+def _chave_texto(texto: str) -> str:
+    return hashlib.sha256(f"{_impressao_classificacao()}\x00{texto}".encode("utf-8")).hexdigest()
+
+
+def _cache_get(chave: str) -> Optional[str]:
+    categoria = _cache_memoria.get(chave)
+    cache_disco = _provedor_cache_disco.get()
+    if categoria is None and cache_disco is not None:
+        try:
+            bruto = cache_disco.get(chave)
+        except Exception:
+            bruto = None
+        if bruto is not None:
+            categoria = bruto.decode("utf-8")
+            _cache_memoria.set(chave, categoria)
+    return categoria
+
+
+def _cache_set(chave: str, categoria: str) -> None:
+    _cache_memoria.set(chave, categoria)
+    cache_disco = _provedor_cache_disco.get()
+    if cache_disco is not None:
+        try:
+            cache_disco.set(chave, categoria.encode("utf-8"))
+        except Exception as e:
+            print(f"⚠️ Falha ao gravar cache de classificação: {e}")
+
+
+# -----------------------------------------------------------
+# IV. FUNÇÃO DE CLASSIFICAÇÃO (Adaptada do seu código anexo)
 # -----------------------------------------------------------
 
 def classificar_texto(texto: str) -> Optional[str]:
     """
-    Classifica textos relacionados ao agronegócio em PRODUTO, CULTURA ou OUTROS,
-    usando a lógica e prompt fornecidos.
+    Classifica textos relacionados ao agronegócio em PRODUTO, CULTURA ou OUTROS.
+    Consulta primeiro o cache e o pré-classificador local; o Gemini só é
+    chamado quando a confiança local é baixa.
+    """
+    with span("classificar", caracteres=len(texto)) as attrs:
+        categoria = _classificar(texto, attrs)
+        attrs["categoria"] = categoria
+        return categoria
+
+
+def _classificar(texto: str, attrs: dict) -> Optional[str]:
+    chave = _chave_texto(texto)
+    categoria = _cache_get(chave)
+    attrs["cache_hit"] = bool(categoria)
+    if categoria:
+        attrs["origem"] = "cache"
+        print(f"✅ Classificação recuperada do cache: {categoria}")
+        return categoria
+
+    categoria, confianca = pre_classificar(texto)
+    if categoria and confianca >= CONFIANCA_MINIMA_LOCAL:
+        attrs["origem"] = "local"
+        print(f"✅ Classificação local: {categoria} (confiança {confianca:.2f})")
+        _cache_set(chave, categoria)
+        return categoria
+
+    attrs["origem"] = "gemini"
+    categoria = _classificar_gemini(texto)
+    if categoria in ("PRODUTO", "CULTURA", "OUTROS"):
+        _cache_set(chave, categoria)
+    return categoria
+
+
+def _classificar_gemini(texto: str) -> Optional[str]:
+    """
+    Classifica o texto com o Gemini, usando a lógica e prompt fornecidos.
     """
+    model = get_model()
     if not model:
         print("❌ MODELO INDISPONÍVEL. Não é possível classificar.")
         return None
@@ -73,8 +235,8 @@ REGRA IMPORTANTE:
 2. Responda com apenas uma palavra e em capslook: PRODUTO, CULTURA OU OUTROS."""
 
     try:
-        # Gerar resposta do Gemini
-        response = model.generate_content(prompt)
+        # Gerar resposta do Gemini (na vez da cota; em 429 a chamada volta para a fila)
+        response = limites.executar("gemini", model.generate_content, prompt, tokens=len(prompt) // 3 + 10)
 
         # Extrair e limpar a resposta
         resposta = response.text.strip().upper()
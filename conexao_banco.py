@@ -1,42 +1,250 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from typing import List, Dict
+import time
+import random
+import threading
+from collections import deque
+from typing import List, Dict, Iterator, Optional
 import os
 
-
-# 🚨 IMPORTANTE: Importa a função do arquivo classificacao.py
-try:
-    from classificacao import classificar_texto
-    print("✅ Módulo 'classificacao.py' importado com sucesso.")
-except ImportError:
-    print("❌ ERRO: O arquivo 'classificacao.py' deve estar no mesmo diretório para ser importado.")
-    exit()
+import limites
+from metricas import span, registro as registro_metricas
+from provedores import Provedor
 
 # -----------------------------------------------------------
 # I. CHAVES E CONFIGURAÇÕES DO ASTRA DB
 # -----------------------------------------------------------
 
+# As credenciais (ASTRA_DB_APPLICATION_TOKEN, ASTRA_DB_API_ENDPOINT, ASTRA_DB_NAMESPACE)
+# são lidas do ambiente quando o cliente é criado, não na importação do módulo.
+
+# Transporte HTTP (pool de conexões, retentativas e disjuntor)
+ASTRA_POOL_SIZE = int(os.getenv("ASTRA_POOL_SIZE", "16"))
+ASTRA_MAX_TENTATIVAS = int(os.getenv("ASTRA_MAX_TENTATIVAS", "4"))
+ASTRA_BACKOFF_BASE = float(os.getenv("ASTRA_BACKOFF_BASE", "0.5"))
+ASTRA_BACKOFF_MAX = float(os.getenv("ASTRA_BACKOFF_MAX", "8"))
+ASTRA_DISJUNTOR_FALHAS = int(os.getenv("ASTRA_DISJUNTOR_FALHAS", "5"))
+ASTRA_DISJUNTOR_ESPERA = float(os.getenv("ASTRA_DISJUNTOR_ESPERA", "30"))
+
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+# Campo de data de atualização dos documentos (o mesmo da ingestão e do índice local)
+ASTRA_CAMPO_ATUALIZACAO = os.getenv("ASTRA_CAMPO_ATUALIZACAO", "updated_at")
+# Documentos por chamada insertMany (limite do Data API)
+ASTRA_INSERT_LOTE = int(os.getenv("ASTRA_INSERT_LOTE", "20"))
+
+# Campos projetados na busca vetorial (o restante do documento, incluindo $vector, não é baixado)
+ASTRA_CAMPOS_CONTEUDO = [c.strip() for c in os.getenv(
+    "ASTRA_CAMPOS_CONTEUDO", "content,text,page_content,conteudo,texto").split(",") if c.strip()]
+ASTRA_CAMPOS_METADADOS = [c.strip() for c in os.getenv(
+    "ASTRA_CAMPOS_METADADOS", "metadata,title,titulo,source,fonte").split(",") if c.strip()]
+
+
+def projecao_padrao() -> Dict:
+    """Projeção do Data API com apenas os campos de conteúdo e metadados usados no prompt."""
+    return {campo: 1 for campo in ASTRA_CAMPOS_CONTEUDO + ASTRA_CAMPOS_METADADOS}
+
+
+def documento_para_registro(doc: Dict) -> Dict:
+    """
+    Converte um documento do Astra em um registro estruturado:
+    {"_id", "conteudo", "metadados", "similaridade"}.
+    """
+    conteudo = next((doc[c] for c in ASTRA_CAMPOS_CONTEUDO if isinstance(doc.get(c), str)), None)
+    metadados = {}
+    for campo in ASTRA_CAMPOS_METADADOS:
+        valor = doc.get(campo)
+        if isinstance(valor, dict):
+            metadados.update(valor)
+        elif valor is not None:
+            metadados[campo] = valor
+    if conteudo is None:
+        # Esquema desconhecido: junta os valores textuais restantes
+        conteudo = " ".join(
+            str(v) for k, v in doc.items()
+            if not k.startswith("$") and k != "_id" and k not in ASTRA_CAMPOS_METADADOS
+        )
+    return {
+        "_id": doc.get("_id"),
+        "conteudo": conteudo,
+        "metadados": metadados,
+        "similaridade": doc.get("$similarity"),
+    }
+
 
-ASTRA_DB_APPLICATION_TOKEN = os.getenv("ASTRA_DB_APPLICATION_TOKEN")
-ASTRA_DB_API_ENDPOINT = os.getenv("ASTRA_DB_API_ENDPOINT")
-ASTRA_DB_NAMESPACE = os.getenv("ASTRA_DB_NAMESPACE")
 # -----------------------------------------------------------
-# II. CLASSE AstraDBClient (Do seu código anexo)
+# II. TRANSPORTE HTTP (Sessão reutilizável, backoff e disjuntor)
+# -----------------------------------------------------------
+
+class CircuitoAbertoError(Exception):
+    """Disparada quando o disjuntor está aberto e a requisição nem é enviada."""
+
+
+class Disjuntor:
+    """
+    Disjuntor simples: abre após `limite_falhas` falhas consecutivas e rejeita
+    chamadas por `espera` segundos; depois libera uma chamada de teste (meio-aberto).
+    """
+    def __init__(self, limite_falhas: int, espera: float):
+        self.limite_falhas = limite_falhas
+        self.espera = espera
+        self.falhas = 0
+        self.aberto_em: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self) -> str:
+        if self.aberto_em is None:
+            return "fechado"
+        if time.monotonic() - self.aberto_em >= self.espera:
+            return "meio-aberto"
+        return "aberto"
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == "aberto":
+                return False
+            if self.estado == "meio-aberto":
+                # Apenas uma chamada de teste por janela de espera
+                self.aberto_em = time.monotonic()
+            return True
+
+    def registrar_sucesso(self) -> None:
+        with self._lock:
+            self.falhas = 0
+            self.aberto_em = None
+
+    def registrar_falha(self) -> None:
+        with self._lock:
+            self.falhas += 1
+            if self.falhas >= self.limite_falhas:
+                self.aberto_em = time.monotonic()
+
+
+class TransporteHTTP:
+    """
+    Sessão HTTP reutilizável (keep-alive) com pool de conexões, retentativas com
+    backoff exponencial e jitter em 5xx, disjuntor e métricas de latência. Em 429 a
+    requisição volta para a fila do provedor (limites), que fica pausada.
+    """
+    def __init__(self, headers: Dict, provedor: str = "astra", pool_size: int = ASTRA_POOL_SIZE,
+                 max_tentativas: int = ASTRA_MAX_TENTATIVAS):
+        self.provedor = provedor
+        self.max_tentativas = max_tentativas
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.disjuntor = Disjuntor(ASTRA_DISJUNTOR_FALHAS, ASTRA_DISJUNTOR_ESPERA)
+        self._latencias = deque(maxlen=1000)
+        self._contadores = {"requisicoes": 0, "retentativas": 0, "limitadas": 0, "erros": 0, "rejeitadas_disjuntor": 0}
+        self._lock = threading.Lock()
+
+    def _backoff(self, tentativa: int, response: Optional[requests.Response] = None) -> float:
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return min(ASTRA_BACKOFF_MAX, float(response.headers["Retry-After"]))
+        # Full jitter: espera aleatória entre 0 e base * 2^tentativa
+        return random.uniform(0, min(ASTRA_BACKOFF_MAX, ASTRA_BACKOFF_BASE * (2 ** tentativa)))
+
+    def post(self, url: str, payload: Dict, timeout: float = 30) -> requests.Response:
+        """POST com retentativas. Lança CircuitoAbertoError ou a última exceção do requests."""
+        if not self.disjuntor.permitir():
+            with self._lock:
+                self._contadores["rejeitadas_disjuntor"] += 1
+            raise CircuitoAbertoError(f"Disjuntor aberto para {self.provedor}; requisição não enviada.")
+
+        tentativa = limitadas = 0
+        while True:
+            limites.aguardar(self.provedor)
+            inicio = time.perf_counter()
+            response = None
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout)
+                retentavel = response.status_code in STATUS_RETENTAVEIS
+                if not retentavel:
+                    response.raise_for_status()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                retentavel = True
+                if tentativa == self.max_tentativas - 1:
+                    self._registrar(inicio, erro=True)
+                    self.disjuntor.registrar_falha()
+                    raise
+            except requests.exceptions.HTTPError:
+                # Erros 4xx (exceto 429) não adiantam ser repetidos
+                self._registrar(inicio, erro=True)
+                self.disjuntor.registrar_sucesso()
+                raise
+
+            if not retentavel:
+                self._registrar(inicio)
+                self.disjuntor.registrar_sucesso()
+                return response
+
+            self._registrar(inicio, erro=True)
+            if response is not None and response.status_code == 429 and limitadas < limites.TENTATIVAS_LIMITE:
+                # Cota excedida: pausa a fila do provedor e volta para ela, sem gastar
+                # tentativa nem contar como falha no disjuntor
+                retry_after = response.headers.get("Retry-After", "")
+                espera = limites.penalizar(self.provedor, limitadas, float(retry_after) if retry_after.isdigit() else None)
+                limitadas += 1
+                print(f"⚠️ {self.provedor}: limite de taxa excedido (429). Requisição volta para a fila em {espera:.2f}s.")
+                with self._lock:
+                    self._contadores["limitadas"] += 1
+                continue
+            if tentativa == self.max_tentativas - 1:
+                self.disjuntor.registrar_falha()
+                response.raise_for_status()
+            espera = self._backoff(tentativa, response)
+            status = response.status_code if response is not None else "conexão"
+            print(f"⚠️ {self.provedor}: falha ({status}) na tentativa {tentativa + 1}. Nova tentativa em {espera:.2f}s.")
+            with self._lock:
+                self._contadores["retentativas"] += 1
+            time.sleep(espera)
+            tentativa += 1
+
+    def _registrar(self, inicio: float, erro: bool = False) -> None:
+        with self._lock:
+            self._latencias.append(time.perf_counter() - inicio)
+            self._contadores["requisicoes"] += 1
+            if erro:
+                self._contadores["erros"] += 1
+
+    def metricas(self) -> Dict:
+        """Contadores e percentis de latência (em ms) das últimas requisições."""
+        with self._lock:
+            latencias = sorted(self._latencias)
+            metricas = dict(self._contadores)
+        def percentil(p):
+            return round(latencias[min(len(latencias) - 1, int(p * len(latencias)))] * 1000, 1) if latencias else None
+        metricas.update({"p50_ms": percentil(0.50), "p95_ms": percentil(0.95), "p99_ms": percentil(0.99),
+                         "disjuntor": self.disjuntor.estado})
+        return metricas
+
+
+# -----------------------------------------------------------
+# III. CLASSE AstraDBClient (Do seu código anexo)
 # -----------------------------------------------------------
 
 class AstraDBClient:
     """Classe wrapper para a conexão e busca no Astra DB."""
     def __init__(self):
-        self.base_url = f"{ASTRA_DB_API_ENDPOINT}/api/json/v1/{ASTRA_DB_NAMESPACE}"
+        self.base_url = f"{os.getenv('ASTRA_DB_API_ENDPOINT')}/api/json/v1/{os.getenv('ASTRA_DB_NAMESPACE')}"
         self.headers = {
             "Content-Type": "application/json",
-            "x-cassandra-token": ASTRA_DB_APPLICATION_TOKEN,
+            "x-cassandra-token": os.getenv("ASTRA_DB_APPLICATION_TOKEN") or "",
             "Accept": "application/json"
         }
+        self.transporte = TransporteHTTP(self.headers, provedor="astra")
         print("✅ AstraDBClient inicializado.")
         
-    def vector_search(self, collection: str, vector: List[float], limit: int = 6) -> List[Dict]:
-        """Realiza busca por similaridade vetorial na coleção especificada."""
+    def vector_search(self, collection: str, vector: List[float], limit: int = 6,
+                      projection: Optional[Dict] = None) -> List[Dict]:
+        """
+        Realiza busca por similaridade vetorial na coleção especificada.
+        Baixa apenas os campos da projeção (padrão: projecao_padrao()) e retorna
+        registros estruturados com a similaridade (ver documento_para_registro).
+        """
         if not collection or collection == "ERRO":
             print("❌ Busca vetorial abortada: Coleção inválida ou erro na classificação.")
             return []
@@ -45,26 +253,118 @@ class AstraDBClient:
         payload = {
             "find": {
                 "sort": {"$vector": vector},
-                "options": {"limit": limit}
+                "projection": projection or projecao_padrao(),
+                "options": {"limit": limit, "includeSimilarity": True}
             }
         }
         
         print(f"\n--- Chamando Astra DB na Coleção: {collection} ---")
         try:
-            response = requests.post(url, json=payload, headers=self.headers, timeout=30)
-            response.raise_for_status() 
-            data = response.json()
+            with span("busca_vetorial", colecao=collection, backend="astra", limite=limit) as attrs:
+                response = self.transporte.post(url, payload, timeout=30)
+                data = response.json()
+                attrs["bytes_resposta"] = len(response.content)
             
-            documents = data.get("data", {}).get("documents", [])
+                documents = [documento_para_registro(doc) for doc in data.get("data", {}).get("documents", [])]
+                attrs["documentos"] = len(documents)
             print(f"✅ Busca realizada. Documentos retornados: {len(documents)}")
             return documents
 
+        except CircuitoAbertoError as e:
+            print(f"❌ Busca Astra DB não enviada: {e}")
+            return []
         except requests.exceptions.HTTPError as e:
-            print(f"❌ ERRO HTTP na busca Astra DB (Status: {response.status_code}): {e}")
+            print(f"❌ ERRO HTTP na busca Astra DB (Status: {e.response.status_code}): {e}")
             return []
         except Exception as e:
             print(f"❌ ERRO Geral na busca Astra DB: {str(e)}")
             return []
 
-astra_client = AstraDBClient()
+    def find_documents(self, collection: str, filtro: Optional[Dict] = None,
+                       projection: Optional[Dict] = None) -> Iterator[Dict]:
+        """Percorre todos os documentos da coleção (paginando via nextPageState)."""
+        url = f"{self.base_url}/{collection}"
+        page_state = None
+        while True:
+            options = {"pageState": page_state} if page_state else {}
+            payload = {"find": {"filter": filtro or {}, "options": options}}
+            if projection:
+                payload["find"]["projection"] = projection
+            response = self.transporte.post(url, payload, timeout=30)
+            data = response.json().get("data", {})
+            for doc in data.get("documents", []):
+                yield doc
+            page_state = data.get("nextPageState")
+            if not page_state:
+                break
+
+    def marca_atualizacao(self, collection: str) -> Optional[str]:
+        """
+        Marca que muda quando a coleção é alterada: quantidade de documentos e a data
+        de atualização mais recente (ASTRA_CAMPO_ATUALIZACAO). Duas requisições leves.
+        """
+        url = f"{self.base_url}/{collection}"
+        contagem = self.transporte.post(url, {"countDocuments": {"filter": {}}}, timeout=30).json().get("status", {})
+        payload = {"findOne": {"filter": {}, "sort": {ASTRA_CAMPO_ATUALIZACAO: -1},
+                               "projection": {ASTRA_CAMPO_ATUALIZACAO: 1}}}
+        documento = (self.transporte.post(url, payload, timeout=30).json().get("data") or {}).get("document") or {}
+        if "count" not in contagem and not documento:
+            return None
+        return json.dumps([contagem.get("count"), documento.get(ASTRA_CAMPO_ATUALIZACAO)], default=str)
+
+    def insert_many(self, collection: str, documentos: List[Dict]) -> Dict:
+        """
+        Insere documentos em lotes de ASTRA_INSERT_LOTE (insertMany não ordenado).
+        Documentos com _id já existente são contados como "existentes", não como erro.
+        Retorna {"inseridos", "existentes", "erros"}.
+        """
+        url = f"{self.base_url}/{collection}"
+        resultado = {"inseridos": 0, "existentes": 0, "erros": []}
+        for inicio in range(0, len(documentos), ASTRA_INSERT_LOTE):
+            lote = documentos[inicio:inicio + ASTRA_INSERT_LOTE]
+            payload = {"insertMany": {"documents": lote, "options": {"ordered": False}}}
+            with span("astra_insert", colecao=collection, documentos=len(lote)) as attrs:
+                response = self.transporte.post(url, payload, timeout=60)
+                data = response.json()
+                inseridos = len(data.get("status", {}).get("insertedIds", []))
+                resultado["inseridos"] += inseridos
+                for erro in data.get("errors", []):
+                    if erro.get("errorCode") == "DOCUMENT_ALREADY_EXISTS":
+                        resultado["existentes"] += 1
+                    else:
+                        resultado["erros"].append(erro.get("message") or str(erro))
+                attrs["inseridos"] = inseridos
+        return resultado
+
+    def delete_many(self, collection: str, filtro: Dict) -> int:
+        """Remove os documentos que atendem ao filtro (repetindo enquanto o Data API indicar moreData)."""
+        url = f"{self.base_url}/{collection}"
+        removidos = 0
+        while True:
+            response = self.transporte.post(url, {"deleteMany": {"filter": filtro}}, timeout=60)
+            status = response.json().get("status", {})
+            removidos += max(0, status.get("deletedCount", 0))
+            if not status.get("moreData"):
+                return removidos
+
+
+def _criar_astra_client() -> AstraDBClient:
+    cliente = AstraDBClient()
+    registro_metricas.registrar_fonte("astra_transporte", cliente.transporte.metricas)
+    return cliente
+
+
+provedor_astra = Provedor(_criar_astra_client, "AstraDBClient")
+
+
+def get_astra_client() -> AstraDBClient:
+    """Cliente Astra compartilhado, criado no primeiro uso."""
+    return provedor_astra.get()
+
+
+def __getattr__(nome: str):
+    # Compatibilidade: `from conexao_banco import astra_client` cria o cliente sob demanda
+    if nome == "astra_client":
+        return get_astra_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
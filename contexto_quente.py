@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+import limites
+from cache import CACHE_DIR
+from metricas import span, registro as registro_metricas
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO CONTEXTO QUENTE
+# -----------------------------------------------------------
+
+# Similaridade (cosseno) mínima entre o texto e o centroide de um tópico para contar a consulta nele
+CONTEXTO_QUENTE_LIMIAR_AGRUPAMENTO = float(os.getenv("REVISOR_CONTEXTO_QUENTE_LIMIAR_AGRUPAMENTO", "0.8"))
+# Similaridade mínima para atender o texto com os documentos pré-buscados: um pouco dentro do raio
+# do tópico. Quase duplicatas (>= 0.97) já são atendidas antes pelo cache semântico; aqui entram
+# textos do mesmo assunto, e a busca lexical do próprio texto continua sendo fundida aos documentos
+CONTEXTO_QUENTE_MARGEM = float(os.getenv("REVISOR_CONTEXTO_QUENTE_MARGEM", "0.05"))
+CONTEXTO_QUENTE_LIMIAR = min(1.0, CONTEXTO_QUENTE_LIMIAR_AGRUPAMENTO + CONTEXTO_QUENTE_MARGEM)
+# Consultas recentes (com decaimento) para um tópico ser considerado quente
+CONTEXTO_QUENTE_MIN_CONSULTAS = float(os.getenv("REVISOR_CONTEXTO_QUENTE_MIN_CONSULTAS", "3"))
+# Meia-vida da frequência: consultas antigas pesam cada vez menos
+CONTEXTO_QUENTE_MEIA_VIDA_S = float(os.getenv("REVISOR_CONTEXTO_QUENTE_MEIA_VIDA_H", "24")) * 3600
+# Tópicos acompanhados por coleção e, deles, quantos mantêm documentos em memória
+CONTEXTO_QUENTE_MAX_TOPICOS = int(os.getenv("REVISOR_CONTEXTO_QUENTE_MAX_TOPICOS", "200"))
+CONTEXTO_QUENTE_MAX_AQUECIDOS = int(os.getenv("REVISOR_CONTEXTO_QUENTE_MAX_AQUECIDOS", "20"))
+# Documentos pré-buscados por tópico
+CONTEXTO_QUENTE_LIMITE = int(os.getenv("REVISOR_CONTEXTO_QUENTE_LIMITE", "10"))
+# Rebusca periódica dos tópicos quentes e intervalo da verificação de mudanças nas coleções
+CONTEXTO_QUENTE_INTERVALO_S = float(os.getenv("REVISOR_CONTEXTO_QUENTE_INTERVALO_S", "900"))
+CONTEXTO_QUENTE_VERIFICACAO_S = float(os.getenv("REVISOR_CONTEXTO_QUENTE_VERIFICACAO_S", "60"))
+# Tópicos (centroides e frequências, sem documentos) persistidos entre reinícios
+CONTEXTO_QUENTE_ARQUIVO = os.getenv("REVISOR_CONTEXTO_QUENTE_ARQUIVO", os.path.join(CACHE_DIR, "topicos_quentes.json"))
+# Centroide que se deslocou além disso desde a última busca é rebuscado
+SIMILARIDADE_DERIVA = 0.98
+MAX_CARACTERES_TEXTO = 1000
+
+
+def _normalizar(vetor) -> Optional[np.ndarray]:
+    vetor = np.asarray(vetor, dtype=np.float32).ravel()
+    norma = float(np.linalg.norm(vetor))
+    return vetor / norma if norma > 0 else None
+
+
+# -----------------------------------------------------------
+# II. CLASSE AquecedorContexto (Tópicos frequentes por coleção)
+# -----------------------------------------------------------
+
+class _Topico:
+    """Grupo de consultas parecidas de uma coleção (centroide = média normalizada dos vetores)."""
+    def __init__(self, vetor: np.ndarray, texto: str, agora: float):
+        self.soma = vetor.astype(np.float64)
+        self.centroide = vetor
+        self.consultas = 0
+        self.frequencia = 0.0
+        self.visto_em = agora
+        self.texto = texto
+        self.documentos: Optional[List[Dict]] = None
+        self.centroide_busca: Optional[np.ndarray] = None
+        self.atualizado_em = 0.0
+
+    def frequencia_em(self, agora: float) -> float:
+        return self.frequencia * 0.5 ** (max(0.0, agora - self.visto_em) / CONTEXTO_QUENTE_MEIA_VIDA_S)
+
+    def quente(self, agora: float) -> bool:
+        # Arredonda para que N consultas seguidas contem como N apesar do decaimento
+        return round(self.frequencia_em(agora), 3) >= CONTEXTO_QUENTE_MIN_CONSULTAS
+
+    def registrar(self, vetor: np.ndarray, texto: str, agora: float) -> None:
+        self.frequencia = self.frequencia_em(agora) + 1
+        self.visto_em = agora
+        self.consultas += 1
+        self.soma += vetor
+        self.centroide = _normalizar(self.soma)
+        self.texto = texto
+
+
+class AquecedorContexto:
+    """
+    Acompanha a frequência das consultas de cada coleção, agrupadas em tópicos pela
+    proximidade do embedding, e mantém em memória os documentos mais relevantes dos
+    tópicos quentes (busca feita pelo centroide). Uma thread em segundo plano rebusca
+    esses documentos periodicamente e quando a coleção muda; textos próximos de um
+    tópico aquecido dispensam a busca.
+
+    `buscar(colecao, vetores, texto, limite)` faz a busca real; `marca(colecao)` retorna
+    um valor que muda quando a coleção é alterada (None = desconhecido).
+    """
+    def __init__(self, buscar: Callable[[str, List[List[float]], str, int], List[Dict]],
+                 marca: Optional[Callable[[str], Optional[str]]] = None, modelo: str = "",
+                 caminho: Optional[str] = CONTEXTO_QUENTE_ARQUIVO):
+        self.buscar = buscar
+        self.marca = marca
+        self.modelo = modelo
+        self.caminho = caminho
+        self._topicos: Dict[str, List[_Topico]] = {}
+        self._marcas: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._alterado = False
+        self._contadores = {"consultas": 0, "acertos": 0, "atualizacoes": 0, "invalidacoes": 0}
+        self._carregar()
+        registro_metricas.registrar_fonte("contexto_quente", self.estado)
+
+    # --- Frequência das consultas ---
+
+    def registrar(self, colecao: str, vetor, texto: str) -> None:
+        """Conta uma consulta à coleção no tópico mais próximo (ou cria um novo tópico)."""
+        vetor = _normalizar(vetor)
+        if vetor is None:
+            return
+        agora = time.time()
+        texto = texto[:MAX_CARACTERES_TEXTO]
+        with self._lock:
+            topicos = self._topicos.setdefault(colecao, [])
+            melhor, similaridade = self._mais_proximo(topicos, vetor, "centroide")
+            if melhor is None or similaridade < CONTEXTO_QUENTE_LIMIAR_AGRUPAMENTO:
+                if len(topicos) >= CONTEXTO_QUENTE_MAX_TOPICOS:
+                    topicos.remove(min(topicos, key=lambda t: t.frequencia_em(agora)))
+                melhor = _Topico(vetor, texto, agora)
+                topicos.append(melhor)
+            esfriado = not melhor.quente(agora)
+            melhor.registrar(vetor, texto, agora)
+            self._alterado = True
+            aqueceu = esfriado and melhor.quente(agora) and melhor.documentos is None
+        if aqueceu:
+            # Tópico acabou de ficar quente: pré-busca sem esperar o próximo ciclo
+            self._acordar.set()
+
+    @staticmethod
+    def _mais_proximo(topicos: List[_Topico], vetor: np.ndarray, campo: str):
+        candidatos = [t for t in topicos if getattr(t, campo) is not None]
+        if not candidatos:
+            return None, 0.0
+        similaridades = np.stack([getattr(t, campo) for t in candidatos]) @ vetor
+        i = int(np.argmax(similaridades))
+        return candidatos[i], float(similaridades[i])
+
+    # --- Consulta ---
+
+    def consultar(self, colecao: str, vetor, limite: int = CONTEXTO_QUENTE_LIMITE) -> Optional[List[Dict]]:
+        """
+        Documentos pré-buscados do tópico aquecido mais próximo do texto, ou None.
+        São só contexto de busca (marcados com `contexto_quente`): a resposta é sempre gerada.
+        """
+        vetor = _normalizar(vetor)
+        if vetor is None or limite > CONTEXTO_QUENTE_LIMITE:
+            return None
+        with span("contexto_quente", colecao=colecao) as attrs, self._lock:
+            self._contadores["consultas"] += 1
+            validade = time.time() - 2 * CONTEXTO_QUENTE_INTERVALO_S
+            aquecidos = [t for t in self._topicos.get(colecao, []) if t.documentos and t.atualizado_em >= validade]
+            topico, similaridade = self._mais_proximo(aquecidos, vetor, "centroide_busca")
+            acerto = topico is not None and similaridade >= CONTEXTO_QUENTE_LIMIAR
+            attrs.update(cache_hit=acerto, similaridade=round(similaridade, 4))
+            if not acerto:
+                return None
+            self._contadores["acertos"] += 1
+            documentos = [dict(doc, contexto_quente=True) for doc in topico.documentos[:limite]]
+        print(f"🔥 Contexto quente: texto {similaridade:.3f} similar a um tópico frequente de '{colecao}'. "
+              f"Busca vetorial dispensada ({len(documentos)} documentos pré-buscados).")
+        return documentos
+
+    def invalidar(self, colecao: str) -> None:
+        """Descarta os documentos pré-buscados da coleção (ex: após uma ingestão) e agenda a rebusca."""
+        with self._lock:
+            for topico in self._topicos.get(colecao, []):
+                topico.documentos = None
+            self._contadores["invalidacoes"] += 1
+        self._acordar.set()
+
+    # --- Atualização em segundo plano ---
+
+    def _verificar_mudanca(self, colecao: str) -> None:
+        if self.marca is None:
+            return
+        try:
+            marca = self.marca(colecao)
+        except Exception as e:
+            print(f"⚠️ Contexto quente: falha ao verificar alterações em '{colecao}': {e}")
+            return
+        if marca is None:
+            return
+        anterior = self._marcas.get(colecao)
+        self._marcas[colecao] = marca
+        if anterior is not None and marca != anterior:
+            print(f"🔥 Contexto quente: coleção '{colecao}' alterada; rebuscando os tópicos quentes.")
+            self.invalidar(colecao)
+
+    def atualizar(self) -> int:
+        """
+        Um ciclo do aquecedor: verifica alterações nas coleções, rebusca os tópicos
+        quentes sem documentos, vencidos ou cujo centroide se deslocou e libera os
+        que esfriaram. Retorna o número de tópicos rebuscados.
+        """
+        rebuscados = 0
+        for colecao in list(self._topicos):
+            agora = time.time()
+            with self._lock:
+                topicos = sorted(self._topicos.get(colecao, []), key=lambda t: t.frequencia_em(agora), reverse=True)
+                quentes = [t for t in topicos[:CONTEXTO_QUENTE_MAX_AQUECIDOS] if t.quente(agora)]
+                for topico in topicos:
+                    if topico not in quentes:
+                        topico.documentos = topico.centroide_busca = None
+            if not quentes:
+                continue
+            self._verificar_mudanca(colecao)
+
+            for topico in quentes:
+                with self._lock:
+                    vencido = (topico.documentos is None or agora - topico.atualizado_em >= CONTEXTO_QUENTE_INTERVALO_S
+                               or float(topico.centroide_busca @ topico.centroide) < SIMILARIDADE_DERIVA)
+                    centroide, texto = topico.centroide.copy(), topico.texto
+                if not vencido:
+                    continue
+                documentos = self.buscar(colecao, [centroide.tolist()], texto, CONTEXTO_QUENTE_LIMITE)
+                if not documentos:
+                    # Falha ou coleção vazia: mantém o que havia e tenta no próximo ciclo
+                    continue
+                with self._lock:
+                    topico.documentos = documentos
+                    topico.centroide_busca = centroide
+                    topico.atualizado_em = time.time()
+                    self._contadores["atualizacoes"] += 1
+                rebuscados += 1
+        if rebuscados:
+            print(f"🔥 Contexto quente: {rebuscados} tópico(s) frequente(s) pré-buscado(s).")
+        self.salvar()
+        return rebuscados
+
+    def _executar(self) -> None:
+        # A rebusca em segundo plano disputa a cota dos provedores com prioridade de lote
+        with limites.agendamento(limites.LOTE, dono="contexto_quente"):
+            while not self._parar.is_set():
+                try:
+                    self.atualizar()
+                except Exception as e:
+                    print(f"⚠️ Contexto quente: falha na atualização: {e}")
+                self._acordar.wait(CONTEXTO_QUENTE_VERIFICACAO_S)
+                self._acordar.clear()
+
+    def iniciar(self) -> None:
+        """Inicia (uma vez) a thread daemon do aquecedor."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._executar, name="contexto-quente", daemon=True)
+            self._thread.start()
+
+    def parar(self) -> None:
+        self._parar.set()
+        self._acordar.set()
+
+    # --- Persistência dos tópicos (sem os documentos) ---
+
+    def salvar(self) -> None:
+        if not self.caminho or not self._alterado:
+            return
+        with self._lock:
+            dados = {"modelo": self.modelo, "colecoes": {
+                colecao: [{"centroide": t.centroide.tolist(), "consultas": t.consultas, "frequencia": t.frequencia,
+                           "visto_em": t.visto_em, "texto": t.texto} for t in topicos]
+                for colecao, topicos in self._topicos.items()
+            }}
+            self._alterado = False
+        try:
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            with open(self.caminho + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(dados, f, ensure_ascii=False)
+            os.replace(self.caminho + ".tmp", self.caminho)
+        except OSError as e:
+            print(f"⚠️ Contexto quente: falha ao gravar os tópicos: {e}")
+
+    def _carregar(self) -> None:
+        if not self.caminho or not os.path.exists(self.caminho):
+            return
+        try:
+            with open(self.caminho, encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Contexto quente: arquivo de tópicos ignorado ({e}).")
+            return
+        if dados.get("modelo") != self.modelo:
+            # Centroides de outro modelo de embedding não são comparáveis
+            return
+        for colecao, topicos in dados.get("colecoes", {}).items():
+            for item in topicos:
+                centroide = _normalizar(item["centroide"])
+                if centroide is None:
+                    continue
+                topico = _Topico(centroide, item.get("texto", ""), item.get("visto_em", time.time()))
+                topico.consultas = max(1, int(item.get("consultas", 1)))
+                topico.soma = centroide.astype(np.float64) * topico.consultas
+                topico.frequencia = float(item.get("frequencia", 0.0))
+                self._topicos.setdefault(colecao, []).append(topico)
+        print(f"✅ Contexto quente: {sum(len(t) for t in self._topicos.values())} tópico(s) carregado(s).")
+
+    def estado(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._contadores,
+                        topicos=sum(len(t) for t in self._topicos.values()),
+                        aquecidos=sum(1 for ts in self._topicos.values() for t in ts if t.documentos))
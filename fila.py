@@ -0,0 +1,382 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import argparse
+import threading
+import contextvars
+from typing import Dict, Iterator, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cache import CACHE_DIR
+import metricas
+import limites
+from provedores import Provedor
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DA FILA
+# -----------------------------------------------------------
+
+FILA_CAMINHO = os.getenv("REVISOR_FILA_CAMINHO", os.path.join(CACHE_DIR, "fila.sqlite3"))
+# Workers (threads) iniciados no próprio processo da UI; 0 = apenas workers externos (python fila.py)
+FILA_WORKERS = int(os.getenv("REVISOR_FILA_WORKERS", "4"))
+# Concessão (lease) de uma tarefa em execução: o worker a renova enquanto trabalha; expirada
+# (worker que morreu), a tarefa volta para a fila
+FILA_CONCESSAO_S = float(os.getenv("REVISOR_FILA_CONCESSAO_S", "60"))
+# Tarefas finalizadas são apagadas depois desse tempo
+FILA_RETENCAO_S = float(os.getenv("REVISOR_FILA_RETENCAO_S", str(24 * 3600)))
+# Intervalo mínimo entre gravações do texto parcial (streaming) e da etapa atual
+FILA_INTERVALO_PARCIAL_S = float(os.getenv("REVISOR_FILA_INTERVALO_PARCIAL_S", "0.3"))
+
+PENDENTE, EXECUTANDO, CONCLUIDA, ERRO = "pendente", "executando", "concluida", "erro"
+FINALIZADOS = (CONCLUIDA, ERRO)
+
+# Progresso aproximado (0-1) ao concluir cada etapa do pipeline
+PROGRESSO_ETAPAS = {
+    "classificar": 0.15,
+    "embedding": 0.2,
+    "cache_semantico": 0.25,
+    "contexto_quente": 0.3,
+    "busca_vetorial": 0.35,
+    "montar_prompt": 0.4,
+    "geracao_llm": 0.75,
+    "revisao": 0.8,
+    "ajuste_incremental": 1.0,
+}
+
+
+def hash_entrada(texto: str, colecao: Optional[str], instrucao: str) -> str:
+    return hashlib.sha256(json.dumps([texto, colecao, instrucao], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# -----------------------------------------------------------
+# II. CLASSE FilaTarefas (Fila persistente em SQLite)
+# -----------------------------------------------------------
+
+class FilaTarefas:
+    """
+    Fila de revisões em SQLite. A UI submete e consulta tarefas pelo id; os workers
+    (threads deste processo ou processos `python fila.py`) executam o pipeline e
+    gravam etapa, progresso, texto parcial e resultado.
+    Entradas idênticas ainda pendentes ou em execução reaproveitam a mesma tarefa.
+    Cada reserva recebe um dono e uma concessão renovada pelo worker; só o dono atual
+    grava na tarefa, então uma tarefa reassumida não recebe dois resultados.
+    """
+    def __init__(self, caminho: str = FILA_CAMINHO):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._novas = threading.Condition()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS tarefas (
+                id TEXT PRIMARY KEY,
+                hash_entrada TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                etapa TEXT,
+                progresso REAL NOT NULL DEFAULT 0,
+                entrada TEXT NOT NULL,
+                parcial TEXT NOT NULL DEFAULT '',
+                resultado TEXT,
+                erro TEXT,
+                criado_em REAL NOT NULL,
+                atualizado_em REAL NOT NULL,
+                dono TEXT,
+                concessao_ate REAL
+            )"""
+        )
+        # Filas criadas antes da concessão por worker
+        colunas = {linha["name"] for linha in self._conn.execute("PRAGMA table_info(tarefas)")}
+        for coluna, tipo in (("dono", "TEXT"), ("concessao_ate", "REAL")):
+            if coluna not in colunas:
+                self._conn.execute(f"ALTER TABLE tarefas ADD COLUMN {coluna} {tipo}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_hash ON tarefas (hash_entrada, estado)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_estado ON tarefas (estado, criado_em)")
+        self._conn.commit()
+        self._workers: List[threading.Thread] = []
+
+    # --- API usada pela UI ---
+
+    def submeter(self, texto: str, colecao: Optional[str] = None, instrucao: str = "") -> str:
+        """Enfileira uma revisão e retorna o id da tarefa (ou o de uma idêntica ainda em andamento)."""
+        chave = hash_entrada(texto, colecao, instrucao)
+        agora = time.time()
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT id FROM tarefas WHERE hash_entrada = ? AND estado IN (?, ?) ORDER BY criado_em LIMIT 1",
+                (chave, PENDENTE, EXECUTANDO)
+            ).fetchone()
+            if linha is not None:
+                print(f"✅ Tarefa idêntica já em andamento: {linha['id']}")
+                return linha["id"]
+            id_tarefa = uuid.uuid4().hex
+            entrada = json.dumps({"texto": texto, "colecao": colecao, "instrucao": instrucao}, ensure_ascii=False)
+            self._conn.execute(
+                "INSERT INTO tarefas (id, hash_entrada, estado, entrada, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?)",
+                (id_tarefa, chave, PENDENTE, entrada, agora, agora)
+            )
+            self._conn.execute(
+                "DELETE FROM tarefas WHERE estado IN (?, ?) AND atualizado_em < ?",
+                (CONCLUIDA, ERRO, agora - FILA_RETENCAO_S)
+            )
+            self._conn.commit()
+        with self._novas:
+            self._novas.notify()
+        return id_tarefa
+
+    def consultar(self, id_tarefa: str) -> Optional[Dict]:
+        """Estado atual da tarefa: estado, etapa, progresso, parcial, resultado (dict) e erro."""
+        with self._lock:
+            linha = self._conn.execute("SELECT * FROM tarefas WHERE id = ?", (id_tarefa,)).fetchone()
+        if linha is None:
+            return None
+        tarefa = dict(linha)
+        tarefa["entrada"] = json.loads(tarefa["entrada"])
+        tarefa["resultado"] = json.loads(tarefa["resultado"]) if tarefa["resultado"] else None
+        return tarefa
+
+    def acompanhar(self, id_tarefa: str, intervalo: float = 0.3) -> Iterator[Dict]:
+        """Produz o estado da tarefa a cada mudança, até ela terminar."""
+        ultima = None
+        while True:
+            tarefa = self.consultar(id_tarefa)
+            if tarefa is None:
+                return
+            assinatura = (tarefa["estado"], tarefa["etapa"], tarefa["atualizado_em"])
+            if assinatura != ultima:
+                ultima = assinatura
+                yield tarefa
+            if tarefa["estado"] in FINALIZADOS:
+                return
+            time.sleep(intervalo)
+
+    # --- API usada pelos workers ---
+
+    def _reservar(self) -> Optional[Dict]:
+        """Marca a tarefa pendente mais antiga como em execução (com dono e concessão) e a retorna."""
+        dono = uuid.uuid4().hex
+        with self._lock:
+            agora = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Devolve à fila tarefas cuja concessão expirou (worker que parou de renovar)
+                self._conn.execute(
+                    "UPDATE tarefas SET estado = ?, dono = NULL, atualizado_em = ? "
+                    "WHERE estado = ? AND COALESCE(concessao_ate, atualizado_em + ?) < ?",
+                    (PENDENTE, agora, EXECUTANDO, FILA_CONCESSAO_S, agora)
+                )
+                linha = self._conn.execute(
+                    "SELECT id, entrada FROM tarefas WHERE estado = ? ORDER BY criado_em LIMIT 1", (PENDENTE,)
+                ).fetchone()
+                if linha is not None:
+                    self._conn.execute(
+                        "UPDATE tarefas SET estado = ?, etapa = NULL, progresso = 0, parcial = '', dono = ?, "
+                        "concessao_ate = ?, atualizado_em = ? WHERE id = ?",
+                        (EXECUTANDO, dono, agora + FILA_CONCESSAO_S, agora, linha["id"])
+                    )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        if linha is None:
+            return None
+        return {"id": linha["id"], "dono": dono, **json.loads(linha["entrada"])}
+
+    def _atualizar(self, id_tarefa: str, dono: str, **campos) -> bool:
+        """Grava campos da tarefa e renova a concessão. False se `dono` não é mais o dono da tarefa."""
+        agora = time.time()
+        campos.update(atualizado_em=agora, concessao_ate=agora + FILA_CONCESSAO_S)
+        colunas = ", ".join(f"{nome} = ?" for nome in campos)
+        with self._lock:
+            cursor = self._conn.execute(f"UPDATE tarefas SET {colunas} WHERE id = ? AND dono = ? AND estado = ?",
+                                        (*campos.values(), id_tarefa, dono, EXECUTANDO))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def _renovar(self, id_tarefa: str, dono: str) -> bool:
+        """Estende a concessão sem alterar `atualizado_em` (não conta como mudança para a UI)."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tarefas SET concessao_ate = ? WHERE id = ? AND dono = ? AND estado = ?",
+                (time.time() + FILA_CONCESSAO_S, id_tarefa, dono, EXECUTANDO)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def _manter_concessao(self, id_tarefa: str, dono: str, fim: threading.Event) -> None:
+        # Renova a concessão enquanto o pipeline roda, inclusive durante chamadas longas sem etapas
+        while not fim.wait(FILA_CONCESSAO_S / 3):
+            try:
+                if not self._renovar(id_tarefa, dono):
+                    print(f"⚠️ Tarefa {id_tarefa}: concessão perdida (tarefa reassumida por outro worker).")
+                    return
+            except sqlite3.Error as e:
+                print(f"⚠️ Falha ao renovar a concessão da tarefa {id_tarefa}: {e}")
+
+    def executar(self, tarefa: Dict) -> None:
+        """Executa o pipeline (revisão + ajuste incremental) de uma tarefa reservada."""
+        from revisor import reescrever_revisor_stream, ajuste_incremental_stream, origem_ultima_resposta
+        from saida_estruturada import ResultadoRevisao, ERRO_EXECUCAO
+        from paragrafos import relatorio_diferencas
+
+        id_tarefa, dono = tarefa["id"], tarefa["dono"]
+        estado = {"progresso": 0.0, "progresso_gravado": 0.0, "etapa_gravada": None, "etapa_gravada_em": 0.0,
+                  "gravado_em": 0.0}
+
+        def observar(etapa: str, evento: Optional[Dict]) -> None:
+            if evento is not None:
+                estado["progresso"] = max(estado["progresso"], PROGRESSO_ETAPAS.get(etapa, estado["progresso"]))
+            # Cada span chama o observador: só grava quando o progresso avança ou quando a etapa
+            # muda, neste caso no máximo uma vez a cada FILA_INTERVALO_PARCIAL_S
+            agora = time.time()
+            avancou = estado["progresso"] > estado["progresso_gravado"]
+            mudou_etapa = (etapa != estado["etapa_gravada"]
+                           and agora - estado["etapa_gravada_em"] >= FILA_INTERVALO_PARCIAL_S)
+            if not (avancou or mudou_etapa):
+                return
+            estado.update(progresso_gravado=estado["progresso"], etapa_gravada=etapa, etapa_gravada_em=agora)
+            try:
+                self._atualizar(id_tarefa, dono, etapa=etapa, progresso=estado["progresso"])
+            except sqlite3.Error as e:
+                print(f"⚠️ Falha ao registrar progresso da tarefa {id_tarefa}: {e}")
+
+        def gravar_parcial(texto: str, forcar: bool = False) -> None:
+            if forcar or time.time() - estado["gravado_em"] >= FILA_INTERVALO_PARCIAL_S:
+                estado["gravado_em"] = time.time()
+                try:
+                    self._atualizar(id_tarefa, dono, parcial=texto)
+                except sqlite3.Error as e:
+                    # Banco ocupado: o texto parcial é só acompanhamento, a tarefa continua
+                    print(f"⚠️ Falha ao registrar o texto parcial da tarefa {id_tarefa}: {e}")
+
+        fim = threading.Event()
+        threading.Thread(target=self._manter_concessao, args=(id_tarefa, dono, fim),
+                         name=f"concessao-{id_tarefa[:8]}", daemon=True).start()
+        metricas.iniciar_rastro()
+        metricas.observar_etapas(observar)
+        inicio = time.perf_counter()
+        resultado = {"colecao": tarefa["colecao"] or "Automática", "cache": None}
+        try:
+            texto_parcial, revisao = "", None
+            for item in reescrever_revisor_stream(tarefa["texto"], colecao_override=tarefa["colecao"]):
+                if isinstance(item, ResultadoRevisao):
+                    revisao = item
+                else:
+                    texto_parcial += item
+                    gravar_parcial(texto_parcial)
+            gravar_parcial(revisao.texto if revisao.ok else texto_parcial, forcar=True)
+            resultado["revisao"] = revisao.para_dict()
+            resultado["cache"] = revisao.cache
+            erro = revisao.mensagem_erro if not revisao.ok else None
+
+            resultado["resultado_final"] = revisao.texto
+            if tarefa["instrucao"] and revisao.ok:
+                texto_ajustado = ""
+                try:
+                    for trecho in ajuste_incremental_stream(revisao.texto, tarefa["instrucao"]):
+                        texto_ajustado += trecho
+                        gravar_parcial(texto_ajustado)
+                except Exception as e:
+                    # A revisão continua válida: só o ajuste é descartado
+                    resultado["erro_ajuste"] = f"ERRO no ajuste incremental: {str(e)}"
+                    gravar_parcial(revisao.texto, forcar=True)
+                else:
+                    resultado["resultado_final"] = texto_ajustado
+                    resultado["cache_ajuste"] = origem_ultima_resposta()
+                    resultado["relatorio_ajuste"] = relatorio_diferencas(revisao.texto, texto_ajustado)
+        except Exception as e:
+            erro = f"ERRO na execução da tarefa: {str(e)}"
+            resultado["revisao"] = ResultadoRevisao.falha(ERRO_EXECUCAO, erro).para_dict()
+        finally:
+            metricas.observar_etapas(None)
+            fim.set()
+
+        resultado["duracao_s"] = round(time.perf_counter() - inicio, 3)
+        resultado["metricas"] = metricas.rastro_atual()
+        gravado = self._atualizar(
+            id_tarefa,
+            dono,
+            estado=ERRO if erro else CONCLUIDA,
+            progresso=1.0,
+            resultado=json.dumps(resultado, ensure_ascii=False, default=str),
+            erro=erro,
+        )
+        if not gravado:
+            print(f"⚠️ Tarefa {id_tarefa} foi reassumida por outro worker: resultado descartado.")
+            return
+        print(f"{'❌' if erro else '✅'} Tarefa {id_tarefa} finalizada em {resultado['duracao_s']}s.")
+
+    def _loop_worker(self, parar: threading.Event) -> None:
+        while not parar.is_set():
+            try:
+                tarefa = self._reservar()
+            except sqlite3.Error as e:
+                print(f"⚠️ Falha ao ler a fila: {e}")
+                tarefa = None
+            if tarefa is None:
+                # Acorda na próxima submissão deste processo ou, no máximo, em 1s (submissões de outros processos)
+                with self._novas:
+                    self._novas.wait(timeout=1.0)
+                continue
+            # Tarefas da fila vêm da interface: prioridade interativa, cota dividida por tarefa
+            with limites.agendamento(limites.INTERATIVO, dono=tarefa["id"]):
+                self.executar(tarefa)
+
+    def iniciar_workers(self, quantidade: int = FILA_WORKERS, parar: Optional[threading.Event] = None) -> threading.Event:
+        """Inicia `quantidade` threads worker (daemon). Retorna o evento que as encerra."""
+        parar = parar or threading.Event()
+        for i in range(quantidade):
+            # Cada thread roda num contexto próprio (rastro e observador de etapas separados)
+            contexto = contextvars.copy_context()
+            worker = threading.Thread(target=contexto.run, args=(self._loop_worker, parar),
+                                      name=f"fila-{len(self._workers) + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        if quantidade:
+            print(f"✅ Fila de revisões: {quantidade} worker(s) iniciados ({self.caminho}).")
+        return parar
+
+
+def _criar_fila() -> FilaTarefas:
+    fila = FilaTarefas()
+    fila.iniciar_workers(FILA_WORKERS)
+    return fila
+
+
+provedor_fila = Provedor(_criar_fila, "fila de revisões")
+
+
+def get_fila() -> FilaTarefas:
+    """Fila compartilhada do processo, com os workers locais já iniciados."""
+    return provedor_fila.get()
+
+
+# -----------------------------------------------------------
+# III. WORKER AVULSO (Processo separado da UI)
+# -----------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker da fila de revisões (consome o mesmo SQLite da UI).")
+    parser.add_argument("--workers", type=int, default=FILA_WORKERS)
+    parser.add_argument("--fila", default=FILA_CAMINHO, help="Caminho do arquivo SQLite da fila.")
+    parser.add_argument("--metricas-porta", type=int, default=None, help="Porta do endpoint Prometheus deste processo.")
+    args = parser.parse_args()
+
+    if args.metricas_porta:
+        metricas.servir_prometheus(args.metricas_porta)
+
+    fila = FilaTarefas(args.fila)
+    parar = fila.iniciar_workers(args.workers)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        parar.set()
+        print("✅ Workers encerrados.")
@@ -0,0 +1,301 @@
+import os
+import re
+import gzip
+import json
+import math
+import time
+import heapq
+import argparse
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from conexao_banco import documento_para_registro, projecao_padrao
+from indice_local import INDICE_LOCAL_DIR, ASTRA_CAMPO_ATUALIZACAO, COLECOES_PADRAO
+from metricas import span
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO ÍNDICE LEXICAL (BM25)
+# -----------------------------------------------------------
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Termos da consulta mantidos (os de maior IDF: nomes de produtos, ativos, doses)
+BM25_MAX_TERMOS_CONSULTA = int(os.getenv("BM25_MAX_TERMOS_CONSULTA", "64"))
+
+# Palavras muito frequentes em português que não ajudam a busca exata (já sem acentos)
+STOPWORDS = set("""
+a o e de do da dos das em no na nos nas um uma uns umas por para com sem que se ao aos as os
+ou como mais menos mas foi ser sao esta estao pelo pela pelos pelas seu sua seus suas isso este
+""".split())
+
+# Palavras, números com decimais (2,5 / 0.75) e unidades (ml, ha, g/l viram termos separados)
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Minúsculas, sem acentos; mantém números decimais inteiros ("2,5") como um termo."""
+    normalizado = unicodedata.normalize("NFKD", texto.lower())
+    sem_acentos = "".join(c for c in normalizado if not unicodedata.combining(c))
+    return [t.replace(",", ".") for t in _TOKEN.findall(sem_acentos) if t not in STOPWORDS]
+
+
+# -----------------------------------------------------------
+# II. ÍNDICE INVERTIDO DE UMA COLEÇÃO
+# -----------------------------------------------------------
+
+class _ColecaoLexical:
+    """Listas invertidas {termo: {posição: frequência}} com inclusão e remoção incrementais."""
+    def __init__(self):
+        self.documentos: List[Optional[Dict]] = []
+        self.comprimentos: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.posicoes: Dict[str, int] = {}
+        self.total_termos = 0
+        self.meta: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self.posicoes)
+
+    def remover(self, id_documento: str) -> bool:
+        posicao = self.posicoes.pop(id_documento, None)
+        if posicao is None:
+            return False
+        for termo in set(tokenizar(self.documentos[posicao]["conteudo"] or "")):
+            lista = self.postings.get(termo)
+            if lista is not None:
+                lista.pop(posicao, None)
+                if not lista:
+                    del self.postings[termo]
+        self.total_termos -= self.comprimentos[posicao]
+        self.documentos[posicao] = None
+        self.comprimentos[posicao] = 0
+        return True
+
+    def adicionar(self, registro: Dict) -> None:
+        id_documento = str(registro["_id"])
+        self.remover(id_documento)
+        frequencias = Counter(tokenizar(registro["conteudo"] or ""))
+        posicao = len(self.documentos)
+        self.documentos.append(registro)
+        self.comprimentos.append(sum(frequencias.values()))
+        self.posicoes[id_documento] = posicao
+        self.total_termos += self.comprimentos[posicao]
+        for termo, frequencia in frequencias.items():
+            self.postings.setdefault(termo, {})[posicao] = frequencia
+
+    def buscar(self, termos: Iterable[str], limit: int) -> List[tuple]:
+        """Retorna [(score, posição)] dos melhores documentos por BM25."""
+        total = len(self.posicoes)
+        if not total:
+            return []
+        media = self.total_termos / total
+        idf = {}
+        for termo in set(termos):
+            lista = self.postings.get(termo)
+            if lista:
+                idf[termo] = math.log(1 + (total - len(lista) + 0.5) / (len(lista) + 0.5))
+        # Consultas longas (o texto inteiro): mantém os termos mais raros
+        selecionados = heapq.nlargest(BM25_MAX_TERMOS_CONSULTA, idf, key=idf.get)
+        scores: Dict[int, float] = {}
+        for termo in selecionados:
+            for posicao, frequencia in self.postings[termo].items():
+                normalizacao = BM25_K1 * (1 - BM25_B + BM25_B * self.comprimentos[posicao] / media)
+                scores[posicao] = scores.get(posicao, 0.0) + idf[termo] * frequencia * (BM25_K1 + 1) / (frequencia + normalizacao)
+        return heapq.nlargest(limit, ((score, posicao) for posicao, score in scores.items()))
+
+    def serializar(self) -> Dict:
+        """Formato compacto em disco: posições renumeradas sem lacunas e listas achatadas [pos, tf, pos, tf...]."""
+        nova_posicao = {antiga: nova for nova, antiga in enumerate(sorted(self.posicoes.values()))}
+        return {
+            "meta": self.meta,
+            "documentos": [self.documentos[antiga] for antiga in sorted(nova_posicao)],
+            "postings": {
+                termo: [valor for posicao, frequencia in lista.items()
+                        for valor in (nova_posicao[posicao], frequencia)]
+                for termo, lista in self.postings.items()
+            },
+        }
+
+    @classmethod
+    def desserializar(cls, dados: Dict) -> "_ColecaoLexical":
+        colecao = cls()
+        colecao.meta = dados.get("meta", {})
+        colecao.documentos = dados["documentos"]
+        colecao.comprimentos = [0] * len(colecao.documentos)
+        for termo, plano in dados["postings"].items():
+            lista = dict(zip(plano[0::2], plano[1::2]))
+            colecao.postings[termo] = lista
+            for posicao, frequencia in lista.items():
+                colecao.comprimentos[posicao] += frequencia
+        colecao.posicoes = {str(doc["_id"]): i for i, doc in enumerate(colecao.documentos)}
+        colecao.total_termos = sum(colecao.comprimentos)
+        return colecao
+
+
+# -----------------------------------------------------------
+# III. CLASSE IndiceLexical (BM25 local por coleção)
+# -----------------------------------------------------------
+
+class IndiceLexical:
+    """
+    Índice BM25 local das coleções, usado em conjunto com a busca vetorial
+    (busca híbrida). Fica em <INDICE_LOCAL_DIR>/<coleção>/lexical.json.gz,
+    é carregado sob demanda e atualizado incrementalmente (sincronização com o
+    Astra ou ingestão). Retorna os mesmos registros estruturados da busca vetorial.
+    Se outro processo (ex: ingestao.py) grava o arquivo, o índice é recarregado na
+    próxima consulta, desde que não haja alterações locais ainda não salvas.
+    """
+    def __init__(self, diretorio: str = INDICE_LOCAL_DIR, cliente_remoto=None):
+        self.diretorio = diretorio
+        self.cliente_remoto = cliente_remoto
+        self._colecoes: Dict[str, Optional[_ColecaoLexical]] = {}
+        # Versão (mtime, tamanho) do arquivo carregado e coleções com alterações não salvas
+        self._versoes: Dict[str, Optional[tuple]] = {}
+        self._alteradas = set()
+        self._lock = threading.Lock()
+
+    def _caminho(self, colecao: str) -> str:
+        return os.path.join(self.diretorio, colecao, "lexical.json.gz")
+
+    def existe(self, colecao: str) -> bool:
+        return self._colecoes.get(colecao) is not None or os.path.exists(self._caminho(colecao))
+
+    def _versao(self, colecao: str) -> Optional[tuple]:
+        try:
+            info = os.stat(self._caminho(colecao))
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def _carregar(self, colecao: str, criar: bool = False) -> Optional[_ColecaoLexical]:
+        with self._lock:
+            versao = self._versao(colecao)
+            desatualizada = (self._colecoes.get(colecao) is not None and colecao not in self._alteradas
+                             and versao is not None and versao != self._versoes.get(colecao))
+            if self._colecoes.get(colecao) is None or desatualizada:
+                caminho = self._caminho(colecao)
+                if versao is not None:
+                    with gzip.open(caminho, "rt", encoding="utf-8") as f:
+                        self._colecoes[colecao] = _ColecaoLexical.desserializar(json.load(f))
+                    self._versoes[colecao] = versao
+                    print(f"✅ Índice lexical '{colecao}' {'recarregado' if desatualizada else 'carregado'}: "
+                          f"{len(self._colecoes[colecao])} documentos.")
+                elif criar:
+                    self._colecoes[colecao] = _ColecaoLexical()
+                else:
+                    return None
+            return self._colecoes[colecao]
+
+    def carregar_todas(self, colecoes: List[str] = COLECOES_PADRAO) -> None:
+        """Carrega do disco os índices existentes (ex: na inicialização da UI)."""
+        for colecao in colecoes:
+            self._carregar(colecao)
+
+    def salvar(self, colecao: str) -> None:
+        """Grava o índice da coleção de forma atômica (escreve em .tmp e renomeia)."""
+        with self._lock:
+            dados = self._colecoes.get(colecao)
+            if dados is None:
+                return
+            serializado = dados.serializar()
+        caminho = self._caminho(colecao)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with gzip.open(caminho + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(serializado, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(caminho + ".tmp", caminho)
+        with self._lock:
+            self._versoes[colecao] = self._versao(colecao)
+            self._alteradas.discard(colecao)
+
+    # --- Atualização incremental ---
+
+    def atualizar(self, colecao: str, documentos: List[Dict]) -> None:
+        """Inclui ou substitui documentos do Astra (pelo _id). Chame salvar() para persistir."""
+        dados = self._carregar(colecao, criar=True)
+        with self._lock:
+            self._alteradas.add(colecao)
+            for doc in documentos:
+                registro = documento_para_registro(doc)
+                registro.pop("similaridade", None)
+                dados.adicionar(registro)
+
+    def remover(self, colecao: str, ids: List[str]) -> int:
+        dados = self._carregar(colecao)
+        if dados is None:
+            return 0
+        with self._lock:
+            removidos = sum(dados.remover(str(i)) for i in ids)
+            if removidos:
+                self._alteradas.add(colecao)
+            return removidos
+
+    # --- Busca ---
+
+    def buscar(self, colecao: str, texto: str, limit: int = 10) -> List[Dict]:
+        """Busca BM25 pelos termos do texto. Sem índice para a coleção, retorna []."""
+        with span("busca_lexical", colecao=colecao, limite=limit) as attrs:
+            dados = self._carregar(colecao)
+            if dados is None:
+                attrs["documentos"] = 0
+                return []
+            with self._lock:
+                melhores = dados.buscar(tokenizar(texto), limit)
+                resultados = [dict(dados.documentos[posicao], score_bm25=round(score, 4)) for score, posicao in melhores]
+            attrs["documentos"] = len(resultados)
+        return resultados
+
+    # --- Sincronização com o Astra ---
+
+    def sincronizar(self, colecao: str, completo: bool = False) -> int:
+        """
+        Atualiza o índice a partir do Astra DB. Na sincronização incremental, baixa
+        apenas documentos com ASTRA_CAMPO_ATUALIZACAO posterior à última sincronização.
+        Retorna o número de documentos baixados.
+        """
+        if self.cliente_remoto is None:
+            raise RuntimeError("Sincronização exige um AstraDBClient (cliente_remoto).")
+        atual = None if completo else self._carregar(colecao)
+        inicio_ms = int(time.time() * 1000)
+        filtro = None
+        if atual is not None and atual.meta.get("ultima_sincronizacao_ms"):
+            filtro = {ASTRA_CAMPO_ATUALIZACAO: {"$gt": {"$date": atual.meta["ultima_sincronizacao_ms"]}}}
+        if completo:
+            with self._lock:
+                self._colecoes[colecao] = _ColecaoLexical()
+                self._alteradas.add(colecao)
+
+        print(f"\n--- Sincronizando Índice Lexical: {colecao} ({'incremental' if filtro else 'completa'}) ---")
+        baixados = 0
+        lote = []
+        for doc in self.cliente_remoto.find_documents(colecao, filtro=filtro, projection=projecao_padrao()):
+            lote.append(doc)
+            if len(lote) >= 500:
+                self.atualizar(colecao, lote)
+                baixados += len(lote)
+                lote = []
+        self.atualizar(colecao, lote)
+        baixados += len(lote)
+        self._colecoes[colecao].meta = {"ultima_sincronizacao_ms": inicio_ms}
+        self.salvar(colecao)
+        print(f"✅ Índice lexical '{colecao}' sincronizado. Baixados: {baixados}. Total: {len(self._colecoes[colecao])}")
+        return baixados
+
+
+# -----------------------------------------------------------
+# IV. SINCRONIZAÇÃO VIA LINHA DE COMANDO
+# -----------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza o índice lexical (BM25) local das coleções do Astra DB.")
+    parser.add_argument("colecoes", nargs="*", default=COLECOES_PADRAO)
+    parser.add_argument("--completo", action="store_true", help="Refaz o índice do zero (reflete remoções).")
+    args = parser.parse_args()
+
+    from conexao_banco import get_astra_client
+
+    indice = IndiceLexical(cliente_remoto=get_astra_client())
+    for nome in args.colecoes:
+        indice.sincronizar(nome, completo=args.completo)
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import threading
+import argparse
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from conexao_banco import documento_para_registro, projecao_padrao
+from metricas import span
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO ÍNDICE LOCAL
+# -----------------------------------------------------------
+
+INDICE_LOCAL_DIR = os.getenv(
+    "INDICE_LOCAL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".indice_local")
+)
+# Campo de data de atualização dos documentos no Astra (usado na sincronização incremental)
+ASTRA_CAMPO_ATUALIZACAO = os.getenv("ASTRA_CAMPO_ATUALIZACAO", "updated_at")
+COLECOES_PADRAO = ["PRODUTO", "CULTURA", "OUTROS"]
+
+
+# -----------------------------------------------------------
+# II. CLASSE IndiceVetorialLocal (Espelho local das coleções Astra)
+# -----------------------------------------------------------
+
+class IndiceVetorialLocal:
+    """
+    Espelho local das coleções do Astra DB com a mesma interface de busca
+    do AstraDBClient (vector_search), retornando os mesmos registros estruturados.
+    Os vetores ficam normalizados em float32
+    num arquivo .npy mapeado em memória; os documentos ficam num JSON ao lado.
+    """
+    def __init__(self, diretorio: str = INDICE_LOCAL_DIR, cliente_remoto=None):
+        self.diretorio = diretorio
+        self.cliente_remoto = cliente_remoto
+        self._colecoes: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        print(f"✅ IndiceVetorialLocal inicializado em: {self.diretorio}")
+
+    # --- Arquivos ---
+
+    def _caminhos(self, colecao: str) -> Dict[str, str]:
+        base = os.path.join(self.diretorio, colecao)
+        return {
+            "base": base,
+            "vetores": os.path.join(base, "vetores.npy"),
+            "documentos": os.path.join(base, "documentos.json"),
+            "meta": os.path.join(base, "meta.json"),
+        }
+
+    def _carregar(self, colecao: str) -> Optional[Dict]:
+        with self._lock:
+            if colecao in self._colecoes:
+                return self._colecoes[colecao]
+            caminhos = self._caminhos(colecao)
+            if not os.path.exists(caminhos["vetores"]):
+                return None
+            with open(caminhos["documentos"], encoding="utf-8") as f:
+                documentos = json.load(f)
+            with open(caminhos["meta"], encoding="utf-8") as f:
+                meta = json.load(f)
+            dados = {
+                "vetores": np.load(caminhos["vetores"], mmap_mode="r"),
+                "documentos": documentos,
+                "meta": meta,
+            }
+            self._colecoes[colecao] = dados
+            return dados
+
+    def _salvar(self, colecao: str, vetores: np.ndarray, documentos: List[Dict], meta: Dict) -> None:
+        """Grava os arquivos da coleção de forma atômica (escreve em .tmp e renomeia)."""
+        caminhos = self._caminhos(colecao)
+        os.makedirs(caminhos["base"], exist_ok=True)
+        with open(caminhos["vetores"] + ".tmp", "wb") as f:
+            np.save(f, vetores.astype(np.float32))
+        with open(caminhos["documentos"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(documentos, f, ensure_ascii=False)
+        with open(caminhos["meta"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        for chave in ("vetores", "documentos", "meta"):
+            os.replace(caminhos[chave] + ".tmp", caminhos[chave])
+        with self._lock:
+            self._colecoes.pop(colecao, None)
+
+    # --- Busca ---
+
+    @staticmethod
+    def _normalizar(matriz: np.ndarray) -> np.ndarray:
+        normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return matriz / normas
+
+    def buscar_lote(self, collection: str, vetores: List[List[float]], limit: int = 6) -> List[List[Dict]]:
+        """Busca top-k para vários vetores de uma vez (um único produto matricial)."""
+        dados = self._carregar(collection)
+        if dados is None or len(dados["documentos"]) == 0:
+            print(f"❌ Índice local vazio ou inexistente para a coleção: {collection}")
+            return [[] for _ in vetores]
+
+        consultas = self._normalizar(np.asarray(vetores, dtype=np.float32))
+        scores = consultas @ dados["vetores"].T
+        k = min(limit, scores.shape[1])
+
+        resultados = []
+        for linha in scores:
+            candidatos = np.argpartition(-linha, k - 1)[:k]
+            ordenados = candidatos[np.argsort(-linha[candidatos])]
+            docs = []
+            for idx in ordenados:
+                registro = documento_para_registro(dados["documentos"][idx])
+                # Mesma escala do $similarity do Astra para a métrica cosseno
+                registro["similaridade"] = float((1.0 + linha[idx]) / 2.0)
+                docs.append(registro)
+            resultados.append(docs)
+        return resultados
+
+    def vector_search(self, collection: str, vector: List[float], limit: int = 6) -> List[Dict]:
+        """Realiza busca por similaridade vetorial no espelho local da coleção."""
+        if not collection or collection == "ERRO":
+            print("❌ Busca vetorial abortada: Coleção inválida ou erro na classificação.")
+            return []
+        print(f"\n--- Buscando no Índice Local na Coleção: {collection} ---")
+        with span("busca_vetorial", colecao=collection, backend="local", limite=limit) as attrs:
+            documents = self.buscar_lote(collection, [vector], limit=limit)[0]
+            attrs["documentos"] = len(documents)
+        print(f"✅ Busca local realizada. Documentos retornados: {len(documents)}")
+        return documents
+
+    def marca_atualizacao(self, collection: str) -> Optional[str]:
+        """Marca que muda a cada sincronização da coleção (data e total do meta.json)."""
+        try:
+            with open(self._caminhos(collection)["meta"], encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return f"{meta.get('ultima_sincronizacao_ms')}:{meta.get('total')}"
+
+    # --- Sincronização ---
+
+    def sincronizar(self, colecao: str, completo: bool = False) -> int:
+        """
+        Atualiza o espelho local a partir do Astra DB.
+        Na sincronização incremental, baixa apenas os documentos cujo campo
+        ASTRA_CAMPO_ATUALIZACAO é posterior à última sincronização. Remoções
+        só são refletidas numa sincronização completa.
+        Retorna o número de documentos baixados.
+        """
+        if self.cliente_remoto is None:
+            raise RuntimeError("Sincronização exige um AstraDBClient (cliente_remoto).")
+
+        atual = None if completo else self._carregar(colecao)
+        inicio_ms = int(time.time() * 1000)
+
+        filtro = None
+        if atual is not None and atual["meta"].get("ultima_sincronizacao_ms"):
+            filtro = {ASTRA_CAMPO_ATUALIZACAO: {"$gt": {"$date": atual["meta"]["ultima_sincronizacao_ms"]}}}
+
+        print(f"\n--- Sincronizando Índice Local: {colecao} ({'incremental' if filtro else 'completa'}) ---")
+        novos_docs, novos_vetores = [], []
+        projecao = dict(projecao_padrao(), **{"$vector": 1})
+        for doc in self.cliente_remoto.find_documents(colecao, filtro=filtro, projection=projecao):
+            vetor = doc.pop("$vector", None)
+            if not vetor:
+                continue
+            novos_docs.append(doc)
+            novos_vetores.append(vetor)
+
+        if filtro is not None:
+            documentos = list(atual["documentos"])
+            vetores = np.array(atual["vetores"], dtype=np.float32)
+            posicoes = {doc.get("_id"): i for i, doc in enumerate(documentos)}
+            anexos_docs, anexos_vetores = [], []
+            for doc, vetor in zip(novos_docs, novos_vetores):
+                vetor = self._normalizar(np.asarray(vetor, dtype=np.float32))
+                if doc.get("_id") in posicoes:
+                    i = posicoes[doc["_id"]]
+                    documentos[i] = doc
+                    vetores[i] = vetor
+                else:
+                    anexos_docs.append(doc)
+                    anexos_vetores.append(vetor)
+            if anexos_vetores:
+                documentos.extend(anexos_docs)
+                anexos = np.stack(anexos_vetores)
+                vetores = np.vstack([vetores, anexos]) if vetores.size else anexos
+        else:
+            documentos = novos_docs
+            vetores = (self._normalizar(np.asarray(novos_vetores, dtype=np.float32))
+                       if novos_vetores else np.zeros((0, 0), dtype=np.float32))
+
+        meta = {"ultima_sincronizacao_ms": inicio_ms, "total": len(documentos)}
+        self._salvar(colecao, vetores, documentos, meta)
+        print(f"✅ Coleção '{colecao}' sincronizada. Baixados: {len(novos_docs)}. Total local: {len(documentos)}")
+        return len(novos_docs)
+
+
+# -----------------------------------------------------------
+# III. SINCRONIZAÇÃO VIA LINHA DE COMANDO
+# -----------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza o espelho local das coleções do Astra DB.")
+    parser.add_argument("colecoes", nargs="*", default=COLECOES_PADRAO)
+    parser.add_argument("--completo", action="store_true", help="Refaz o espelho do zero (reflete remoções).")
+    args = parser.parse_args()
+
+    from conexao_banco import get_astra_client
+
+    indice = IndiceVetorialLocal(cliente_remoto=get_astra_client())
+    for nome in args.colecoes:
+        indice.sincronizar(nome, completo=args.completo)
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cache import CACHE_DIR
+import limites
+from metricas import copiar_contexto, servir_prometheus
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DA INGESTÃO
+# -----------------------------------------------------------
+
+INGESTAO_MANIFESTO = os.getenv("REVISOR_INGESTAO_MANIFESTO", os.path.join(CACHE_DIR, "ingestao.sqlite3"))
+# Tamanho dos trechos (chunks) gravados no Astra, em tokens
+TAMANHO_CHUNK_TOKENS = int(os.getenv("REVISOR_TAMANHO_CHUNK_TOKENS", "400"))
+# Caracteres do início do documento usados para classificá-lo
+AMOSTRA_CLASSIFICACAO = int(os.getenv("REVISOR_AMOSTRA_CLASSIFICACAO", "2000"))
+# Campo de data de atualização (o mesmo usado na sincronização incremental do índice local)
+ASTRA_CAMPO_ATUALIZACAO = os.getenv("ASTRA_CAMPO_ATUALIZACAO", "updated_at")
+EXTENSOES = (".pdf", ".txt", ".md")
+CATEGORIAS = ("PRODUTO", "CULTURA", "OUTROS")
+
+
+# -----------------------------------------------------------
+# II. LEITURA DOS ARQUIVOS (Texto e PDF)
+# -----------------------------------------------------------
+
+def listar_arquivos(diretorio: str) -> Iterator[str]:
+    """Percorre o diretório (recursivamente) produzindo os arquivos suportados, um a um."""
+    for raiz, _, arquivos in os.walk(diretorio):
+        for nome in sorted(arquivos):
+            if nome.lower().endswith(EXTENSOES):
+                yield os.path.join(raiz, nome)
+
+
+def ler_texto(caminho: str) -> str:
+    """Extrai o texto do arquivo; PDFs exigem o pacote pypdf."""
+    if caminho.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("Leitura de PDF requer o pacote 'pypdf' (pip install pypdf).")
+        leitor = PdfReader(caminho)
+        return "\n\n".join((pagina.extract_text() or "").strip() for pagina in leitor.pages)
+    with open(caminho, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def hash_conteudo(*partes: str) -> str:
+    return hashlib.sha256("\x00".join(partes).encode("utf-8")).hexdigest()[:32]
+
+
+# -----------------------------------------------------------
+# III. MANIFESTO LOCAL (O que já foi gravado em cada coleção)
+# -----------------------------------------------------------
+
+class Manifesto:
+    """
+    Registro em SQLite dos arquivos e trechos já ingeridos. Permite pular arquivos
+    inalterados sem ler o Astra e remover os trechos antigos de um arquivo alterado.
+    """
+    def __init__(self, caminho: str = INGESTAO_MANIFESTO):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS arquivos (
+                fonte TEXT PRIMARY KEY,
+                hash_arquivo TEXT NOT NULL,
+                colecao TEXT NOT NULL,
+                chunks TEXT NOT NULL,
+                ingerido_em REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def obter(self, fonte: str) -> Optional[Dict]:
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT hash_arquivo, colecao, chunks FROM arquivos WHERE fonte = ?", (fonte,)
+            ).fetchone()
+        if linha is None:
+            return None
+        return {"hash_arquivo": linha[0], "colecao": linha[1], "chunks": json.loads(linha[2])}
+
+    def gravar(self, fonte: str, hash_arquivo: str, colecao: str, chunks: List[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO arquivos (fonte, hash_arquivo, colecao, chunks, ingerido_em) VALUES (?, ?, ?, ?, ?)",
+                (fonte, hash_arquivo, colecao, json.dumps(chunks), time.time())
+            )
+            self._conn.commit()
+
+
+# -----------------------------------------------------------
+# IV. INGESTÃO DE UM ARQUIVO
+# -----------------------------------------------------------
+
+def _classificar_documento(texto: str) -> Optional[str]:
+    from classificacao import classificar_texto
+    categoria = classificar_texto(texto[:AMOSTRA_CLASSIFICACAO])
+    return categoria if categoria in CATEGORIAS else None
+
+
+def ingerir_arquivo(caminho: str, diretorio: str, manifesto: Manifesto,
+                    colecao_fixa: Optional[str] = None, forcar: bool = False,
+                    indice_lexical=None) -> Dict:
+    """
+    Lê, divide, classifica, gera embeddings e grava um arquivo no Astra.
+    Arquivos inalterados são pulados; num arquivo alterado, só os trechos novos
+    recebem embedding e os trechos que deixaram de existir são removidos.
+    Se a coleção tiver índice lexical (BM25) local, ele é atualizado junto (sem salvar).
+    """
+    from revisor import get_embeddings, EMBEDDING_MODEL
+    from orcamento import dividir_por_tokens
+    from conexao_banco import get_astra_client
+
+    fonte = os.path.relpath(caminho, diretorio)
+    resultado = {"fonte": fonte, "status": "pulado", "colecao": None, "chunks": 0,
+                 "novos": 0, "removidos": 0, "erro": None}
+    inicio = time.perf_counter()
+    try:
+        texto = ler_texto(caminho)
+        hash_arquivo = hash_conteudo(texto)
+        anterior = manifesto.obter(fonte)
+        if anterior and anterior["hash_arquivo"] == hash_arquivo and not forcar:
+            resultado.update(colecao=anterior["colecao"], chunks=len(anterior["chunks"]))
+            return resultado
+
+        if not texto.strip():
+            resultado.update(status="erro", erro="Arquivo sem texto extraível.")
+            return resultado
+
+        colecao = colecao_fixa or _classificar_documento(texto)
+        if colecao is None:
+            resultado.update(status="erro", erro="Classificação falhou; use --colecao para definir a coleção.")
+            return resultado
+
+        chunks = [c.strip() for c in dividir_por_tokens(texto, TAMANHO_CHUNK_TOKENS) if c.strip()]
+        ids = [hash_conteudo(fonte, chunk) for chunk in chunks]
+        # Trechos já gravados nesta coleção (mesmo id) não são reenviados nem recebem novo embedding
+        existentes = set(anterior["chunks"]) if anterior and anterior["colecao"] == colecao and not forcar else set()
+        novos = [(i, chunk) for i, (id_chunk, chunk) in enumerate(zip(ids, chunks)) if id_chunk not in existentes]
+
+        cliente = get_astra_client()
+        if novos:
+            vetores = get_embeddings([chunk for _, chunk in novos])
+            if vetores.size == 0:
+                raise RuntimeError("Falha ao gerar os embeddings.")
+            agora_ms = int(time.time() * 1000)
+            documentos = [
+                {
+                    "_id": ids[i],
+                    "content": chunk,
+                    "metadata": {"source": fonte, "titulo": os.path.basename(fonte), "chunk": i,
+                                 "total_chunks": len(chunks), "hash_arquivo": hash_arquivo,
+                                 "modelo_embedding": EMBEDDING_MODEL},
+                    ASTRA_CAMPO_ATUALIZACAO: {"$date": agora_ms},
+                    "$vector": vetor.tolist(),
+                }
+                for (i, chunk), vetor in zip(novos, vetores)
+            ]
+            gravacao = cliente.insert_many(colecao, documentos)
+            if gravacao["erros"]:
+                raise RuntimeError(f"insertMany: {gravacao['erros'][:3]}")
+            if indice_lexical is not None and indice_lexical.existe(colecao):
+                indice_lexical.atualizar(colecao, documentos)
+
+        # Remove os trechos antigos que não existem mais (ou que estavam em outra coleção)
+        if anterior:
+            atuais = set(ids)
+            obsoletos = [c for c in anterior["chunks"] if c not in atuais or anterior["colecao"] != colecao]
+            if obsoletos:
+                resultado["removidos"] = cliente.delete_many(anterior["colecao"], {"_id": {"$in": obsoletos}})
+                if indice_lexical is not None:
+                    indice_lexical.remover(anterior["colecao"], obsoletos)
+
+        manifesto.gravar(fonte, hash_arquivo, colecao, ids)
+        resultado.update(status="ingerido", colecao=colecao, chunks=len(chunks), novos=len(novos))
+    except Exception as e:
+        resultado.update(status="erro", erro=str(e))
+    finally:
+        resultado["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+# -----------------------------------------------------------
+# V. INGESTÃO DO DIRETÓRIO (Concorrência limitada)
+# -----------------------------------------------------------
+
+def ingerir_diretorio(diretorio: str, concorrencia: int = 4, colecao_fixa: Optional[str] = None,
+                      forcar: bool = False, manifesto: Optional[Manifesto] = None) -> Dict[str, int]:
+    """
+    Ingere todos os arquivos suportados do diretório com no máximo `concorrencia`
+    arquivos em paralelo. Retorna a contagem por status e o total de trechos novos.
+    """
+    from indice_lexical import IndiceLexical
+
+    manifesto = manifesto or Manifesto()
+    indice_lexical = IndiceLexical()
+    contagem = {"ingerido": 0, "pulado": 0, "erro": 0, "chunks_novos": 0, "chunks_removidos": 0}
+    lock = threading.Lock()
+    vagas = threading.BoundedSemaphore(concorrencia * 2)
+
+    def registrar(futuro):
+        try:
+            resultado = futuro.result()
+            with lock:
+                contagem[resultado["status"]] += 1
+                contagem["chunks_novos"] += resultado["novos"]
+                contagem["chunks_removidos"] += resultado["removidos"]
+                icone = {"ingerido": "✅", "pulado": "⏭️", "erro": "❌"}[resultado["status"]]
+                detalhe = resultado["erro"] or (f"{resultado['colecao']}: {resultado['novos']}/{resultado['chunks']} "
+                                                f"trechos novos, {resultado['removidos']} removidos")
+                print(f"{icone} {resultado['fonte']} ({resultado['duracao_s']}s) {detalhe}")
+        finally:
+            # Libera a vaga mesmo se o registro falhar, para a ingestão não travar
+            vagas.release()
+
+    # Chamadas aos provedores com prioridade de lote: a interface passa na frente na fila das cotas
+    with limites.agendamento(limites.LOTE, dono="ingestao"), \
+            ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="ingestao") as executor:
+        for caminho in listar_arquivos(diretorio):
+            # Limita os arquivos em memória aguardando processamento
+            vagas.acquire()
+            try:
+                futuro = executor.submit(copiar_contexto(ingerir_arquivo), caminho, diretorio, manifesto,
+                                         colecao_fixa, forcar, indice_lexical)
+            except Exception:
+                vagas.release()
+                raise
+            futuro.add_done_callback(registrar)
+
+    # Persiste os índices lexicais atualizados durante a ingestão
+    for colecao in CATEGORIAS:
+        if indice_lexical.existe(colecao):
+            indice_lexical.salvar(colecao)
+
+    print(f"✅ Ingestão finalizada. Ingeridos: {contagem['ingerido']}. Pulados: {contagem['pulado']}. "
+          f"Erros: {contagem['erro']}. Trechos novos: {contagem['chunks_novos']}. Removidos: {contagem['chunks_removidos']}.")
+    return contagem
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestão de PDFs/textos nas coleções do Astra DB.")
+    parser.add_argument("diretorio", help="Diretório com arquivos .pdf, .txt ou .md (lido recursivamente).")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--colecao", default=None, choices=CATEGORIAS,
+                        help="Grava tudo nesta coleção em vez de classificar cada arquivo.")
+    parser.add_argument("--forcar", action="store_true", help="Reprocessa também os arquivos inalterados (reenvia trechos ausentes no Astra).")
+    parser.add_argument("--metricas-porta", type=int, default=None, help="Porta do endpoint Prometheus deste processo.")
+    for provedor in limites.PROVEDORES:
+        parser.add_argument(f"--rpm-{provedor}", type=float, default=None,
+                            help=f"Limite de requisições por minuto para {provedor}.")
+        parser.add_argument(f"--tpm-{provedor}", type=float, default=None,
+                            help=f"Limite de tokens por minuto para {provedor}.")
+    args = parser.parse_args()
+
+    if args.metricas_porta:
+        servir_prometheus(args.metricas_porta)
+    for provedor in limites.PROVEDORES:
+        rpm, tpm = getattr(args, f"rpm_{provedor}"), getattr(args, f"tpm_{provedor}")
+        if rpm is not None or tpm is not None:
+            limites.configurar_limite(provedor, rpm, tpm)
+
+    ingerir_diretorio(args.diretorio, concorrencia=args.concorrencia, colecao_fixa=args.colecao, forcar=args.forcar)
@@ -0,0 +1,320 @@
+import os
+import sys
+import time
+import heapq
+import random
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import metricas
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÃO DOS LIMITES POR PROVEDOR
+# -----------------------------------------------------------
+
+# Cada provedor tem um balde de requisições por minuto (LIMITE_<PROVEDOR>_RPM) e outro de
+# tokens por minuto (LIMITE_<PROVEDOR>_TPM); 0 ou ausente = sem limite. Os valores vêm das
+# variáveis de ambiente ou do secrets.toml do Streamlit (chave na raiz ou na seção [limites]).
+# Os limites valem por processo: com vários processos, divida a cota entre eles.
+PROVEDORES = ["openai", "gemini", "astra"]
+
+# Classes de prioridade: chamadas da interface passam na frente dos jobs em lote
+INTERATIVO = "interativo"
+LOTE = "lote"
+# Fração da vazão de cada classe quando ambas disputam a cota (4:1 = 80% para a interface)
+PESOS_CLASSES = {
+    INTERATIVO: float(os.getenv("LIMITE_PESO_INTERATIVO", "4")),
+    LOTE: float(os.getenv("LIMITE_PESO_LOTE", "1")),
+}
+
+# Respostas 429: o provedor inteiro pausa e a chamada volta para a fila (em vez de falhar)
+TENTATIVAS_LIMITE = int(os.getenv("LIMITE_TENTATIVAS_429", "5"))
+PAUSA_BASE_S = float(os.getenv("LIMITE_PAUSA_429_S", "2"))
+PAUSA_MAXIMA_S = float(os.getenv("LIMITE_PAUSA_MAXIMA_S", "60"))
+
+
+def _configuracao(nome: str) -> float:
+    valor = os.getenv(nome)
+    # Só consulta o Streamlit se ele já estiver carregado (app); lote e ingestão usam o ambiente
+    st = sys.modules.get("streamlit")
+    if not valor and st is not None:
+        try:
+            valor = st.secrets.get(nome) or (st.secrets.get("limites") or {}).get(nome)
+        except Exception:
+            valor = None
+    return float(valor or 0)
+
+
+def _rpm_configurado(provedor: str) -> float:
+    return _configuracao(f"LIMITE_{provedor.upper()}_RPM")
+
+
+def _tpm_configurado(provedor: str) -> float:
+    return _configuracao(f"LIMITE_{provedor.upper()}_TPM")
+
+
+# Classe e dono (tarefa da fila, job de lote) das chamadas feitas no contexto atual;
+# propagados às threads do pipeline via metricas.copiar_contexto
+_classe: contextvars.ContextVar = contextvars.ContextVar("classe_agendamento", default=INTERATIVO)
+_dono: contextvars.ContextVar = contextvars.ContextVar("dono_agendamento", default="")
+
+
+@contextmanager
+def agendamento(classe: str, dono: str = ""):
+    """
+    Define a classe de prioridade e o dono das chamadas feitas dentro do bloco:
+
+        with limites.agendamento(limites.LOTE, dono="ingestao"):
+            ...
+    """
+    token_classe, token_dono = _classe.set(classe), _dono.set(dono)
+    try:
+        yield
+    finally:
+        _classe.reset(token_classe)
+        _dono.reset(token_dono)
+
+
+# -----------------------------------------------------------
+# II. CLASSE BaldeFichas (Requisições ou tokens por minuto)
+# -----------------------------------------------------------
+
+class BaldeFichas:
+    """
+    Balde de fichas: repõe `por_minuto` fichas por minuto, acumulando até
+    `capacidade` (rajada). Um pedido maior que a capacidade passa com o balde
+    cheio e deixa o saldo negativo, atrasando os seguintes.
+    Não é thread-safe: o AgendadorProvedor chama sob o próprio lock.
+    """
+    def __init__(self, por_minuto: float, capacidade: Optional[float] = None):
+        self.por_minuto = por_minuto
+        self.capacidade = capacidade or max(1.0, por_minuto / 60.0)
+        self.fichas = self.capacidade
+        self._ultimo = time.monotonic()
+
+    @property
+    def ativo(self) -> bool:
+        return self.por_minuto > 0
+
+    def _repor(self, agora: float) -> None:
+        self.fichas = min(self.capacidade, self.fichas + (agora - self._ultimo) * self.por_minuto / 60.0)
+        self._ultimo = agora
+
+    def espera(self, quantidade: float, agora: float) -> float:
+        """Segundos até o pedido caber no balde (0 = já cabe)."""
+        if not self.ativo:
+            return 0.0
+        self._repor(agora)
+        falta = min(quantidade, self.capacidade) - self.fichas
+        return max(0.0, falta * 60.0 / self.por_minuto)
+
+    def consumir(self, quantidade: float) -> None:
+        if self.ativo:
+            self.fichas -= quantidade
+
+
+# -----------------------------------------------------------
+# III. CLASSE AgendadorProvedor (Fila justa sobre os baldes)
+# -----------------------------------------------------------
+
+class _Pedido:
+    __slots__ = ("tokens", "classe", "dono")
+
+    def __init__(self, tokens: float, classe: str, dono: str):
+        self.tokens, self.classe, self.dono = tokens, classe, dono
+
+
+class AgendadorProvedor:
+    """
+    Libera as chamadas a um provedor dentro dos limites de requisições e de tokens
+    por minuto. Quem não cabe espera numa fila justa (start-time fair queuing):
+    cada par (classe, dono) avança um "relógio virtual" proporcional ao consumo
+    dividido pelo peso da classe, e a fila atende o menor relógio. Assim a
+    interface recebe a maior parte da cota, sem deixar os lotes parados, e uma
+    tarefa grande não monopoliza o provedor.
+    """
+    def __init__(self, provedor: str, rpm: float = 0, tpm: float = 0):
+        self.provedor = provedor
+        self.requisicoes = BaldeFichas(rpm)
+        self.tokens = BaldeFichas(tpm)
+        self._cond = threading.Condition()
+        self._fila: List = []
+        self._sequencia = itertools.count()
+        self._tempo_virtual = 0.0
+        self._fim_por_dono: Dict = {}
+        self._pausado_ate = 0.0
+        self._contadores = {"liberadas": 0, "esperas": 0, "espera_s": 0.0, "pausas_429": 0}
+
+    @property
+    def rpm(self) -> float:
+        return self.requisicoes.por_minuto
+
+    @property
+    def tpm(self) -> float:
+        return self.tokens.por_minuto
+
+    def _enfileirar(self, pedido: _Pedido) -> tuple:
+        chave = (pedido.classe, pedido.dono)
+        inicio = max(self._tempo_virtual, self._fim_por_dono.get(chave, 0.0))
+        # Custo: a requisição mais um por milhar de tokens
+        custo = 1.0 + pedido.tokens / 1000.0
+        self._fim_por_dono[chave] = inicio + custo / PESOS_CLASSES.get(pedido.classe, 1.0)
+        item = (inicio, next(self._sequencia), pedido)
+        heapq.heappush(self._fila, item)
+        return item
+
+    def _liberar(self, item: tuple) -> None:
+        heapq.heappop(self._fila)
+        self._tempo_virtual = item[0]
+        self.requisicoes.consumir(1)
+        self.tokens.consumir(item[2].tokens)
+        if len(self._fim_por_dono) > 1000:
+            self._fim_por_dono = {c: fim for c, fim in self._fim_por_dono.items() if fim > self._tempo_virtual}
+        self._cond.notify_all()
+
+    def aguardar(self, tokens: float = 0, classe: Optional[str] = None, dono: Optional[str] = None) -> float:
+        """Bloqueia até a vez desta chamada. Retorna o tempo de espera (s)."""
+        with self._cond:
+            if not (self.requisicoes.ativo or self.tokens.ativo) and self._pausado_ate <= time.monotonic():
+                return 0.0
+            chegada = time.monotonic()
+            item = self._enfileirar(_Pedido(tokens, classe or _classe.get(), _dono.get() if dono is None else dono))
+            try:
+                while True:
+                    if self._fila[0] is not item:
+                        # Só o primeiro da fila acompanha os baldes; os demais esperam a vez
+                        self._cond.wait()
+                        continue
+                    agora = time.monotonic()
+                    espera = max(self._pausado_ate - agora, self.requisicoes.espera(1, agora),
+                                 self.tokens.espera(tokens, agora))
+                    if espera <= 0:
+                        self._liberar(item)
+                        break
+                    self._cond.wait(espera)
+            except BaseException:
+                # Chamada interrompida: sai da fila sem travar quem vem atrás
+                if item in self._fila:
+                    self._fila.remove(item)
+                    heapq.heapify(self._fila)
+                    self._cond.notify_all()
+                raise
+            espera = time.monotonic() - chegada
+            self._contadores["liberadas"] += 1
+            if espera > 0.001:
+                self._contadores["esperas"] += 1
+                self._contadores["espera_s"] += espera
+            return espera
+
+    def registrar_uso(self, tokens_estimados: float, tokens_reais: float) -> None:
+        """Corrige o balde de tokens com o consumo informado pela API."""
+        with self._cond:
+            self.tokens.consumir(tokens_reais - tokens_estimados)
+
+    def pausar(self, segundos: float) -> None:
+        """Segura toda a fila do provedor (ex: após um 429)."""
+        with self._cond:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+            self._contadores["pausas_429"] += 1
+            self._cond.notify_all()
+
+    def estado(self) -> Dict:
+        with self._cond:
+            return dict(self._contadores, espera_s=round(self._contadores["espera_s"], 3), fila=len(self._fila),
+                        rpm=self.rpm, tpm=self.tpm)
+
+
+# -----------------------------------------------------------
+# IV. REGISTRO GLOBAL E API DOS CLIENTES
+# -----------------------------------------------------------
+
+# Criados no primeiro uso: o app copia as secrets para o ambiente depois dos imports
+_agendadores: Dict[str, AgendadorProvedor] = {}
+_lock_registro = threading.Lock()
+
+
+def agendador(provedor: str) -> AgendadorProvedor:
+    with _lock_registro:
+        if provedor not in _agendadores:
+            _agendadores[provedor] = AgendadorProvedor(provedor, _rpm_configurado(provedor), _tpm_configurado(provedor))
+        return _agendadores[provedor]
+
+
+def configurar_limite(provedor: str, rpm: Optional[float] = None, tpm: Optional[float] = None) -> None:
+    """Redefine os limites de requisições e/ou tokens por minuto de um provedor (None = mantém)."""
+    atual = agendador(provedor)
+    with _lock_registro:
+        _agendadores[provedor] = AgendadorProvedor(provedor, atual.rpm if rpm is None else rpm,
+                                                   atual.tpm if tpm is None else tpm)
+
+
+def aguardar(provedor: str, tokens: float = 0) -> float:
+    """Aguarda a liberação de uma requisição (de `tokens` tokens estimados) para o provedor informado."""
+    espera = agendador(provedor).aguardar(tokens)
+    if espera > 0.001:
+        metricas.registro.registrar("espera_limite", espera, {"provedor": provedor, "classe": _classe.get()})
+    return espera
+
+
+def registrar_uso(provedor: str, tokens_estimados: float, tokens_reais: Optional[float]) -> None:
+    """Informa o consumo real de tokens de uma chamada liberada com `tokens_estimados`."""
+    if tokens_reais is not None:
+        agendador(provedor).registrar_uso(tokens_estimados, tokens_reais)
+
+
+def limite_excedido(erro: Exception) -> bool:
+    """True se a exceção corresponde a um 429 / cota excedida (OpenAI, Gemini ou requests)."""
+    resposta = getattr(erro, "response", None)
+    status = getattr(erro, "status_code", None) or getattr(erro, "code", None) or getattr(resposta, "status_code", None)
+    return status == 429 or type(erro).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def _retry_after(erro: Exception) -> Optional[float]:
+    headers = getattr(getattr(erro, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def penalizar(provedor: str, tentativa: int = 0, segundos: Optional[float] = None) -> float:
+    """Pausa a fila do provedor após um 429 (Retry-After ou backoff exponencial com jitter)."""
+    if segundos is None:
+        segundos = PAUSA_BASE_S * (2 ** tentativa) * random.uniform(0.5, 1.0)
+    segundos = min(PAUSA_MAXIMA_S, segundos)
+    agendador(provedor).pausar(segundos)
+    return segundos
+
+
+def executar(provedor: str, funcao: Callable, *args, tokens: float = 0, **kwargs):
+    """
+    Executa funcao(*args, **kwargs) na vez desta chamada. Em 429 devolve os tokens
+    reservados, pausa o provedor e volta para a fila, até TENTATIVAS_LIMITE vezes;
+    outras exceções são propagadas.
+    """
+    for tentativa in range(TENTATIVAS_LIMITE + 1):
+        aguardar(provedor, tokens)
+        try:
+            return funcao(*args, **kwargs)
+        except Exception as e:
+            if tentativa == TENTATIVAS_LIMITE or not limite_excedido(e):
+                raise
+            # A chamada recusada não gastou tokens: devolve a reserva antes de voltar para a fila,
+            # senão cada nova tentativa cobraria a estimativa de novo
+            registrar_uso(provedor, tokens, 0)
+            espera = penalizar(provedor, tentativa, _retry_after(e))
+            print(f"⚠️ {provedor}: limite de taxa excedido (429). Chamada volta para a fila em {espera:.1f}s.")
+
+
+def estado() -> Dict[str, float]:
+    """Contadores por provedor (exportados como métricas)."""
+    with _lock_registro:
+        agendadores = list(_agendadores.values())
+    return {f"{a.provedor}_{chave}": valor for a in agendadores for chave, valor in a.estado().items()}
+
+
+metricas.registro.registrar_fonte("limites", estado)
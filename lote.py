@@ -0,0 +1,163 @@
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Set
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import limites
+from metricas import copiar_contexto, servir_prometheus
+
+
+# -----------------------------------------------------------
+# I. LEITURA DAS ENTRADAS (JSONL ou CSV)
+# -----------------------------------------------------------
+
+def ler_entradas(caminho: str) -> Iterator[Dict]:
+    """
+    Lê os textos a revisar. Cada registro aceita os campos:
+    id (opcional), texto, colecao (opcional) e instrucao (opcional).
+    Sem id, usa o hash do texto para permitir a retomada. O arquivo é lido sob demanda,
+    um registro por vez, sem carregar a entrada inteira em memória.
+    """
+    csv_entrada = caminho.lower().endswith(".csv")
+    with open(caminho, newline="" if csv_entrada else None, encoding="utf-8") as f:
+        registros = csv.DictReader(f) if csv_entrada else (json.loads(linha) for linha in f if linha.strip())
+        for registro in registros:
+            texto = (registro.get("texto") or "").strip()
+            if not texto:
+                continue
+            yield {
+                "id": str(registro.get("id") or hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]),
+                "texto": texto,
+                "colecao": registro.get("colecao") or None,
+                "instrucao": registro.get("instrucao") or "",
+            }
+
+
+def ids_concluidos(caminho_saida: str) -> Set[str]:
+    """Lê o arquivo de saída existente (checkpoint) e retorna os ids já processados com sucesso."""
+    concluidos = set()
+    if not os.path.exists(caminho_saida):
+        return concluidos
+    with open(caminho_saida, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                continue  # Linha truncada por uma interrupção anterior
+            if not registro.get("erro"):
+                concluidos.add(registro["id"])
+    return concluidos
+
+
+# -----------------------------------------------------------
+# II. PROCESSAMENTO DE UM ITEM
+# -----------------------------------------------------------
+
+def processar_item(item: Dict) -> Dict:
+    """Executa reescrever_revisor -> ajuste_incremental para um único texto."""
+    from revisor import reescrever_revisor, ajuste_incremental
+
+    inicio = time.perf_counter()
+    resultado = {"id": item["id"], "colecao": item["colecao"] or "Automática", "erro": None}
+    try:
+        revisao = reescrever_revisor(item["texto"], colecao_override=item["colecao"])
+        resultado["revisao"] = revisao.para_dict()
+        if not revisao.ok:
+            resultado["erro"] = revisao.mensagem_erro
+        elif item["instrucao"]:
+            resultado["resultado_final"] = ajuste_incremental(revisao.texto, item["instrucao"])
+        else:
+            resultado["resultado_final"] = revisao.texto
+    except Exception as e:
+        resultado["erro"] = f"ERRO no processamento em lote: {str(e)}"
+    resultado["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+# -----------------------------------------------------------
+# III. EXECUÇÃO EM LOTE (Concorrência limitada + checkpoint)
+# -----------------------------------------------------------
+
+def executar_lote(caminho_entrada: str, caminho_saida: str, concorrencia: int = 4,
+                  colecao_padrao: Optional[str] = None, instrucao_padrao: str = "") -> Dict[str, int]:
+    """
+    Processa todas as entradas com no máximo `concorrencia` itens em paralelo,
+    gravando cada resultado como uma linha JSONL assim que fica pronto.
+    Itens já concluídos no arquivo de saída são pulados (retomada).
+    """
+    concluidos = ids_concluidos(caminho_saida)
+    # Gerador: as entradas são lidas conforme as vagas de execução são liberadas
+    pendentes = (
+        dict(item, colecao=item["colecao"] or colecao_padrao, instrucao=item["instrucao"] or instrucao_padrao)
+        for item in ler_entradas(caminho_entrada)
+        if item["id"] not in concluidos
+    )
+
+    print(f"✅ Lote: {len(concluidos)} já concluídos serão pulados.")
+    contagem = {"sucesso": 0, "erro": 0, "pulados": len(concluidos)}
+    lock_saida = threading.Lock()
+    vagas = threading.BoundedSemaphore(concorrencia * 2)
+
+    with open(caminho_saida, "a", encoding="utf-8") as saida:
+        def gravar(futuro):
+            try:
+                resultado = futuro.result()
+                with lock_saida:
+                    saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+                    saida.flush()
+                    contagem["erro" if resultado["erro"] else "sucesso"] += 1
+                    print(f"[{contagem['sucesso'] + contagem['erro']}] {resultado['id']} "
+                          f"{'❌' if resultado['erro'] else '✅'} ({resultado['duracao_s']}s)")
+            finally:
+                # Libera a vaga mesmo se a gravação falhar, para o lote não travar
+                vagas.release()
+
+        # Chamadas aos provedores com prioridade de lote: a interface passa na frente na fila das cotas
+        with limites.agendamento(limites.LOTE, dono="lote"), \
+                ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="lote") as executor:
+            for item in pendentes:
+                # Limita os itens em memória aguardando execução
+                vagas.acquire()
+                try:
+                    futuro = executor.submit(copiar_contexto(processar_item), item)
+                except Exception:
+                    vagas.release()
+                    raise
+                futuro.add_done_callback(gravar)
+
+    print(f"✅ Lote finalizado. Sucesso: {contagem['sucesso']}. Erros: {contagem['erro']}. Pulados: {contagem['pulados']}.")
+    return contagem
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revisão em lote de textos (reescrever_revisor + ajuste_incremental).")
+    parser.add_argument("entrada", help="Arquivo JSONL ou CSV com os campos id, texto, colecao, instrucao.")
+    parser.add_argument("saida", help="Arquivo JSONL de resultados (também usado como checkpoint).")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--colecao", default=None, help="Coleção padrão para itens sem 'colecao' (ex: PRODUTO).")
+    parser.add_argument("--instrucao", default="", help="Instrução incremental padrão para itens sem 'instrucao'.")
+    parser.add_argument("--metricas-porta", type=int, default=None, help="Porta do endpoint Prometheus deste processo.")
+    for provedor in limites.PROVEDORES:
+        parser.add_argument(f"--rpm-{provedor}", type=float, default=None,
+                            help=f"Limite de requisições por minuto para {provedor}.")
+        parser.add_argument(f"--tpm-{provedor}", type=float, default=None,
+                            help=f"Limite de tokens por minuto para {provedor}.")
+    args = parser.parse_args()
+
+    if args.metricas_porta:
+        servir_prometheus(args.metricas_porta)
+    for provedor in limites.PROVEDORES:
+        rpm, tpm = getattr(args, f"rpm_{provedor}"), getattr(args, f"tpm_{provedor}")
+        if rpm is not None or tpm is not None:
+            limites.configurar_limite(provedor, rpm, tpm)
+
+    executar_lote(args.entrada, args.saida, concorrencia=args.concorrencia,
+                  colecao_padrao=args.colecao, instrucao_padrao=args.instrucao)
@@ -1,21 +1,25 @@
 import streamlit as st
 import os
-import openai
-import os
-import json
-import hashlib
-from typing import List, Dict, Optional
-import sys
-from revisor import reescrever_revisor, get_embedding, ajuste_incremental 
-if st.secrets:
+from saida_estruturada import ResultadoRevisao, ERRO_EXECUCAO
+from revisor import get_modelo_texto, get_cliente_busca
+from fila import get_fila, FINALIZADOS
+import metricas
+
+try:
+    # Sem .streamlit/secrets.toml o acesso a st.secrets levanta exceção
+    possui_secrets = bool(st.secrets)
+except Exception:
+    possui_secrets = False
+
+if possui_secrets:
     for key, value in st.secrets.items():
-        # Verifica se o valor é uma string e não o nome da seção
-        if isinstance(value, str):
-            os.environ[key] = value
-        # Se for uma seção (como [connections]), itera pelos itens
+        # Verifica se o valor é simples (texto ou número, ex: LIMITE_OPENAI_RPM) e não o nome da seção
+        if isinstance(value, (str, int, float)):
+            os.environ[key] = str(value)
+        # Se for uma seção (como [connections] ou [limites]), itera pelos itens
         elif isinstance(value, dict):
              for sub_key, sub_value in value.items():
-                os.environ[sub_key] = sub_value
+                os.environ[sub_key] = str(sub_value)
                 
     # Confirma o carregamento (Opcional, mas útil para debug)
     if not os.getenv("OPENAI_API_KEY"):
@@ -39,6 +43,36 @@ else:
     st.success("✅ Variáveis de Ambiente OK. Pronto para rodar o RAG.")
 st.markdown("---")
 
+
+# --- Clientes criados uma única vez por processo (compartilhados entre sessões) ---
+@st.cache_resource(show_spinner="Inicializando clientes (OpenAI / Astra DB)...")
+def aquecer_clientes():
+    try:
+        return get_modelo_texto(), get_cliente_busca()
+    except Exception as e:
+        # Sem credenciais o app continua abrindo; o erro reaparece na execução do pipeline
+        print(f"❌ Falha ao inicializar os clientes: {e}")
+        return None
+
+
+aquecer_clientes()
+
+
+# --- Endpoint Prometheus (METRICAS_PORTA), só neste processo ---
+@st.cache_resource
+def iniciar_metricas():
+    metricas.servir_prometheus()
+
+
+iniciar_metricas()
+
+
+# --- Fila de revisões: o pipeline roda nos workers, a UI apenas submete e acompanha ---
+@st.cache_resource
+def obter_fila():
+    return get_fila()
+
+
 # --- Variáveis de Estado (Simples) ---
 if 'saida_final' not in st.session_state:
     st.session_state.saida_final = ""
@@ -46,28 +80,14 @@ if 'ajustes_tecnicos' not in st.session_state:
     st.session_state.ajustes_tecnicos = "Nenhum ajuste técnico realizado."
 if 'colecao_usada' not in st.session_state:
     st.session_state.colecao_usada = "N/A"
-
-# --- FUNÇÃO AUXILIAR PARA PARSEAR A SAÍDA DO RAG ---
-# Como reescrever_revisor retorna uma string única, precisamos extrair o texto final e os ajustes.
-def parse_rag_output(full_response: str, colecao: str) -> dict:
-    if "Erro na classificação" in full_response or "Erro fatal na geração do Embedding" in full_response:
-        return {
-            "texto_final": full_response,
-            "ajustes_tecnicos": "Falha na Etapa RAG.",
-            "colecao_usada": colecao
-        }
-
-    # Tenta separar o texto principal dos ajustes técnicos
-    partes = full_response.split("🛠️ Ajustes Técnicos e Correções")
-    texto_final = partes[0].strip() if partes else full_response
-    ajustes_tecnicos = partes[1].strip() if len(partes) > 1 else "Não foi possível extrair a seção de Ajustes Técnicos."
-        
-    return {
-        "texto_final": texto_final,
-        "ajustes_tecnicos": ajustes_tecnicos,
-        "colecao_usada": colecao
-    }
-
+if 'rastro_metricas' not in st.session_state:
+    st.session_state.rastro_metricas = []
+if 'tarefa_id' not in st.session_state:
+    st.session_state.tarefa_id = None
+if 'mensagens' not in st.session_state:
+    st.session_state.mensagens = []
+if 'tempos_etapas' not in st.session_state:
+    st.session_state.tempos_etapas = {}
 
 # --- 1. Seção de Entradas ---
 st.header("Entradas do Usuário")
@@ -106,50 +126,87 @@ with col2:
 
 st.markdown("---")
 
+def aplicar_resultado(tarefa: dict) -> None:
+    """Copia o resultado de uma tarefa finalizada da fila para o estado da sessão."""
+    resultado = tarefa["resultado"] or {}
+    instrucao = tarefa["entrada"]["instrucao"]
+    colecao = tarefa["entrada"]["colecao"]
+    mensagens = []
+
+    # 🟢 PASSO 1: REVISÃO RAG — resultado estruturado (texto, fontes, ajustes, erro)
+    if resultado.get("revisao"):
+        revisao = ResultadoRevisao.de_dict(resultado["revisao"])
+    else:
+        revisao = ResultadoRevisao.falha(ERRO_EXECUCAO, tarefa["erro"] or "Tarefa finalizada sem resultado.")
+    st.session_state.colecao_usada = revisao.colecao or colecao
+    st.session_state.tempos_etapas = revisao.tempos_ms
+
+    if not revisao.ok:
+        final_text = revisao.mensagem_erro
+        st.session_state.ajustes_tecnicos = "Falha na Etapa RAG."
+        mensagens.append(("error", f"❌ Erro na Etapa RAG ({revisao.erro}): {revisao.mensagem_erro}"))
+    else:
+        final_text = revisao.texto
+        st.session_state.ajustes_tecnicos = revisao.secao_ajustes()
+        mensagens.append(("success", f"✅ Etapa 1 (RAG) Concluída. Coleção utilizada: {st.session_state.colecao_usada}"))
+        if revisao.cache:
+            mensagens.append(("caption", f"⚡ Revisão recuperada do cache ({revisao.cache})."))
+
+    # 🟠 PASSO 2: AJUSTE INCREMENTAL
+    if instrucao and revisao.ok and not resultado.get("erro_ajuste"):
+        final_text = resultado.get("resultado_final", final_text)
+        mensagens.append(("success", "✨ Ajuste Incremental Aplicado."))
+        if resultado.get("cache_ajuste"):
+            mensagens.append(("caption", f"⚡ Ajuste recuperado do cache ({resultado['cache_ajuste']})."))
+        st.session_state.ajustes_tecnicos += "\n\n--- AJUSTE INCREMENTAL ---\nInstrução Adicional Aplicada."
+        if resultado.get("relatorio_ajuste"):
+            st.session_state.ajustes_tecnicos += "\n\n" + resultado["relatorio_ajuste"]
+    elif instrucao and revisao.ok:
+        mensagens.append(("warning", f"Instrução incremental não aplicada: {resultado['erro_ajuste']}"))
+    elif instrucao:
+        mensagens.append(("warning", "Instrução incremental ignorada devido a um erro na etapa RAG."))
+
+    # 🏁 ATUALIZAÇÃO FINAL
+    st.session_state.saida_final = final_text
+    st.session_state.rastro_metricas = resultado.get("metricas", [])
+    st.session_state.mensagens = mensagens
+    st.session_state.tarefa_id = None
+
+
 if st.button("Aplicar Correção", type="primary"):
     
     if not texto_base:
         st.warning("Por favor, insira um Texto Base para revisão.")
     else:
-        # Inicializa o resultado final com o texto base em caso de falha
-        final_text = texto_base
-
-        # ----------------------------------------------------
-        # 🟢 PASSO 1: REVISÃO RAG (reescrever_revisor)
-        # ----------------------------------------------------
-        with st.spinner(f"1/2 Processando RAG na coleção: {colecao_selecionada}..."):
-            # CHAMA A FUNÇÃO CENTRAL DO RAG
-            rag_output_str = reescrever_revisor(texto_base, colecao_override=colecao_selecionada)
-            
-            # PARSEA A SAÍDA PARA SEPARAR O TEXTO FINAL E OS AJUSTES
-            resultado_rag_parse = parse_rag_output(rag_output_str, colecao_selecionada)
-            
-            st.session_state.ajustes_tecnicos = resultado_rag_parse["ajustes_tecnicos"]
-            st.session_state.colecao_usada = resultado_rag_parse["colecao_usada"]
-            final_text = resultado_rag_parse["texto_final"]
-            
-            if "Erro" in final_text:
-                st.error(f"❌ Erro na Etapa RAG: {final_text}")
-            else:
-                st.success(f"✅ Etapa 1 (RAG) Concluída. Coleção utilizada: {st.session_state.colecao_usada}")
-
-        # ----------------------------------------------------
-        # 🟠 PASSO 2: AJUSTE INCREMENTAL (ajuste_incremental)
-        # ----------------------------------------------------
-        if instrucao_incremental and "Erro" not in final_text:
-            with st.spinner("2/2 Aplicando Ajuste Incremental..."):
-                final_text = ajuste_incremental(final_text, instrucao_incremental)
-            
-            st.success("✨ Ajuste Incremental Aplicado.")
-            st.session_state.ajustes_tecnicos += "\n\n--- AJUSTE INCREMENTAL ---\nInstrução Adicional Aplicada."
-        elif instrucao_incremental and "Erro" in final_text:
-             st.warning("Instrução incremental ignorada devido a um erro na etapa RAG.")
-
-
-        # ----------------------------------------------------
-        # 🏁 ATUALIZAÇÃO FINAL
-        # ----------------------------------------------------
-        st.session_state.saida_final = final_text
+        # Submete à fila; textos idênticos em andamento reaproveitam a mesma tarefa
+        st.session_state.tarefa_id = obter_fila().submeter(texto_base, colecao_selecionada, instrucao_incremental)
+        st.session_state.mensagens = []
+
+
+@st.fragment(run_every=0.5)
+def acompanhar_tarefa():
+    """Atualiza progresso e pré-visualização da tarefa em andamento sem bloquear a sessão."""
+    if not st.session_state.tarefa_id:
+        return
+    tarefa = obter_fila().consultar(st.session_state.tarefa_id)
+    if tarefa is None:
+        st.session_state.tarefa_id = None
+        st.error("❌ Tarefa não encontrada na fila.")
+        return
+    if tarefa["estado"] in FINALIZADOS:
+        aplicar_resultado(tarefa)
+        st.rerun()
+
+    etapa = tarefa["etapa"] or "aguardando na fila"
+    st.progress(tarefa["progresso"], text=f"Processando na coleção: {tarefa['entrada']['colecao']} — etapa: {etapa}")
+    # Pré-visualização do texto revisado conforme os tokens chegam
+    st.markdown(tarefa["parcial"])
+
+
+acompanhar_tarefa()
+
+for tipo, mensagem in st.session_state.mensagens:
+    getattr(st, tipo)(mensagem)
 
 st.markdown("---")
 
@@ -170,3 +227,16 @@ st.code(
     f"Coleção RAG Utilizada: {st.session_state.colecao_usada}\n\n" + st.session_state.ajustes_tecnicos,
     language='markdown'
 )
+
+# --- 3. Painel de Métricas (Debug) ---
+with st.expander("🔎 Métricas do Pipeline (Debug)"):
+    if st.session_state.rastro_metricas:
+        st.markdown("**Última execução (por etapa):**")
+        st.dataframe(st.session_state.rastro_metricas, use_container_width=True)
+        if st.session_state.tempos_etapas:
+            st.markdown("**Tempos da revisão (ms):**")
+            st.json(st.session_state.tempos_etapas)
+    else:
+        st.caption("Nenhuma execução registrada nesta sessão.")
+    st.markdown("**Agregado do processo:**")
+    st.json(metricas.registro.resumo())
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DAS MÉTRICAS
+# -----------------------------------------------------------
+
+# Arquivo JSON lines onde cada etapa concluída é registrada (vazio = desativado)
+METRICAS_JSONL = os.getenv("METRICAS_JSONL", "")
+# Porta do endpoint no formato Prometheus (vazio = desativado), iniciado pela interface (main.py);
+# os processos de linha de comando usam --metricas-porta, para não disputarem a mesma porta
+METRICAS_PORTA = os.getenv("METRICAS_PORTA", "")
+# Endereço do endpoint: só a máquina local por padrão (0.0.0.0 expõe para a rede)
+METRICAS_HOST = os.getenv("METRICAS_HOST", "127.0.0.1")
+# Limites (em segundos) dos buckets do histograma de latência
+BUCKETS_LATENCIA = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# Atributos numéricos que são contagens (exportados como contadores), pelo nome ou pelo prefixo
+# (ex: tokens_prompt, caracteres_resposta). Booleanos (ex: cache_hit) também são contados;
+# atributos terminados em _ms são latências. Os demais (ex: similaridade, limite) só vão para os eventos.
+ATRIBUTOS_CONTAGEM = {"tokens", "documentos", "textos", "caracteres", "bytes", "partes", "inseridos",
+                      "descartadas", "cache_hits", "paragrafos", "colecoes"}
+
+
+def _tipo_atributo(chave: str, valor) -> Optional[str]:
+    """"contador", "latencia" ou None (não agregado)."""
+    if isinstance(valor, bool):
+        return "contador"
+    if not isinstance(valor, (int, float)):
+        return None
+    if chave.endswith("_ms"):
+        return "latencia"
+    if chave in ATRIBUTOS_CONTAGEM or chave.split("_")[0] in ATRIBUTOS_CONTAGEM:
+        return "contador"
+    return None
+
+
+# -----------------------------------------------------------
+# II. REGISTRO DAS ETAPAS (Agregados + últimos eventos)
+# -----------------------------------------------------------
+
+class RegistroMetricas:
+    """Agrega duração, contagens e latências extras (ex: ttft_ms) de cada etapa do pipeline (thread-safe)."""
+    def __init__(self, max_eventos: int = 500):
+        self._lock = threading.Lock()
+        self._etapas: Dict[str, Dict] = {}
+        self.eventos = deque(maxlen=max_eventos)
+        self._fontes: Dict[str, Callable[[], Dict]] = {}
+
+    def registrar(self, etapa: str, duracao: float, atributos: Dict) -> Dict:
+        evento = {"etapa": etapa, "inicio": time.time() - duracao, "duracao_ms": round(duracao * 1000, 2)}
+        evento.update(atributos)
+        with self._lock:
+            agregado = self._etapas.setdefault(etapa, {
+                "contagem": 0, "soma_s": 0.0, "buckets": [0] * len(BUCKETS_LATENCIA), "totais": {}, "latencias": {}
+            })
+            agregado["contagem"] += 1
+            agregado["soma_s"] += duracao
+            for i, limite in enumerate(BUCKETS_LATENCIA):
+                if duracao <= limite:
+                    agregado["buckets"][i] += 1
+            for chave, valor in atributos.items():
+                tipo = _tipo_atributo(chave, valor)
+                if tipo == "contador":
+                    agregado["totais"][chave] = agregado["totais"].get(chave, 0) + valor
+                elif tipo == "latencia":
+                    soma, quantidade = agregado["latencias"].get(chave, (0.0, 0))
+                    agregado["latencias"][chave] = (soma + valor / 1000.0, quantidade + 1)
+            self.eventos.append(evento)
+        if METRICAS_JSONL:
+            with self._lock, open(METRICAS_JSONL, "a", encoding="utf-8") as f:
+                f.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+        return evento
+
+    def registrar_fonte(self, nome: str, funcao: Callable[[], Dict]) -> None:
+        """Registra uma função que fornece métricas extras (ex: transporte HTTP do Astra)."""
+        self._fontes[nome] = funcao
+
+    def resumo(self) -> Dict[str, Dict]:
+        """Contagem, latência média, totais das contagens e média das latências extras por etapa."""
+        with self._lock:
+            return {
+                etapa: {
+                    "contagem": a["contagem"],
+                    "media_ms": round(a["soma_s"] / a["contagem"] * 1000, 2),
+                    **a["totais"],
+                    **{f"media_{chave}": round(soma / quantidade * 1000, 2)
+                       for chave, (soma, quantidade) in a["latencias"].items()},
+                }
+                for etapa, a in self._etapas.items()
+            }
+
+    def exportar_prometheus(self) -> str:
+        """Exporta os agregados no formato texto do Prometheus."""
+        linhas = [
+            "# HELP revisor_etapa_duracao_segundos Duração das etapas do pipeline RAG.",
+            "# TYPE revisor_etapa_duracao_segundos histogram",
+        ]
+        with self._lock:
+            etapas = {k: dict(v, totais=dict(v["totais"]), latencias=dict(v["latencias"])) for k, v in self._etapas.items()}
+        for etapa, a in etapas.items():
+            for limite, quantidade in zip(BUCKETS_LATENCIA, a["buckets"]):
+                linhas.append(f'revisor_etapa_duracao_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {quantidade}')
+            linhas.append(f'revisor_etapa_duracao_segundos_bucket{{etapa="{etapa}",le="+Inf"}} {a["contagem"]}')
+            linhas.append(f'revisor_etapa_duracao_segundos_sum{{etapa="{etapa}"}} {a["soma_s"]:.6f}')
+            linhas.append(f'revisor_etapa_duracao_segundos_count{{etapa="{etapa}"}} {a["contagem"]}')
+        nomes = sorted({chave for a in etapas.values() for chave in a["totais"]})
+        for chave in nomes:
+            linhas.append(f"# TYPE revisor_etapa_{chave}_total counter")
+            for etapa, a in etapas.items():
+                if chave in a["totais"]:
+                    linhas.append(f'revisor_etapa_{chave}_total{{etapa="{etapa}"}} {float(a["totais"][chave])}')
+        nomes = sorted({chave for a in etapas.values() for chave in a["latencias"]})
+        for chave in nomes:
+            metrica = f"revisor_etapa_{chave[:-len('_ms')]}_segundos"
+            linhas.append(f"# TYPE {metrica} summary")
+            for etapa, a in etapas.items():
+                if chave in a["latencias"]:
+                    soma, quantidade = a["latencias"][chave]
+                    linhas.append(f'{metrica}_sum{{etapa="{etapa}"}} {soma:.6f}')
+                    linhas.append(f'{metrica}_count{{etapa="{etapa}"}} {quantidade}')
+        for nome, funcao in self._fontes.items():
+            try:
+                valores = funcao()
+            except Exception:
+                continue
+            for chave, valor in valores.items():
+                if isinstance(valor, (int, float)):
+                    linhas.append(f'revisor_{nome}_{chave} {float(valor)}')
+        return "\n".join(linhas) + "\n"
+
+
+registro = RegistroMetricas()
+
+# Rastro (lista de eventos) da requisição em andamento; propagado às threads via contextvars
+_rastro: contextvars.ContextVar = contextvars.ContextVar("rastro_metricas", default=None)
+# Função chamada no início (evento None) e no fim de cada etapa (ex: progresso de uma tarefa da fila)
+_observador: contextvars.ContextVar = contextvars.ContextVar("observador_etapas", default=None)
+
+
+# -----------------------------------------------------------
+# III. API DE INSTRUMENTAÇÃO
+# -----------------------------------------------------------
+
+@contextmanager
+def span(etapa: str, **atributos):
+    """
+    Mede a duração de uma etapa. Atributos podem ser acrescentados dentro do bloco:
+
+        with span("embedding", textos=1) as attrs:
+            attrs["cache_hit"] = True
+    """
+    observador = _observador.get()
+    if observador is not None:
+        observador(etapa, None)
+    inicio = time.perf_counter()
+    try:
+        yield atributos
+    except Exception as e:
+        atributos["erro"] = type(e).__name__
+        raise
+    finally:
+        evento = registro.registrar(etapa, time.perf_counter() - inicio, atributos)
+        rastro = _rastro.get()
+        if rastro is not None:
+            rastro.append(evento)
+        if observador is not None:
+            observador(etapa, evento)
+
+
+def iniciar_rastro() -> List[Dict]:
+    """Inicia um rastro para a requisição atual (contexto atual e tarefas submetidas com copiar_contexto)."""
+    rastro = []
+    _rastro.set(rastro)
+    return rastro
+
+
+def observar_etapas(funcao: Optional[Callable[[str, Optional[Dict]], None]]) -> None:
+    """Registra, para o contexto atual, uma função chamada ao iniciar e ao concluir cada etapa."""
+    _observador.set(funcao)
+
+
+def rastro_atual() -> List[Dict]:
+    return list(_rastro.get() or [])
+
+
+@contextmanager
+def coletar_etapas():
+    """
+    Coleta os eventos das etapas concluídas dentro do bloco (inclusive nas tarefas
+    submetidas com copiar_contexto). Ao sair, os eventos também entram no rastro atual.
+    """
+    anterior = _rastro.get()
+    eventos: List[Dict] = []
+    token = _rastro.set(eventos)
+    try:
+        yield eventos
+    finally:
+        try:
+            _rastro.reset(token)
+        except ValueError:
+            # Bloco encerrado em outro contexto (ex: gerador fechado pelo coletor de lixo)
+            _rastro.set(anterior)
+        if anterior is not None:
+            anterior.extend(eventos)
+
+
+def tempos_por_etapa(eventos: List[Dict]) -> Dict[str, float]:
+    """Soma da duração (ms) dos eventos por etapa."""
+    tempos: Dict[str, float] = {}
+    for evento in eventos:
+        tempos[evento["etapa"]] = round(tempos.get(evento["etapa"], 0.0) + evento["duracao_ms"], 2)
+    return tempos
+
+
+def copiar_contexto(funcao: Callable) -> Callable:
+    """Envolve a função para rodar em outra thread mantendo o rastro atual."""
+    contexto = contextvars.copy_context()
+    return lambda *args, **kwargs: contexto.run(funcao, *args, **kwargs)
+
+
+# -----------------------------------------------------------
+# IV. ENDPOINT PROMETHEUS (Opcional)
+# -----------------------------------------------------------
+
+class _HandlerMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        corpo = registro.exportar_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+_servidor: Optional[ThreadingHTTPServer] = None
+
+
+def servir_prometheus(porta: Optional[int] = None, host: str = METRICAS_HOST) -> None:
+    """
+    Sobe (uma única vez por processo) o endpoint /metrics numa thread daemon.
+    Chamado explicitamente pelos pontos de entrada; sem porta (nem METRICAS_PORTA), não faz nada.
+    """
+    global _servidor
+    if porta is None:
+        # Lido na chamada: a interface copia as secrets para o ambiente depois dos imports
+        porta = os.getenv("METRICAS_PORTA", METRICAS_PORTA)
+        if not porta:
+            return
+        porta = int(porta)
+    if _servidor is not None:
+        return
+    try:
+        _servidor = ThreadingHTTPServer((host, porta), _HandlerMetricas)
+    except OSError as e:
+        print(f"⚠️ Endpoint de métricas não iniciado em {host}:{porta}: {e}")
+        return
+    threading.Thread(target=_servidor.serve_forever, daemon=True).start()
+    print(f"✅ Métricas Prometheus disponíveis em http://{host}:{porta}/metrics")
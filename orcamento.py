@@ -0,0 +1,227 @@
+import os
+import re
+from functools import lru_cache
+from typing import List, Dict, Optional, Set
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO ORÇAMENTO DE TOKENS
+# -----------------------------------------------------------
+
+# Teto de tokens do prompt de revisão completo (texto + contexto RAG + instruções)
+MAX_TOKENS_PROMPT = int(os.getenv("REVISOR_MAX_TOKENS_PROMPT", "6000"))
+# Teto de tokens do referencial teórico (RAG) dentro do prompt
+MAX_TOKENS_CONTEXTO = int(os.getenv("REVISOR_MAX_TOKENS_CONTEXTO", "1500"))
+# Teto de tokens de cada passagem recuperada
+MAX_TOKENS_PASSAGEM = int(os.getenv("REVISOR_MAX_TOKENS_PASSAGEM", "300"))
+# Textos de entrada maiores que isso são divididos em partes revisadas separadamente
+MAX_TOKENS_ENTRADA = int(os.getenv("REVISOR_MAX_TOKENS_ENTRADA", "3000"))
+# Fração de trigramas de palavras já presentes no contexto a partir da qual a passagem é descartada
+LIMIAR_SOBREPOSICAO = float(os.getenv("REVISOR_LIMIAR_SOBREPOSICAO", "0.6"))
+
+CODIFICACAO_PADRAO = "cl100k_base"
+
+
+# -----------------------------------------------------------
+# II. CONTAGEM DE TOKENS (tiktoken, se instalado; senão estimativa)
+# -----------------------------------------------------------
+
+@lru_cache(maxsize=8)
+def _codificador(modelo: Optional[str]):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(modelo) if modelo else tiktoken.get_encoding(CODIFICACAO_PADRAO)
+    except Exception:
+        try:
+            return tiktoken.get_encoding(CODIFICACAO_PADRAO)
+        except Exception:
+            return None
+
+
+def contar_tokens(texto: str, modelo: Optional[str] = None) -> int:
+    """Conta tokens com o tokenizer local do modelo; sem tiktoken, estima ~3 caracteres por token."""
+    codificador = _codificador(modelo)
+    if codificador is None:
+        return len(texto) // 3 + 1
+    return len(codificador.encode(texto, disallowed_special=()))
+
+
+# -----------------------------------------------------------
+# III. DIVISÃO E CORTE POR TOKENS
+# -----------------------------------------------------------
+
+_FIM_DE_FRASE = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def _unidades(texto: str) -> List[str]:
+    """Quebra o texto em parágrafos (linhas em branco); as frases ficam com _frases."""
+    return [p for p in re.split(r"\n\s*\n", texto) if p.strip()]
+
+
+def _frases(texto: str) -> List[str]:
+    """Quebra o texto em frases (pontuação final seguida de espaço)."""
+    return [f for f in _FIM_DE_FRASE.split(texto) if f.strip()]
+
+
+def _prefixo(texto: str, max_tokens: int, modelo: Optional[str] = None) -> str:
+    """Maior início do texto com até max_tokens, em palavras inteiras (em caracteres se nem a primeira couber)."""
+    if max_tokens <= 0:
+        return ""
+
+    def busca(fins: List[int]) -> int:
+        # Busca binária do maior prefixo que cabe (a contagem cresce com o tamanho do prefixo)
+        baixo, alto = 0, len(fins)
+        while baixo < alto:
+            meio = (baixo + alto + 1) // 2
+            if contar_tokens(texto[:fins[meio - 1]], modelo) <= max_tokens:
+                baixo = meio
+            else:
+                alto = meio - 1
+        return baixo
+
+    palavras = list(re.finditer(r"\S+", texto))
+    cabem = busca([m.end() for m in palavras])
+    fim = palavras[cabem - 1].end() if cabem else 0
+    if cabem < len(palavras) and contar_tokens(palavras[cabem].group(), modelo) > max_tokens:
+        # A próxima "palavra" nunca caberia inteira (ex: tabela ou URL sem espaços): corta em caracteres
+        inicio = palavras[cabem].start()
+        posicoes = list(range(inicio + 1, palavras[cabem].end() + 1))
+        cabem = busca(posicoes)
+        fim = posicoes[cabem - 1] if cabem else fim
+    return texto[:fim]
+
+
+def _fatiar(texto: str, max_tokens: int, modelo: Optional[str] = None) -> List[str]:
+    """Divide um trecho sem pontuação útil (ex: frase enorme) em fatias de até max_tokens."""
+    fatias = []
+    restante = texto.strip()
+    while restante:
+        fatia = _prefixo(restante, max_tokens, modelo) or restante[:1]
+        fatias.append(fatia.strip())
+        restante = restante[len(fatia):].strip()
+    return fatias
+
+
+def dividir_por_tokens(texto: str, max_tokens: int = MAX_TOKENS_ENTRADA, modelo: Optional[str] = None) -> List[str]:
+    """
+    Divide o texto em partes de até max_tokens, respeitando parágrafos e frases
+    (uma frase maior que o limite é fatiada por palavras).
+    Nenhum trecho é descartado: a junção das partes reproduz todo o conteúdo.
+    """
+    if contar_tokens(texto, modelo) <= max_tokens:
+        return [texto]
+
+    partes: List[str] = []
+    atual: List[str] = []
+    tokens_atual = 0
+
+    def fechar():
+        nonlocal atual, tokens_atual
+        if atual:
+            partes.append("\n\n".join(atual))
+        atual, tokens_atual = [], 0
+
+    for paragrafo in _unidades(texto):
+        tokens = contar_tokens(paragrafo, modelo)
+        if tokens > max_tokens:
+            # Parágrafo maior que o orçamento: agrupa por frases
+            fechar()
+            for frase in _frases(paragrafo):
+                tokens_frase = contar_tokens(frase, modelo)
+                if tokens_frase > max_tokens:
+                    # Frase maior que o orçamento: fatias próprias, por palavras
+                    if atual:
+                        partes.append(" ".join(atual))
+                        atual, tokens_atual = [], 0
+                    partes.extend(_fatiar(frase, max_tokens, modelo))
+                    continue
+                if atual and tokens_atual + tokens_frase > max_tokens:
+                    partes.append(" ".join(atual))
+                    atual, tokens_atual = [], 0
+                atual.append(frase)
+                tokens_atual += tokens_frase
+            if atual:
+                partes.append(" ".join(atual))
+            atual, tokens_atual = [], 0
+            continue
+        if atual and tokens_atual + tokens > max_tokens:
+            fechar()
+        atual.append(paragrafo)
+        tokens_atual += tokens
+    fechar()
+    return partes
+
+
+def cortar_por_tokens(texto: str, max_tokens: int, modelo: Optional[str] = None) -> str:
+    """
+    Corta uma passagem de contexto no limite de tokens (incluindo as reticências):
+    mantém as frases completas que cabem e completa o orçamento com o início da
+    frase seguinte, cortado por palavras.
+    """
+    if contar_tokens(texto, modelo) <= max_tokens:
+        return texto
+    limite = max(1, max_tokens - contar_tokens("...", modelo))
+    resultado = ""
+    for frase in _frases(texto):
+        candidato = f"{resultado} {frase}".strip()
+        if contar_tokens(candidato, modelo) > limite:
+            resultado = _prefixo(candidato, limite, modelo).rstrip()
+            break
+        resultado = candidato
+    return resultado + "..."
+
+
+# -----------------------------------------------------------
+# IV. EMPACOTAMENTO DO CONTEXTO RAG
+# -----------------------------------------------------------
+
+def _trigramas(texto: str) -> Set[tuple]:
+    palavras = re.findall(r"\w+", texto.lower())
+    return {tuple(palavras[i:i + 3]) for i in range(max(0, len(palavras) - 2))}
+
+
+# Relevância de um registro: o score da fusão mais externa aplicada (federada, RRF) e,
+# sem fusão, a similaridade vetorial. Registros só lexicais (BM25) não têm similaridade.
+CAMPOS_RELEVANCIA = ("score_federado", "score_rrf", "similaridade")
+
+
+def relevancia(registro: Dict) -> float:
+    for campo in CAMPOS_RELEVANCIA:
+        if registro.get(campo) is not None:
+            return registro[campo]
+    return 0.0
+
+
+def empacotar_contexto(registros: List[Dict], max_tokens: int = MAX_TOKENS_CONTEXTO,
+                       modelo: Optional[str] = None) -> List[Dict]:
+    """
+    Seleciona as passagens que cabem no orçamento de tokens.
+    Ordena por relevância (maior primeiro), descarta passagens repetidas ou que
+    se sobrepõem às já escolhidas e corta cada uma em MAX_TOKENS_PASSAGEM.
+    Retorna cópias dos registros com 'conteudo' cortado e o campo 'tokens'.
+    """
+    ordenados = sorted(
+        (r for r in registros if r.get("conteudo")),
+        key=relevancia,
+        reverse=True,
+    )
+    escolhidos: List[Dict] = []
+    vistos: Set[tuple] = set()
+    restante = max_tokens
+    for registro in ordenados:
+        conteudo = cortar_por_tokens(registro["conteudo"], min(MAX_TOKENS_PASSAGEM, restante), modelo)
+        trigramas = _trigramas(conteudo)
+        if trigramas and len(trigramas & vistos) / len(trigramas) >= LIMIAR_SOBREPOSICAO:
+            continue
+        tokens = contar_tokens(conteudo, modelo)
+        if tokens > restante:
+            continue
+        escolhidos.append(dict(registro, conteudo=conteudo, tokens=tokens))
+        vistos |= trigramas
+        restante -= tokens
+        if restante <= 0:
+            break
+    return escolhidos
@@ -0,0 +1,128 @@
+import re
+import difflib
+import unicodedata
+from typing import List, Optional
+
+
+# -----------------------------------------------------------
+# I. SEGMENTAÇÃO EM PARÁGRAFOS
+# -----------------------------------------------------------
+
+_SEPARADOR = re.compile(r"(\n\s*\n)")
+
+
+def segmentar(texto: str) -> List[str]:
+    """
+    Divide o texto em parágrafos preservando os separadores originais:
+    os itens de índice par são parágrafos e os ímpares, separadores,
+    de modo que "".join(segmentar(t)) == t.
+    Sem linhas em branco, cada quebra de linha simples separa um parágrafo.
+    """
+    partes = _SEPARADOR.split(texto)
+    if len(partes) == 1:
+        partes = re.split(r"(\n)", texto)
+    return partes
+
+
+def indices_paragrafos(segmentos: List[str]) -> List[int]:
+    """Índices (em segmentos) dos parágrafos não vazios, na ordem do texto."""
+    return [i for i in range(0, len(segmentos), 2) if segmentos[i].strip()]
+
+
+# -----------------------------------------------------------
+# II. PARÁGRAFOS-ALVO DA INSTRUÇÃO (Heurística)
+# -----------------------------------------------------------
+
+ORDINAIS = {
+    "primeiro": 1, "segundo": 2, "terceiro": 3, "quarto": 4, "quinto": 5,
+    "sexto": 6, "setimo": 7, "oitavo": 8, "nono": 9, "decimo": 10,
+    "inicial": 1, "ultimo": -1, "final": -1, "penultimo": -2,
+}
+_ORDINAL = r"(?:" + "|".join(ORDINAIS) + r"|\d+o?)"
+_LISTA = _ORDINAL + r"(?:\s*(?:,|e)\s*(?:o\s+)?" + _ORDINAL + r")*"
+# "segundo paragrafo", "2o e 3o paragrafos" / "paragrafo 2", "paragrafos 2 e 3", "paragrafo final"
+_ANTES = re.compile(r"\b(" + _LISTA + r")\s+paragrafos?\b")
+_DEPOIS = re.compile(r"\bparagrafos?\s+(" + _LISTA + r")\b")
+# Instruções que valem para o texto inteiro mesmo citando um parágrafo
+_GLOBAL = re.compile(r"\b(todo o texto|texto (todo|inteiro)|todos os paragrafos|cada paragrafo)\b")
+# Instruções que mudam a estrutura (remover, acrescentar, juntar, dividir ou mover parágrafos):
+# regenerar o parágrafo citado não basta, o texto inteiro é ajustado
+_ESTRUTURAL = re.compile(
+    r"\b(?:remov|exclu|apag|elimin|retir|suprim|delet|jun|una|unir|mescl|combin|fund|agrup)\w*"
+    r"\s+(?:(?:o|os|a|as|d?esses?|d?estes?)\s+)?(?:" + _LISTA + r"\s+(?:e\s+(?:o\s+)?)?)?paragrafos?\b"
+    r"|\b(?:adicion|acrescent|inclu|insir|inserir|cri|escrev)\w*\s+(?:mais\s+)?"
+    r"(?:um|uma|outro|novo|dois|tres|\d+)\s+(?:\w+\s+)?paragrafos?\b"
+    r"|\b(?:divid|separ|quebr)\w*\s+(?:\w+\s+){0,3}?paragrafos?\b"
+)
+# Verbos que levam conteúdo de um lugar para outro (mover, trocar, juntar, reordenar): em qualquer
+# posição da instrução, só o parágrafo de destino seria reescrito e o trecho ficaria duplicado
+# ("Mova a frase sobre dose para o primeiro parágrafo")
+_REORGANIZACAO = re.compile(
+    r"\b(?:mov(?:a|am|e|er|endo)|transfir\w*|transferir|desloc\w*|desloqu\w*|troqu\w*|trocar|troca"
+    r"|permut\w*|invert\w*|intercal\w*|junt(?:e|em|ar|ando)|una|unam|unir|unifi\w*|mescl\w*|combin\w*"
+    r"|fund(?:a|am|ir)|reorden\w*|reorganiz\w*)\b"
+)
+
+
+def _normalizar(texto: str) -> str:
+    normalizado = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in normalizado if not unicodedata.combining(c))
+
+
+def _posicao(token: str, total: int) -> Optional[int]:
+    token = token.rstrip("o") if token[:1].isdigit() else token
+    numero = int(token) if token.isdigit() else ORDINAIS.get(token)
+    if numero is None or numero == 0:
+        return None
+    posicao = numero - 1 if numero > 0 else total + numero
+    return posicao if 0 <= posicao < total else None
+
+
+def alvos_instrucao(instrucao: str, total_paragrafos: int) -> Optional[List[int]]:
+    """
+    Posições (base 0) dos parágrafos citados na instrução, ex: "Aumente o segundo
+    parágrafo em 30 palavras" -> [1]. Retorna None quando a instrução não cita
+    parágrafos, vale para o texto todo, cita um parágrafo inexistente ou muda a
+    estrutura do texto ("Remova o segundo parágrafo", "Adicione um parágrafo final",
+    "Mova a frase sobre dose para o primeiro parágrafo").
+    """
+    alvo = _normalizar(instrucao)
+    if "paragrafo" not in alvo or _GLOBAL.search(alvo) or _ESTRUTURAL.search(alvo) or _REORGANIZACAO.search(alvo):
+        return None
+    posicoes = set()
+    for padrao in (_ANTES, _DEPOIS):
+        for grupo in padrao.findall(alvo):
+            for token in re.findall(_ORDINAL, grupo):
+                posicao = _posicao(token, total_paragrafos)
+                if posicao is None:
+                    return None
+                posicoes.add(posicao)
+    return sorted(posicoes) or None
+
+
+# -----------------------------------------------------------
+# III. RELATÓRIO DE DIFERENÇAS
+# -----------------------------------------------------------
+
+def _lista_paragrafos(texto: str) -> List[str]:
+    segmentos = segmentar(texto)
+    return [segmentos[i].strip() for i in indices_paragrafos(segmentos)]
+
+
+def relatorio_diferencas(antes: str, depois: str) -> str:
+    """Resumo por parágrafo (palavras acrescentadas/removidas) seguido do diff unificado."""
+    pars_antes, pars_depois = _lista_paragrafos(antes), _lista_paragrafos(depois)
+    linhas = []
+    matcher = difflib.SequenceMatcher(a=pars_antes, b=pars_depois, autojunk=False)
+    for operacao, a1, a2, b1, b2 in matcher.get_opcodes():
+        if operacao == "equal":
+            continue
+        palavras_antes = sum(len(p.split()) for p in pars_antes[a1:a2])
+        palavras_depois = sum(len(p.split()) for p in pars_depois[b1:b2])
+        faixa = f"{b1 + 1}" if b2 - b1 <= 1 else f"{b1 + 1}-{b2}"
+        descricao = {"replace": "alterado", "insert": "inserido", "delete": "removido"}[operacao]
+        linhas.append(f"Parágrafo {faixa} {descricao}: {palavras_antes} -> {palavras_depois} palavras")
+    if not linhas:
+        return "Nenhuma alteração."
+    diff = difflib.unified_diff(pars_antes, pars_depois, "antes", "depois", lineterm="", n=0)
+    return "\n".join(linhas) + "\n\n" + "\n".join(diff)
@@ -0,0 +1,47 @@
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+# -----------------------------------------------------------
+# I. CLASSE Provedor (Criação preguiçosa e thread-safe de clientes)
+# -----------------------------------------------------------
+
+class Provedor(Generic[T]):
+    """
+    Cria um recurso (cliente de API, cache, modelo) apenas no primeiro uso e
+    o reaproveita no restante do processo. Importar um módulo não abre conexões
+    nem exige credenciais; isso só acontece quando get() é chamado.
+    """
+    def __init__(self, fabrica: Callable[[], T], nome: str):
+        self.fabrica = fabrica
+        self.nome = nome
+        self._valor: Optional[T] = None
+        self._criado = False
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        if not self._criado:
+            with self._lock:
+                if not self._criado:
+                    self._valor = self.fabrica()
+                    self._criado = True
+        return self._valor
+
+    def definir(self, valor: T) -> None:
+        """Substitui o recurso (ex: dublês locais no benchmark)."""
+        with self._lock:
+            self._valor = valor
+            self._criado = True
+
+    def reiniciar(self) -> None:
+        """Descarta o recurso; o próximo get() cria um novo."""
+        with self._lock:
+            self._valor = None
+            self._criado = False
+
+    @property
+    def criado(self) -> bool:
+        return self._criado
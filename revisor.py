@@ -1,57 +1,63 @@
-import openai
 import os
 import json
 import hashlib
-from typing import List, Dict, Optional
+import inspect
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, List, Dict, Optional, Iterator, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor, Future, wait
 import sys
 
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-try:
-    from revisor import reescrever_revisor, get_embedding, ajuste_incremental
-except ImportError as e:
-    print(f"❌ ERRO DE IMPORTAÇÃO: {e}. Verifique se todos os arquivos estão no diretório correto.")
-
-
-
-
-# 🚨 IMPORTAÇÃO DOS MÓDULOS DE LÓGICA
-try:
-    from classificacao import classificar_texto 
-    print("✅ Módulo 'classificacao' importado.")
-    from conexao_banco import AstraDBClient, astra_client
-    print("✅ Módulo 'conexao_banco' importado.")
-except ImportError as e:
-    print(f"❌ ERRO: Verifique se os arquivos classificacao.py e conexao_banco.py estão no diretório. Erro: {e}")
-    # Abortar se as dependências não puderem ser carregadas
-    exit()
-    classificar_texto = None
-    AstraDBClient = None
-    astra_client = None
+import numpy as np
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+# 🚨 IMPORTAÇÃO DOS MÓDULOS DE LÓGICA (sem efeitos colaterais: os clientes são criados no primeiro uso)
+from classificacao import classificar_texto
+from conexao_banco import get_astra_client
+from cache import CacheEmbeddings, CacheRespostas, CacheSemantico
+import limites
+from metricas import span, copiar_contexto, coletar_etapas, tempos_por_etapa
+from provedores import Provedor
+import orcamento
+from orcamento import contar_tokens, dividir_por_tokens, empacotar_contexto
+import paragrafos
+from roteamento import RoteadorLLM
+from saida_estruturada import (
+    ResultadoRevisao, ExtratorTexto, interpretar_resposta, PREFIXO_ERRO_LLM, FORMATO_JSON,
+    ERRO_CLASSIFICACAO, ERRO_EMBEDDING, ERRO_GERACAO,
+)
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Define a chave de ambiente para o cliente OpenAI
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-if not OPENAI_API_KEY:
-    print("❌ ATENÇÃO: OPENAI_API_KEY não está definida.")
+# -----------------------------------------------------------
+# I. CREDENCIAIS (Streamlit secrets -> variáveis de ambiente)
+# -----------------------------------------------------------
 
+SECRETS_CARREGADAS = ['OPENAI_API_KEY', 'GEMINI_API_KEY', 'ASTRA_DB_APPLICATION_TOKEN',
+                      'ASTRA_DB_API_ENDPOINT', 'ASTRA_DB_NAMESPACE']
 
 
-if 'secrets' in dir(st) and st.secrets:
+def carregar_secrets() -> None:
+    """Copia as secrets do Streamlit (se existirem) para as variáveis de ambiente."""
     try:
-        # Carregar todas as secrets
-        for key in ['OPENAI_API_KEY', 'GEMINI_API_KEY', 'ASTRA_DB_APPLICATION_TOKEN', 
-                    'ASTRA_DB_API_ENDPOINT', 'ASTRA_DB_NAMESPACE']:
+        import streamlit as st
+        tem_secrets = 'secrets' in dir(st) and bool(st.secrets)
+    except Exception:
+        # Fora do Streamlit (lote, benchmark) não existe secrets.toml
+        return
+    if not tem_secrets:
+        return
+    try:
+        for key in SECRETS_CARREGADAS:
             if key in st.secrets:
                 os.environ[key] = st.secrets[key]
     except Exception as e:
-        st.error(f"Erro ao carregar secrets: {e}")
-else:
-    st.warning("⚠️ Secrets não encontrados. Usando variáveis de ambiente existentes.")
-    
+        print(f"❌ Erro ao carregar secrets: {e}")
+
+
+_provedor_secrets = Provedor(carregar_secrets, "secrets")
+
 
 # -----------------------------------------------------------
 # II. CLASSE LLMClient (Para gerar a correção)
@@ -59,50 +65,185 @@ else:
 
 class LLMClient:
     """Classe wrapper para o cliente de Chat Completion da OpenAI, simulando 'generate_content'."""
-    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo"):
-        # Inicializa o cliente OpenAI
-        self.client = openai.OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo", client=None):
+        # Inicializa o cliente OpenAI (SDK importado só aqui, no primeiro uso).
+        # Os LLMClient de cada modelo do roteamento compartilham o mesmo cliente.
+        import openai
+        self.client = client or openai.OpenAI(api_key=api_key)
         self.model = model
         print(f"✅ LLMClient inicializado com modelo: {self.model}")
 
-    def generate_content(self, prompt: str) -> str:
+    def _opcoes(self, formato_json: bool) -> Dict:
+        # Modo JSON da API: garante um objeto JSON válido (o prompt precisa citar "JSON")
+        return {"response_format": {"type": "json_object"}} if formato_json else {}
+
+    def _completar(self, prompt: str, formato_json: bool, timeout: Optional[float], **extras):
+        # Com prazo (roteamento), sem novas tentativas internas: o fallback troca de modelo
+        cliente = self.client if timeout is None else self.client.with_options(timeout=timeout, max_retries=0)
+        return cliente.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "Você é um agente de revisão técnica altamente preciso."},
+                {"role": "user", "content": prompt}
+            ],
+            **self._opcoes(formato_json),
+            **extras
+        )
+
+    def _tokens_reservados(self, prompt: str) -> Tuple[int, int]:
+        # (tokens do prompt, reserva na cota de tokens/min): a resposta é estimada do tamanho do prompt
+        tokens_prompt = contar_tokens(prompt, self.model)
+        return tokens_prompt, 2 * tokens_prompt
+
+    def gerar(self, prompt: str, formato_json: bool = False, timeout: Optional[float] = None) -> str:
+        """Como generate_content, mas propaga as exceções da API (usado pelo fallback do roteamento)."""
+        _, reserva = self._tokens_reservados(prompt)
+        with span("geracao_llm", modelo=self.model, caracteres_prompt=len(prompt)) as attrs:
+            # Aguarda a cota da OpenAI; em 429 a chamada volta para a fila
+            response = limites.executar("openai", self._completar, prompt, formato_json, timeout, tokens=reserva)
+            if response.usage:
+                attrs["tokens_prompt"] = response.usage.prompt_tokens
+                attrs["tokens_resposta"] = response.usage.completion_tokens
+                limites.registrar_uso("openai", reserva, response.usage.total_tokens)
+        return response.choices[0].message.content or ""
+
+    def gerar_stream(self, prompt: str, formato_json: bool = False, timeout: Optional[float] = None) -> Iterator[str]:
+        """Como generate_content_stream, mas propaga as exceções da API."""
+        tokens_prompt, reserva = self._tokens_reservados(prompt)
+        with span("geracao_llm", modelo=self.model, caracteres_prompt=len(prompt), streaming=True) as attrs:
+            inicio = time.perf_counter()
+            stream = limites.executar("openai", self._completar, prompt, formato_json, timeout,
+                                      stream=True, tokens=reserva)
+            attrs["caracteres_resposta"] = 0
+            trechos = []
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if "ttft_ms" not in attrs:
+                        attrs["ttft_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+                    attrs["caracteres_resposta"] += len(chunk.choices[0].delta.content)
+                    trechos.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            # O streaming não traz o uso: conta os tokens da resposta recebida
+            limites.registrar_uso("openai", reserva, tokens_prompt + contar_tokens("".join(trechos), self.model))
+
+    def generate_content(self, prompt: str, formato_json: bool = False) -> str:
         """Método que simula a interface generate_content."""
+        import openai
         print("\n--- Chamando OpenAI Chat Completion ---")
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Você é um agente de revisão técnica altamente preciso."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content
+            return self.gerar(prompt, formato_json)
         except openai.APIError as e:
-            print(f"❌ ERRO NA GERAÇÃO DO LLM (API Error): {e}")
-            return f"ERRO NA GERAÇÃO DO LLM (API Error): {str(e)}"
+            print(f"❌ {PREFIXO_ERRO_LLM} (API Error): {e}")
+            return f"{PREFIXO_ERRO_LLM} (API Error): {str(e)}"
         except Exception as e:
-            print(f"❌ ERRO NA GERAÇÃO DO LLM (Geral): {e}")
-            return f"ERRO NA GERAÇÃO DO LLM (Geral): {str(e)}"
+            print(f"❌ {PREFIXO_ERRO_LLM} (Geral): {e}")
+            return f"{PREFIXO_ERRO_LLM} (Geral): {str(e)}"
+
+    def generate_content_stream(self, prompt: str, formato_json: bool = False) -> Iterator[str]:
+        """Versão em streaming de generate_content: produz os trechos de texto conforme chegam."""
+        import openai
+        print("\n--- Chamando OpenAI Chat Completion (streaming) ---")
+        try:
+            yield from self.gerar_stream(prompt, formato_json)
+        except openai.APIError as e:
+            print(f"❌ {PREFIXO_ERRO_LLM} (API Error): {e}")
+            yield f"{PREFIXO_ERRO_LLM} (API Error): {str(e)}"
+        except Exception as e:
+            print(f"❌ {PREFIXO_ERRO_LLM} (Geral): {e}")
+            yield f"{PREFIXO_ERRO_LLM} (Geral): {str(e)}"
+
+
+# -----------------------------------------------------------
+# II-B. PROVEDORES (Clientes criados sob demanda, uma vez por processo)
+# -----------------------------------------------------------
+
+def _criar_modelo_texto() -> RoteadorLLM:
+    _provedor_secrets.get()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        print("❌ ATENÇÃO: OPENAI_API_KEY não está definida.")
+    compartilhado = {}
+
+    def criar_cliente(modelo: str) -> LLMClient:
+        # Um LLMClient por modelo do roteamento, todos sobre o mesmo cliente OpenAI
+        cliente = LLMClient(api_key=openai_api_key, model=modelo, client=compartilhado.get("client"))
+        compartilhado.setdefault("client", cliente.client)
+        return cliente
+
+    return RoteadorLLM(criar_cliente)
+
+
+def _criar_cliente_busca():
+    # Backend da busca vetorial: "astra" (padrão) ou "local" (espelho em disco, ver indice_local.py)
+    _provedor_secrets.get()
+    if os.getenv("REVISOR_BACKEND_BUSCA", "astra").lower() == "local":
+        from indice_local import IndiceVetorialLocal
+        return IndiceVetorialLocal(cliente_remoto=get_astra_client())
+    return get_astra_client()
+
+
+provedor_modelo_texto = Provedor(_criar_modelo_texto, "LLMClient (roteamento)")
+provedor_cliente_busca = Provedor(_criar_cliente_busca, "busca vetorial")
+provedor_cache_embeddings = Provedor(CacheEmbeddings, "cache de embeddings")
+provedor_cache_respostas = Provedor(CacheRespostas, "cache de respostas")
+provedor_cache_semantico = Provedor(CacheSemantico, "cache semântico")
 
-# Inicializa o cliente
-modelo_texto = LLMClient(api_key=OPENAI_API_KEY)
+
+def get_modelo_texto() -> RoteadorLLM:
+    return provedor_modelo_texto.get()
+
+
+def get_cliente_busca():
+    return provedor_cliente_busca.get()
+
+
+_GLOBAIS_SOB_DEMANDA = {
+    "modelo_texto": get_modelo_texto,
+    "cliente_busca": get_cliente_busca,
+    "astra_client": get_astra_client,
+    "cache_embeddings": provedor_cache_embeddings.get,
+    "cache_respostas": provedor_cache_respostas.get,
+    "cache_semantico": provedor_cache_semantico.get,
+}
+
+
+def __getattr__(nome: str):
+    # Compatibilidade com os antigos globais do módulo, agora criados sob demanda
+    if nome in _GLOBAIS_SOB_DEMANDA:
+        return _GLOBAIS_SOB_DEMANDA[nome]()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
 
 # -----------------------------------------------------------
 # III. FUNÇÃO get_embedding (Para a busca vetorial)
 # -----------------------------------------------------------
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
 def get_embedding(text: str) -> List[float]:
     """Obtém embedding do texto usando OpenAI com diagnóstico (adaptado do seu doc)."""
+    with span("embedding", textos=1, caracteres=len(text)) as attrs:
+        return _get_embedding(text, attrs)
+
+
+def _get_embedding(text: str, attrs: Dict) -> List[float]:
+    embedding = provedor_cache_embeddings.get().get(EMBEDDING_MODEL, text)
+    attrs["cache_hit"] = bool(embedding)
+    if embedding:
+        print(f"✅ Embedding recuperado do cache. Dimensões: {len(embedding)}.")
+        return embedding
+
     print("\n--- Chamando OpenAI Embedding ---")
     try:
-        # Usa o cliente já inicializado para embeddings
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
+        # Usa o cliente já inicializado (pool de conexões compartilhado com o LLMClient)
+        client = get_modelo_texto().client
+        reserva = _estimar_tokens(text)
+        response = limites.executar("openai", client.embeddings.create, input=text, model=EMBEDDING_MODEL,
+                                    tokens=reserva)
+        attrs["tokens"] = response.usage.total_tokens if response.usage else 0
+        limites.registrar_uso("openai", reserva, attrs["tokens"] or None)
         embedding = response.data[0].embedding
+        provedor_cache_embeddings.get().set(EMBEDDING_MODEL, text, embedding)
 
         # --- DIAGNÓSTICO ---
         print(f"✅ Embedding Gerado. Dimensões: {len(embedding)}. Primeiro valor: {embedding[0]:.6f}")
@@ -115,50 +256,589 @@ def get_embedding(text: str) -> List[float]:
         return []
 
 
+# Limites da API de embeddings por requisição
+EMBEDDING_MAX_ITENS_LOTE = 2048
+EMBEDDING_MAX_TOKENS_LOTE = int(os.getenv("EMBEDDING_MAX_TOKENS_LOTE", "250000"))
+
+
+def _estimar_tokens(text: str) -> int:
+    """Estimativa conservadora de tokens (~3 caracteres por token em português)."""
+    return len(text) // 3 + 1
+
+
+def _montar_lotes(textos: List[str]) -> List[List[str]]:
+    """Agrupa os textos no menor número de requisições que respeite os limites da API."""
+    lotes, atual, tokens_atual = [], [], 0
+    for texto in textos:
+        tokens = _estimar_tokens(texto)
+        if atual and (len(atual) >= EMBEDDING_MAX_ITENS_LOTE or tokens_atual + tokens > EMBEDDING_MAX_TOKENS_LOTE):
+            lotes.append(atual)
+            atual, tokens_atual = [], 0
+        atual.append(texto)
+        tokens_atual += tokens
+    if atual:
+        lotes.append(atual)
+    return lotes
+
 
-def reescrever_revisor(content: str, colecao_override: Optional[str] = None) -> str:
+def get_embeddings(texts: List[str]) -> np.ndarray:
     """
-    Função principal que executa o pipeline RAG completo.
-    Atua como um Revisor Técnico, corrigindo imprecisões e enriquecendo o texto.
-    Aceita colecao_override para sobrepor a classificação do Gemini.
+    Obtém embeddings para vários textos com o mínimo de chamadas à API.
+    Remove duplicatas, consulta o cache e retorna uma matriz float32 (n_textos x dimensões)
+    na mesma ordem da entrada. Em caso de falha, retorna uma matriz vazia.
     """
-    
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    with span("embedding", textos=len(texts), caracteres=sum(len(t) for t in texts)) as attrs:
+        return _get_embeddings(texts, attrs)
+
+
+def _get_embeddings(texts: List[str], attrs: Dict) -> np.ndarray:
+    vetores: Dict[str, List[float]] = {}
+    faltantes = []
+    for texto in dict.fromkeys(texts):
+        embedding = provedor_cache_embeddings.get().get(EMBEDDING_MODEL, texto)
+        if embedding:
+            vetores[texto] = embedding
+        else:
+            faltantes.append(texto)
+
+    lotes = _montar_lotes(faltantes)
+    attrs.update(cache_hits=len(vetores), requisicoes=len(lotes), tokens=0)
+    print(f"\n--- Chamando OpenAI Embedding em lote: {len(faltantes)} textos novos em {len(lotes)} requisição(ões), "
+          f"{len(vetores)} do cache ---")
+    try:
+        for lote in lotes:
+            reserva = sum(_estimar_tokens(texto) for texto in lote)
+            response = limites.executar("openai", get_modelo_texto().client.embeddings.create,
+                                        input=lote, model=EMBEDDING_MODEL, tokens=reserva)
+            attrs["tokens"] += response.usage.total_tokens if response.usage else 0
+            limites.registrar_uso("openai", reserva, response.usage.total_tokens if response.usage else None)
+            for item in response.data:
+                texto = lote[item.index]
+                vetores[texto] = item.embedding
+                provedor_cache_embeddings.get().set(EMBEDDING_MODEL, texto, item.embedding)
+    except Exception as e:
+        print(f"❌ ERRO na API OpenAI para Embedding em lote: {str(e)}. Verifique se a chave está ativa.")
+        return np.empty((0, 0), dtype=np.float32)
+
+    return np.asarray([vetores[texto] for texto in texts], dtype=np.float32)
+
+
+
+# -----------------------------------------------------------
+# III-B. BUSCA POR JANELAS (Textos longos)
+# -----------------------------------------------------------
+
+# Divide textos longos em janelas sobrepostas para que todo o texto influencie a busca
+BUSCA_POR_JANELAS = os.getenv("REVISOR_BUSCA_POR_JANELAS", "1") == "1"
+TAMANHO_JANELA = int(os.getenv("REVISOR_TAMANHO_JANELA", "800"))
+SOBREPOSICAO_JANELA = int(os.getenv("REVISOR_SOBREPOSICAO_JANELA", "200"))
+# Teto de janelas por texto (limita o fan-out de buscas e a latência)
+MAX_JANELAS_BUSCA = int(os.getenv("REVISOR_MAX_JANELAS_BUSCA", "4"))
+
+# Pool dedicado às buscas por janela (tarefas que nunca aguardam outras tarefas)
+executor_buscas = ThreadPoolExecutor(
+    max_workers=int(os.getenv("REVISOR_MAX_BUSCAS_PARALELAS", "8")),
+    thread_name_prefix="revisor-busca"
+)
+
+
+def dividir_em_janelas(texto: str, tamanho: int = TAMANHO_JANELA,
+                       sobreposicao: int = SOBREPOSICAO_JANELA,
+                       max_janelas: int = MAX_JANELAS_BUSCA) -> List[str]:
+    """
+    Divide o texto em janelas de até `tamanho` caracteres respeitando os parágrafos,
+    repetindo o final de cada janela (até `sobreposicao` caracteres) no início da próxima.
+    Se houver mais de `max_janelas`, mantém janelas espaçadas uniformemente (incluindo a primeira e a última).
+    """
+    if len(texto) <= tamanho:
+        return [texto]
+
+    # Parágrafos maiores que a janela são fatiados com sobreposição
+    passo = max(1, tamanho - sobreposicao)
+    paragrafos = []
+    for paragrafo in (p.strip() for p in texto.split("\n")):
+        if not paragrafo:
+            continue
+        if len(paragrafo) <= tamanho:
+            paragrafos.append(paragrafo)
+        else:
+            paragrafos.extend(paragrafo[i:i + tamanho] for i in range(0, len(paragrafo) - sobreposicao, passo))
+
+    janelas, atual = [], []
+    for paragrafo in paragrafos:
+        if atual and len("\n".join(atual + [paragrafo])) > tamanho:
+            janelas.append("\n".join(atual))
+            # Reaproveita os últimos parágrafos como sobreposição
+            sobra = []
+            while atual and len("\n".join([atual[-1]] + sobra)) <= sobreposicao:
+                sobra.insert(0, atual.pop())
+            atual = sobra
+        atual.append(paragrafo)
+    if atual:
+        janelas.append("\n".join(atual))
+
+    if len(janelas) > max_janelas:
+        if max_janelas <= 1:
+            return janelas[:1]
+        indices = sorted({round(i * (len(janelas) - 1) / (max_janelas - 1)) for i in range(max_janelas)})
+        janelas = [janelas[i] for i in indices]
+    return janelas
+
+
+def _embeddings_janelas(janelas: List[str]) -> List[List[float]]:
+    """Embeddings das janelas; uma janela usa get_embedding, várias usam uma única chamada em lote."""
+    if len(janelas) == 1:
+        embedding = get_embedding(janelas[0])
+        return [embedding] if embedding else []
+    matriz = get_embeddings(janelas)
+    return matriz.tolist() if matriz.size else []
+
+
+def _id_documento(doc: Dict) -> str:
+    return str(doc.get("_id") or hashlib.sha256(str(doc).encode("utf-8")).hexdigest())
+
+
+def fundir_rrf(listas: List[List[Dict]], limite: int = 10, k: int = 60) -> List[Dict]:
+    """
+    Funde várias listas ranqueadas por Reciprocal Rank Fusion,
+    removendo documentos repetidos (pelo _id). Os registros retornados
+    são cópias com o campo 'score_rrf'.
+    """
+    pontuacao: Dict[str, float] = {}
+    documentos: Dict[str, Dict] = {}
+    for lista in listas:
+        for posicao, doc in enumerate(lista, 1):
+            chave = _id_documento(doc)
+            pontuacao[chave] = pontuacao.get(chave, 0.0) + 1.0 / (k + posicao)
+            documentos.setdefault(chave, doc)
+    ordenadas = sorted(pontuacao, key=pontuacao.get, reverse=True)
+    return [dict(documentos[chave], score_rrf=round(pontuacao[chave], 6)) for chave in ordenadas[:limite]]
+
+
+def _buscar_janelas(colecao: str, vetores: List[List[float]], limit: int = 10) -> List[Dict]:
+    """Busca vetorial para cada janela em paralelo e funde os resultados."""
+    if len(vetores) == 1:
+        return get_cliente_busca().vector_search(colecao, vetores[0], limit=limit)
+    futuros = [executor_buscas.submit(copiar_contexto(get_cliente_busca().vector_search), colecao, vetor, limit)
+               for vetor in vetores]
+    return fundir_rrf([futuro.result() for futuro in futuros], limite=limit)
+
+
+# Busca híbrida: BM25 local (nomes de produtos, ativos, doses) em paralelo à busca vetorial
+BUSCA_HIBRIDA = os.getenv("REVISOR_BUSCA_HIBRIDA", "1") == "1"
+
+
+def _criar_indice_lexical():
+    from indice_lexical import IndiceLexical
+    return IndiceLexical()
+
+
+provedor_indice_lexical = Provedor(_criar_indice_lexical, "índice lexical")
+
+
+def buscar_colecao(colecao: str, vetores: List[List[float]], texto: str, limit: int = 10) -> List[Dict]:
+    """
+    Busca de uma coleção: a vetorial (por janelas) e, se houver índice BM25 local da
+    coleção, a lexical em paralelo, fundidas por RRF. Textos quase idênticos a um tópico
+    frequente trocam só a busca vetorial pelos documentos pré-buscados (contexto quente);
+    a lexical, local, continua sendo feita com o texto da consulta.
+    """
+    if CONTEXTO_QUENTE_ATIVO and vetores:
+        documentos = provedor_contexto_quente.get().consultar(colecao, _vetor_texto(vetores), limit)
+        if documentos is not None:
+            return _fundir_lexical(colecao, texto, limit, lambda: documentos)
+    return _buscar_colecao_remota(colecao, vetores, texto, limit)
+
+
+def _buscar_colecao_remota(colecao: str, vetores: List[List[float]], texto: str, limit: int = 10) -> List[Dict]:
+    return _fundir_lexical(colecao, texto, limit, lambda: _buscar_janelas(colecao, vetores, limit))
+
+
+def _fundir_lexical(colecao: str, texto: str, limit: int, buscar_vetorial: Callable[[], List[Dict]]) -> List[Dict]:
+    indice = provedor_indice_lexical.get() if BUSCA_HIBRIDA else None
+    if indice is None or not indice.existe(colecao):
+        return buscar_vetorial()
+    futuro_lexical = executor_buscas.submit(copiar_contexto(indice.buscar), colecao, texto, limit)
+    vetoriais = buscar_vetorial()
+    lexicais = futuro_lexical.result()
+    print(f"🔤 Busca lexical (BM25) em '{colecao}': {len(lexicais)} documentos.")
+    # A lista vetorial vem primeiro para que os registros repetidos mantenham a similaridade
+    return fundir_rrf([vetoriais, lexicais], limite=limit)
+
+
+# -----------------------------------------------------------
+# III-B1. CONTEXTO QUENTE (Tópicos frequentes pré-buscados em segundo plano)
+# -----------------------------------------------------------
+
+CONTEXTO_QUENTE_ATIVO = os.getenv("REVISOR_CONTEXTO_QUENTE", "1") == "1"
+
+
+def _marca_colecao(colecao: str) -> Optional[str]:
+    # A marca detecta alterações feitas por qualquer processo (ex: ingestao.py) e descarta os tópicos.
+    # Backends sem marca de atualização (ex: dublês do benchmark) só têm a rebusca periódica
+    marca = getattr(get_cliente_busca(), "marca_atualizacao", None)
+    return marca(colecao) if marca else None
+
+
+def _criar_contexto_quente():
+    from contexto_quente import AquecedorContexto
+    # Só a busca vetorial é pré-buscada: a lexical é feita com o texto de cada consulta
+    aquecedor = AquecedorContexto(lambda colecao, vetores, texto, limit: _buscar_janelas(colecao, vetores, limit),
+                                  marca=_marca_colecao, modelo=EMBEDDING_MODEL)
+    aquecedor.iniciar()
+    return aquecedor
+
+
+provedor_contexto_quente = Provedor(_criar_contexto_quente, "contexto quente")
+
+
+def registrar_consulta(colecoes: List[str], vetores: List[List[float]], texto: str) -> None:
+    """Conta a consulta na frequência dos tópicos das coleções buscadas."""
+    if CONTEXTO_QUENTE_ATIVO and vetores:
+        vetor = _vetor_texto(vetores)
+        for colecao in colecoes:
+            provedor_contexto_quente.get().registrar(colecao, vetor, texto)
+
+
+# -----------------------------------------------------------
+# III-B2. BUSCA FEDERADA (Várias coleções em paralelo)
+# -----------------------------------------------------------
+
+# Consulta todas as coleções configuradas e funde os resultados (a classificação só dá um bônus)
+BUSCA_FEDERADA = os.getenv("REVISOR_BUSCA_FEDERADA", "0") == "1"
+COLECOES_FEDERADAS = [c.strip() for c in os.getenv("REVISOR_COLECOES_FEDERADAS", "PRODUTO,CULTURA,OUTROS").split(",") if c.strip()]
+# Coleções que não responderem dentro do prazo são descartadas
+PRAZO_FEDERADA_S = float(os.getenv("REVISOR_PRAZO_FEDERADA_S", "3"))
+# Máximo de documentos de cada coleção na lista final (ex: "PRODUTO=5,OUTROS=2"); demais usam a cota padrão
+COTA_FEDERADA_PADRAO = int(os.getenv("REVISOR_COTA_FEDERADA", "5"))
+COTAS_FEDERADAS = {
+    nome.strip(): int(valor)
+    for nome, _, valor in (item.partition("=") for item in os.getenv("REVISOR_COTAS_FEDERADAS", "").split(","))
+    if nome.strip() and valor.strip()
+}
+# Bônus (em desvios-padrão) para a coleção escolhida pela classificação ou pelo usuário
+BONUS_COLECAO_PRINCIPAL = float(os.getenv("REVISOR_BONUS_COLECAO_PRINCIPAL", "0.5"))
+
+
+def iniciar_busca_federada(vetores: List[List[float]], texto: str, limit: int = 10) -> Tuple[Dict[str, Future], float]:
+    """Dispara a busca em todas as coleções federadas; retorna (futuros por coleção, prazo em time.monotonic())."""
+    prazo = time.monotonic() + PRAZO_FEDERADA_S
+    futuros = {
+        nome: executor_pipeline.submit(copiar_contexto(buscar_colecao), nome, vetores, texto, limit)
+        for nome in COLECOES_FEDERADAS
+    }
+    return futuros, prazo
+
+
+def _score_busca(doc: Dict) -> float:
+    """Score da lista de uma coleção: RRF quando houve fusão (janelas, híbrida), senão a similaridade."""
+    if doc.get("score_rrf") is not None:
+        return doc["score_rrf"]
+    return doc.get("similaridade") or 0.0
+
+
+def _zscore(documentos: List[Dict]) -> np.ndarray:
+    scores = np.array([_score_busca(d) for d in documentos], dtype=np.float64)
+    desvio = scores.std() if len(scores) else 0.0
+    if desvio < 1e-6:
+        # Sem dispersão: todos ficam no centro da escala
+        return np.zeros(len(scores))
+    return (scores - scores.mean()) / desvio
+
+
+def fundir_federada(futuros: Dict[str, Future], prazo: float, colecao_principal: Optional[str] = None,
+                    limit: int = 10) -> List[Dict]:
+    """
+    Aguarda as coleções até o prazo, normaliza os scores por coleção, aplica o bônus
+    da coleção principal e as cotas, e retorna uma única lista ordenada.
+    Cada registro recebe os campos 'colecao' e 'score_federado'.
+    """
+    with span("busca_federada", colecoes=len(futuros)) as attrs:
+        prontos, atrasados = wait(list(futuros.values()), timeout=max(0.0, prazo - time.monotonic()))
+        candidatos = []
+        for nome, futuro in futuros.items():
+            if futuro not in prontos:
+                # cancel() só impede buscas ainda na fila; as em andamento terminam em segundo plano (ignoradas)
+                futuro.cancel()
+                print(f"⚠️ Busca federada: coleção '{nome}' descartada (prazo de {PRAZO_FEDERADA_S}s).")
+                continue
+            try:
+                documentos = futuro.result()
+            except Exception as e:
+                print(f"❌ Busca federada: falha na coleção '{nome}': {e}")
+                continue
+            for doc, z_colecao in zip(documentos, _zscore(documentos)):
+                candidatos.append(dict(doc, colecao=nome, score_federado=float(z_colecao)))
+
+        # Score final: média do z-score dentro da coleção (corrige coleções que pontuam
+        # sistematicamente mais alto) com o z-score no conjunto (preserva a relevância absoluta).
+        # O z-score do conjunto só compara scores da mesma escala (RRF com RRF, similaridade com similaridade)
+        escalas: Dict[bool, List[Dict]] = {}
+        for doc in candidatos:
+            escalas.setdefault(doc.get("score_rrf") is not None, []).append(doc)
+        for grupo in escalas.values():
+            for doc, z_global in zip(grupo, _zscore(grupo)):
+                score = (doc["score_federado"] + z_global) / 2
+                if doc["colecao"] == colecao_principal:
+                    score += BONUS_COLECAO_PRINCIPAL
+                doc["score_federado"] = round(float(score), 4)
+
+        candidatos.sort(key=lambda d: (d["score_federado"], _score_busca(d)), reverse=True)
+        usados: Dict[str, int] = {}
+        vistos = set()
+        resultado = []
+        for doc in candidatos:
+            cota = COTAS_FEDERADAS.get(doc["colecao"], COTA_FEDERADA_PADRAO)
+            chave = _id_documento(doc)
+            if usados.get(doc["colecao"], 0) >= cota or chave in vistos:
+                continue
+            usados[doc["colecao"]] = usados.get(doc["colecao"], 0) + 1
+            vistos.add(chave)
+            resultado.append(doc)
+            if len(resultado) >= limit:
+                break
+        attrs.update(descartadas=len(atrasados), documentos=len(resultado))
+    print(f"2. Busca federada: {len(prontos)}/{len(futuros)} coleções no prazo; documentos por coleção: {usados}")
+    return resultado
+
+
+# -----------------------------------------------------------
+# III-C. CACHE DE RESPOSTAS (Revisão e ajuste incremental)
+# -----------------------------------------------------------
+
+CACHE_RESPOSTAS_ATIVO = os.getenv("REVISOR_CACHE_RESPOSTAS", "1") == "1"
+
+# Origem da última resposta entregue na thread atual ("memoria", "disco" ou None)
+_estado_cache = threading.local()
+
+
+def origem_ultima_resposta() -> Optional[str]:
+    """Indica se a última resposta desta thread veio do cache (para exibição na UI)."""
+    return getattr(_estado_cache, "origem", None)
+
+
+@lru_cache(maxsize=None)
+def _impressao_prompt(nome_funcao: str) -> str:
+    """Hash do código que monta o prompt: qualquer mudança no template invalida o cache."""
+    return hashlib.sha256(inspect.getsource(globals()[nome_funcao]).encode("utf-8")).hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def _impressao_modulo(nome_modulo: str) -> str:
+    """Hash do código de um módulo inteiro (ex: formato JSON pedido e interpretação da resposta)."""
+    return hashlib.sha256(inspect.getsource(sys.modules[nome_modulo]).encode("utf-8")).hexdigest()[:16]
+
+
+def _chave_revisao(content: str, colecao_override: Optional[str]) -> str:
+    colecao = colecao_override or COLECAO_AUTOMATICA
+    # Configuração da busca: com outras passagens no prompt, a resposta guardada não vale mais
+    busca = (BUSCA_FEDERADA, COLECOES_FEDERADAS if BUSCA_FEDERADA else None, BUSCA_HIBRIDA, BUSCA_POR_JANELAS,
+             TAMANHO_JANELA, SOBREPOSICAO_JANELA, MAX_JANELAS_BUSCA, CONTEXTO_QUENTE_ATIVO)
+    return CacheRespostas.chave("revisao", content, colecao, get_modelo_texto().assinatura,
+                                EMBEDDING_MODEL, _impressao_prompt("_montar_prompt_revisao"),
+                                _impressao_prompt("_prompt_revisao"), _impressao_modulo("saida_estruturada"),
+                                orcamento.MAX_TOKENS_PROMPT, orcamento.MAX_TOKENS_CONTEXTO,
+                                orcamento.MAX_TOKENS_PASSAGEM, orcamento.MAX_TOKENS_ENTRADA, *busca)
+
+
+def _chave_ajuste(texto_revisado: str, instrucao_incremental: str) -> str:
+    return CacheRespostas.chave("ajuste", texto_revisado, instrucao_incremental, get_modelo_texto().assinatura,
+                                _impressao_prompt("_prompt_ajuste_incremental"),
+                                AJUSTE_POR_PARAGRAFO, _impressao_prompt("_prompt_ajuste_paragrafo"))
+
+
+def _cache_resposta_get(chave: str) -> Optional[str]:
+    _estado_cache.origem = None
+    if not CACHE_RESPOSTAS_ATIVO:
+        return None
+    resposta, origem = provedor_cache_respostas.get().get(chave)
+    if resposta is not None:
+        print(f"✅ Resposta recuperada do cache ({origem}).")
+        _estado_cache.origem = origem
+    return resposta
+
+
+def _cache_resposta_set(chave: str, resposta: str) -> None:
+    # Mensagens de erro não são guardadas
+    if CACHE_RESPOSTAS_ATIVO and resposta and not resposta.startswith(PREFIXO_ERRO_LLM):
+        provedor_cache_respostas.get().set(chave, resposta)
+
+
+# -----------------------------------------------------------
+# III-D. CACHE SEMÂNTICO (Textos quase idênticos a um já revisado)
+# -----------------------------------------------------------
+
+CACHE_SEMANTICO_ATIVO = os.getenv("REVISOR_CACHE_SEMANTICO", "1") == "1"
+# Reaproveita também a classificação (senão classifica e só dispensa a busca)
+CACHE_SEMANTICO_CLASSIFICACAO = os.getenv("REVISOR_CACHE_SEMANTICO_CLASSIFICACAO", "1") == "1"
+
+
+def _vetor_texto(vetores: List[List[float]]) -> np.ndarray:
+    """Um único vetor representando o texto: a média das janelas."""
+    return np.mean(np.asarray(vetores, dtype=np.float32), axis=0)
+
+
+def _consultar_cache_semantico(vetores: List[List[float]],
+                               colecao: Optional[str] = None) -> Tuple[Optional[str], Optional[List[Dict]]]:
+    """Retorna (coleção, documentos) de um texto já revisado parecido, ou (None, None)."""
+    if not vetores:
+        return None, None
+    with span("cache_semantico", colecao_fixa=bool(colecao)) as attrs:
+        entrada, similaridade = provedor_cache_semantico.get().buscar(_vetor_texto(vetores), colecao)
+        attrs.update(cache_hit=entrada is not None, similaridade=round(similaridade, 4))
+    if entrada is None:
+        return None, None
+    print(f"✅ Cache semântico: texto {similaridade:.3f} similar a um já revisado. "
+          f"Reaproveitando coleção '{entrada['colecao']}' e {len(entrada['documentos'])} documentos.")
+    return entrada["colecao"], entrada["documentos"]
+
+
+# -----------------------------------------------------------
+# IV. FUNÇÃO reescrever_revisor (Pipeline RAG principal)
+# -----------------------------------------------------------
+
+COLECAO_AUTOMATICA = "Automática (Classificação Gemini)"
+COLECOES = ["PRODUTO", "CULTURA", "OUTROS"]
+
+# Quando ativo, a busca vetorial é disparada nas três coleções enquanto a
+# classificação ainda está em andamento; apenas o resultado da coleção escolhida é usado.
+BUSCA_ESPECULATIVA = os.getenv("REVISOR_BUSCA_ESPECULATIVA", "0") == "1"
+
+# Pool compartilhado para as chamadas de rede independentes do pipeline
+executor_pipeline = ThreadPoolExecutor(
+    max_workers=int(os.getenv("REVISOR_MAX_WORKERS", "8")),
+    thread_name_prefix="revisor"
+)
+
+
+def _preparar_revisao(content: str, colecao_override: Optional[str] = None) -> Tuple[Optional[Dict], Optional[Tuple[str, str]]]:
+    """
+    Executa as etapas do pipeline RAG anteriores à geração (classificação,
+    embedding, busca e montagem do prompt).
+    Retorna ({"prompt", "passagens", "colecao"}, None) ou (None, (código_erro, mensagem)).
+    A classificação e o embedding são executados em paralelo; textos quase
+    idênticos a um já revisado reaproveitam a coleção e os documentos (cache semântico).
+    """
+    _provedor_secrets.get()
     colecao = None
-    
-    if colecao_override and colecao_override != "Automática (Classificação Gemini)":
-        # 1a. Usa a coleção fornecida pelo usuário
-        colecao = colecao_override
-        print(f"\n--- 1. COLEÇÃO DEFINIDA PELO USUÁRIO: {colecao} ---")
-    else:
-        # 1b. Executa a classificação normal do Gemini
-        print("\n--- 1. CLASSIFICAÇÃO AUTOMÁTICA (Gemini) ---")
-        colecao = classificar_texto(content)
-        print(f"Coleção Identificada: {colecao}")
-    
-    if colecao in ["ERRO", "CLASSIFICAÇÃO NÃO RECONHECIDA:", None]:
-        # Retorna a mensagem de erro como string, conforme solicitado.
-        return f"Erro na classificação/seleção da coleção. Classificação falhou com: {colecao if colecao else 'ERRO'}. Não foi possível iniciar a busca RAG."
+    automatica = not colecao_override or colecao_override == COLECAO_AUTOMATICA
+    relevant_docs = None
+    consultou_semantico = False
+    busca_federada = None
+    buscas_especulativas: Dict[str, Future] = {}
+
+    # 1. EMBEDDING (não depende da classificação, então começa imediatamente)
+    janelas = dividir_em_janelas(content) if BUSCA_POR_JANELAS else [content[:TAMANHO_JANELA]]
+    futuro_embedding = executor_pipeline.submit(copiar_contexto(_embeddings_janelas), janelas)
+    # A classificação também começa já, em paralelo ao embedding (mesmo antes do cache semântico)
+    futuro_classificacao = executor_pipeline.submit(copiar_contexto(classificar_texto), content) if automatica else None
+
+    if automatica and CACHE_SEMANTICO_ATIVO and CACHE_SEMANTICO_CLASSIFICACAO:
+        # Num acerto do cache semântico, a classificação em andamento é descartada
+        consultou_semantico = True
+        vetores = futuro_embedding.result()
+        colecao, relevant_docs = _consultar_cache_semantico(vetores)
+        if relevant_docs is not None:
+            # Só evita a chamada se a classificação ainda estava na fila do executor; já em
+            # andamento (o caso comum), a chamada ao Gemini é concluída (e cobrada) e o resultado descartado
+            futuro_classificacao.cancel()
+
+    if relevant_docs is None:
+        if not automatica:
+            # 1a. Usa a coleção fornecida pelo usuário
+            colecao = colecao_override
+            print(f"\n--- 1. COLEÇÃO DEFINIDA PELO USUÁRIO: {colecao} ---")
+        else:
+            # 1b. Classificação normal do Gemini (já disparada em paralelo ao embedding)
+            print("\n--- 1. CLASSIFICAÇÃO AUTOMÁTICA (Gemini) ---")
+            if BUSCA_FEDERADA:
+                # Todas as coleções serão consultadas: a busca não precisa esperar a classificação
+                vetores = futuro_embedding.result()
+                if vetores:
+                    busca_federada = iniciar_busca_federada(vetores, content, 10)
+            elif BUSCA_ESPECULATIVA:
+                vetores = futuro_embedding.result()
+                if vetores and not futuro_classificacao.done():
+                    buscas_especulativas = {
+                        nome: executor_pipeline.submit(copiar_contexto(buscar_colecao), nome, vetores, content, 10)
+                        for nome in COLECOES
+                    }
+
+            colecao = futuro_classificacao.result()
+            print(f"Coleção Identificada: {colecao}")
+
+        if colecao in ["ERRO", "CLASSIFICAÇÃO NÃO RECONHECIDA:", None]:
+            return None, (ERRO_CLASSIFICACAO, f"Erro na classificação/seleção da coleção. Classificação falhou com: {colecao if colecao else 'ERRO'}. Não foi possível iniciar a busca RAG.")
+
+        # 2. EMBEDDING E BUSCA
+        vetores = futuro_embedding.result()
+
+        if not vetores or len(vetores[0]) < 1536:
+            return None, (ERRO_EMBEDDING, "Erro fatal na geração do Embedding. Verifique sua chave OpenAI ativa. Não foi possível buscar no Astra DB.")
+
+        if CACHE_SEMANTICO_ATIVO and not consultou_semantico:
+            _, relevant_docs = _consultar_cache_semantico(vetores, colecao)
+
+    if relevant_docs is None:
+        if BUSCA_FEDERADA:
+            futuros, prazo = busca_federada or iniciar_busca_federada(vetores, content, 10)
+            relevant_docs = fundir_federada(futuros, prazo, colecao_principal=colecao, limit=10)
+        elif colecao in buscas_especulativas:
+            relevant_docs = buscas_especulativas[colecao].result()
+        else:
+            relevant_docs = buscar_colecao(colecao, vetores, content, limit=10)
+        registrar_consulta(COLECOES_FEDERADAS if BUSCA_FEDERADA else [colecao], vetores, content)
+        origem = f"federada (principal: '{colecao}')" if BUSCA_FEDERADA else f"na coleção '{colecao}'"
+        print(f"2. Busca Vetorial concluída {origem} ({len(vetores)} janela(s)). Documentos retornados: {len(relevant_docs)}")
+        # Documentos do contexto quente são do tópico, não deste texto: não viram entrada do cache semântico
+        if CACHE_SEMANTICO_ATIVO and relevant_docs and not any(doc.get("contexto_quente") for doc in relevant_docs):
+            provedor_cache_semantico.get().set(_vetor_texto(vetores), colecao, relevant_docs)
+
+    # 3-4. CONTEXTO RAG E PROMPT
+    with span("montar_prompt", documentos=len(relevant_docs)) as attrs:
+        final_prompt, passagens = _montar_prompt_revisao(content, relevant_docs)
+        attrs["caracteres"] = len(final_prompt)
+        attrs["tokens"] = contar_tokens(final_prompt, get_modelo_texto().model)
+    return {"prompt": final_prompt, "passagens": passagens, "colecao": colecao,
+            "tokens_contexto": sum(p["tokens"] for p in passagens)}, None
+
+
+def _montar_prompt_revisao(content: str, relevant_docs: List[Dict]) -> Tuple[str, List[Dict]]:
+    """
+    Monta o prompt de revisão a partir do texto original e dos registros retornados pela busca.
+    O referencial teórico é empacotado no orçamento de tokens que sobra após o texto e as instruções.
+    Retorna (prompt, passagens usadas); a passagem i é a "Fonte i" do prompt.
+    """
+    modelo = get_modelo_texto().model
+    # 3. CONSTRÓI CONTEXTO RAG (passagens mais similares, sem repetições, dentro do orçamento)
+    tokens_base = contar_tokens(_prompt_revisao(content, ""), modelo)
+    orcamento_contexto = min(orcamento.MAX_TOKENS_CONTEXTO, orcamento.MAX_TOKENS_PROMPT - tokens_base)
+    passagens = empacotar_contexto(relevant_docs, max(0, orcamento_contexto), modelo)
+    print(f"3. Contexto RAG: {len(passagens)}/{len(relevant_docs)} passagens, "
+          f"{sum(p['tokens'] for p in passagens)}/{max(0, orcamento_contexto)} tokens.")
 
-    # 2. EMBEDDING E BUSCA
-    embedding = get_embedding(content[:800])
-    
-    if not embedding or len(embedding) < 1536:
-        return "Erro fatal na geração do Embedding. Verifique sua chave OpenAI ativa. Não foi possível buscar no Astra DB."
-        
-    relevant_docs = astra_client.vector_search(colecao, embedding, limit=10)
-    print(f"2. Busca Vetorial concluída na coleção '{colecao}'. Documentos retornados: {len(relevant_docs)}")
-    
-    # 3. CONSTRÓI CONTEXTO RAG
     rag_context = ""
-    if relevant_docs:
+    if passagens:
         rag_context = "### REFERENCIAL TEÓRICO BUSCADO (RAG) ###\n"
-        for i, doc in enumerate(relevant_docs, 1):
-            doc_content = str(doc)
-            doc_clean = doc_content.replace('{', '').replace('}', '').replace("'", "").replace('"', '')
-            rag_context += f"--- Fonte {i} ---\n{doc_clean[:500]}...\n"
+        for i, registro in enumerate(passagens, 1):
+            cabecalho = f"--- Fonte {i}"
+            if registro.get("colecao"):
+                cabecalho += f" [{registro['colecao']}]"
+            if registro.get("similaridade") is not None:
+                cabecalho += f" (similaridade {registro['similaridade']:.3f})"
+            rag_context += f"{cabecalho} ---\n"
+            if registro.get("metadados"):
+                metadados = "; ".join(f"{k}: {v}" for k, v in registro["metadados"].items())
+                rag_context += f"Metadados: {metadados[:200]}\n"
+            rag_context += f"{registro['conteudo']}\n"
     else:
         rag_context = "Referencial teórico não retornou resultados específicos relevantes."
-    
+    return _prompt_revisao(content, rag_context), passagens
+
+
+def _prompt_revisao(content: str, rag_context: str) -> str:
     # 4. PROMPT DE GERAÇÃO AUMENTADA (Mantendo o prompt anterior, mas removendo a 'instrucao_incremental')
     final_prompt = f"""
     Você é um **Revisor Técnico Sênior** com foco na área agrícola, rigoroso, preciso e com a missão de garantir a **veracidade científica absoluta** do texto de entrada.
@@ -179,23 +859,170 @@ def reescrever_revisor(content: str, colecao_override: Optional[str] = None) ->
     {rag_context}
     ---
 
-    ## ESTRUTURA DE RETORNO OBRIGATÓRIA:
+    ## ESTRUTURA DE RETORNO OBRIGATÓRIA (JSON):
 
-    Retorne o **TEXTO COMPLETAMENTE REVISADO E CORRIGIDO** primeiro.
-    
-    Após, coloque quais dados foram buscados no banco de dados para essa correção.
+    Retorne **SOMENTE** um objeto JSON válido, sem texto antes ou depois, com as chaves nesta ordem:
+    {FORMATO_JSON}
 
-    Em seguida, adicione uma subseção chamada "🛠️ Ajustes Técnicos e Correções" listando de forma concisa cada alteração significativa feita (correção ou enriquecimento) e qual fonte foi usada.
+    Em "fontes", liste apenas as Fontes do referencial teórico de onde vieram dados usados na correção.
+    Em "ajustes", liste de forma concisa cada alteração significativa feita (correção ou enriquecimento) e qual fonte foi usada.
     """
+    return final_prompt
 
-    # 5. Geração Final do LLM
-    response_text = modelo_texto.generate_content(final_prompt)
-        
-    return response_text
+
+def _fonte_usada(passagem: Dict, numero: int) -> Dict:
+    """Registro de uma passagem citada pelo modelo, sem o conteúdo."""
+    fonte = {"numero": numero, "_id": passagem.get("_id"), "metadados": passagem.get("metadados") or {}}
+    if passagem.get("colecao"):
+        fonte["colecao"] = passagem["colecao"]
+    return fonte
+
+
+def _revisar_partes(partes: List[str], colecao_override: Optional[str],
+                    streaming: bool) -> Iterator[Union[str, ResultadoRevisao]]:
+    """
+    Revisa as partes em sequência (uma única parte na maioria dos textos). Em streaming
+    produz o texto revisado conforme chega; termina sempre produzindo o ResultadoRevisao,
+    com os textos das partes em ordem e as fontes e ajustes de todas elas.
+    """
+    colecao, textos, fontes, ajustes, formato = None, [], [], [], "json"
+    for i, parte in enumerate(partes, 1):
+        if len(partes) > 1:
+            print(f"\n=== PARTE {i}/{len(partes)} ===")
+        preparo, erro = _preparar_revisao(parte, colecao_override)
+        if erro:
+            yield ResultadoRevisao.falha(*erro, colecao=colecao or colecao_override)
+            return
+        colecao = colecao or preparo["colecao"]
+        roteamento = {"tarefa": "revisao", "tokens_entrada": contar_tokens(parte, get_modelo_texto().model),
+                      "tokens_contexto": preparo["tokens_contexto"]}
+
+        # 5. Geração Final do LLM (JSON; em streaming, o texto é extraído conforme os trechos chegam)
+        if streaming:
+            if i > 1:
+                yield "\n\n"
+            extrator = ExtratorTexto()
+            for trecho in get_modelo_texto().generate_content_stream(preparo["prompt"], formato_json=True, **roteamento):
+                if trecho.startswith(PREFIXO_ERRO_LLM):
+                    yield ResultadoRevisao.falha(ERRO_GERACAO, trecho, colecao=colecao)
+                    return
+                visivel = extrator.alimentar(trecho)
+                if visivel:
+                    yield visivel
+            restante = extrator.finalizar()
+            if restante:
+                yield restante
+            bruto = extrator.bruto
+        else:
+            bruto = get_modelo_texto().generate_content(preparo["prompt"], formato_json=True, **roteamento)
+            if bruto.startswith(PREFIXO_ERRO_LLM):
+                yield ResultadoRevisao.falha(ERRO_GERACAO, bruto, colecao=colecao)
+                return
+
+        resposta = interpretar_resposta(bruto)
+        if not resposta["texto"]:
+            yield ResultadoRevisao.falha(ERRO_GERACAO, "Erro: resposta do LLM sem o texto revisado.", colecao=colecao)
+            return
+        if resposta["formato"] == "json_incompleto":
+            # JSON cortado no meio (ex: limite de tokens da resposta): o texto pode estar truncado
+            falha = ResultadoRevisao.falha(ERRO_GERACAO, "Erro: resposta do LLM truncada (JSON incompleto).",
+                                           colecao=colecao)
+            falha.texto = "\n\n".join(textos + [resposta["texto"]])
+            yield falha
+            return
+        if resposta["formato"] != "json":
+            print(f"⚠️ Resposta fora do formato JSON ({resposta['formato']}); texto extraído mesmo assim.")
+            formato = resposta["formato"]
+        textos.append(resposta["texto"])
+        prefixo = f"Parte {i}: " if len(partes) > 1 else ""
+        ajustes.extend(prefixo + ajuste for ajuste in resposta["ajustes"])
+        for numero in resposta["fontes"]:
+            if 1 <= numero <= len(preparo["passagens"]):
+                fonte = _fonte_usada(preparo["passagens"][numero - 1], numero)
+                if len(partes) > 1:
+                    fonte["parte"] = i
+                fontes.append(fonte)
+    yield ResultadoRevisao(texto="\n\n".join(textos), fontes=fontes, ajustes=ajustes, colecao=colecao, formato=formato)
 
 
+def _cache_revisao_get(chave: str) -> Optional[ResultadoRevisao]:
+    resposta = _cache_resposta_get(chave)
+    if resposta is None:
+        return None
+    try:
+        resultado = ResultadoRevisao.de_dict(json.loads(resposta))
+    except (ValueError, TypeError):
+        return None
+    resultado.cache = origem_ultima_resposta()
+    return resultado
 
 
+def _revisar(content: str, colecao_override: Optional[str], streaming: bool) -> Iterator[Union[str, ResultadoRevisao]]:
+    """Pipeline comum a reescrever_revisor e reescrever_revisor_stream (cache, divisão em partes e tempos)."""
+    with span("revisao", caracteres=len(content), streaming=streaming) as attrs:
+        inicio = time.perf_counter()
+        with coletar_etapas() as eventos:
+            chave = _chave_revisao(content, colecao_override)
+            resultado = _cache_revisao_get(chave)
+            attrs["cache_hit"] = resultado is not None
+            if resultado is not None:
+                if streaming:
+                    yield resultado.texto
+            else:
+                partes, colecao_partes = _dividir_entrada(content, colecao_override)
+                attrs["partes"] = len(partes)
+                for item in _revisar_partes(partes, colecao_partes, streaming):
+                    if isinstance(item, ResultadoRevisao):
+                        resultado = item
+                    else:
+                        yield item
+                # Só respostas no formato pedido vão para o cache (texto livre não é repetido por 24h)
+                if resultado.ok and resultado.formato == "json":
+                    _cache_resposta_set(chave, json.dumps(
+                        dict(resultado.para_dict(), tempos_ms={}, cache=None), ensure_ascii=False))
+        resultado.tempos_ms = dict(tempos_por_etapa(eventos), total=round((time.perf_counter() - inicio) * 1000, 2))
+        attrs["codigo_erro"] = resultado.erro
+    yield resultado
+
+
+def reescrever_revisor(content: str, colecao_override: Optional[str] = None) -> ResultadoRevisao:
+    """
+    Função principal que executa o pipeline RAG completo.
+    Atua como um Revisor Técnico, corrigindo imprecisões e enriquecendo o texto.
+    Aceita colecao_override para sobrepor a classificação do Gemini.
+    Respostas idênticas já geradas são servidas do cache de respostas.
+    Retorna um ResultadoRevisao (texto, fontes, ajustes, coleção, tempos e código de erro).
+    """
+    *_, resultado = _revisar(content, colecao_override, streaming=False)
+    return resultado
+
+
+def reescrever_revisor_stream(content: str, colecao_override: Optional[str] = None) -> Iterator[Union[str, ResultadoRevisao]]:
+    """
+    Versão em streaming de reescrever_revisor: produz o texto revisado em trechos (str)
+    conforme o LLM gera e, por último, o ResultadoRevisao completo.
+    """
+    return _revisar(content, colecao_override, streaming=True)
+
+
+# -----------------------------------------------------------
+# IV-B. ENTRADAS LONGAS (Divisão em partes dentro do orçamento)
+# -----------------------------------------------------------
+
+def _dividir_entrada(content: str, colecao_override: Optional[str]) -> Tuple[List[str], Optional[str]]:
+    """
+    Divide textos acima de MAX_TOKENS_ENTRADA em partes (nada é truncado).
+    Com várias partes e coleção automática, classifica uma única vez (pela
+    primeira parte) para que todas as partes consultem a mesma coleção.
+    """
+    partes = dividir_por_tokens(content, orcamento.MAX_TOKENS_ENTRADA, get_modelo_texto().model)
+    if len(partes) > 1:
+        print(f"✂️ Texto com mais de {orcamento.MAX_TOKENS_ENTRADA} tokens dividido em {len(partes)} partes.")
+        if not colecao_override or colecao_override == COLECAO_AUTOMATICA:
+            colecao = classificar_texto(partes[0])
+            colecao_override = colecao if colecao in COLECOES else None
+    return partes, colecao_override
+
 
 # -----------------------------------------------------------
 # V. FUNÇÃO ajuste_incremental (Para ajustes pós-revisão)
@@ -204,21 +1031,8 @@ def reescrever_revisor(content: str, colecao_override: Optional[str] = None) ->
 # V. FUNÇÃO ajuste_incremental (Para ajustes pós-revisão)
 # -----------------------------------------------------------
 
-def ajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
-    """
-    Aplica uma instrução incremental ao texto já revisado (saída do reescrever_revisor).
-    Mantém o formato e adiciona as mudanças solicitadas.
-    """
-    if not instrucao_incremental:
-        return texto_revisado # Retorna o texto original se não houver instrução
-
-    print("\n--- INICIANDO AJUSTE INCREMENTAL ---")
-    
-    # 1. TENTA ISOLAR APENAS O TEXTO PRINCIPAL DA SAÍDA RAG
-    # Isso é crucial para evitar que o LLM inclua as seções de metadados (Ajustes Técnicos) na resposta
-    partes = texto_revisado.split("🛠️ Ajustes Técnicos e Correções")
-    texto_principal_rag = partes[0].strip()
-    
+def _prompt_ajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
+    """Monta o prompt do ajuste incremental a partir do texto revisado (ResultadoRevisao.texto)."""
     # PROMPT DE AJUSTE INCREMENTAL REFINADO
     final_prompt = f"""
     Você é um **Editor Sênior** com a única missão de aplicar uma mudança incremental de forma fluida.
@@ -226,11 +1040,10 @@ def ajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
     Seu objetivo principal é editar o TEXTO PRINCIPAL A SER AJUSTADO:
     1. **APENAS** edite o texto para incorporar as informações da INSTRUÇÃO INCREMENTAL de forma natural, **mantendo o tom técnico**.
     2. Não é para mencionar a instrução incremental na saída.
-    3. **PROIBIDO** manter ou incluir as seções de metadados ("🛠️ Ajustes Técnicos e Correções", "Dados Buscados", etc.) na sua resposta.
 
     ---
     ### TEXTO PRINCIPAL A SER AJUSTADO ###
-    {texto_principal_rag}
+    {texto_revisado.strip()}
     
     ---
     ### INSTRUÇÃO INCREMENTAL A SER ACRESCENTADA ###
@@ -240,15 +1053,175 @@ def ajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
     
     Retorne **SOMENTE O TEXTO FINAL RESULTANTE**, completamente editado e pronto.
     """
+    return final_prompt
 
-    try:
-        # Usa o cliente LLM para gerar o conteúdo
-        response_text = modelo_texto.generate_content(final_prompt)
+
+# Instruções que citam parágrafos específicos ("Aumente o segundo parágrafo...") regeneram só esses parágrafos
+AJUSTE_POR_PARAGRAFO = os.getenv("REVISOR_AJUSTE_POR_PARAGRAFO", "1") == "1"
+
+
+def _prompt_ajuste_paragrafo(anterior: str, alvo: str, seguinte: str, numero: int, instrucao_incremental: str) -> str:
+    """Prompt para reescrever um único parágrafo, com os vizinhos apenas como contexto."""
+    final_prompt = f"""
+    Você é um **Editor Sênior** com a única missão de aplicar uma mudança incremental de forma fluida.
+
+    Seu objetivo é reescrever **APENAS** o PARÁGRAFO {numero} abaixo:
+    1. Incorpore a INSTRUÇÃO INCREMENTAL de forma natural, **mantendo o tom técnico** e a coerência com os parágrafos vizinhos.
+    2. Não é para mencionar a instrução incremental na saída.
+    3. **PROIBIDO** repetir os parágrafos vizinhos ou acrescentar títulos e comentários.
+
+    ---
+    ### PARÁGRAFO ANTERIOR (apenas contexto, não reescrever) ###
+    {anterior or "(início do texto)"}
+
+    ---
+    ### PARÁGRAFO {numero} A SER AJUSTADO ###
+    {alvo}
+
+    ---
+    ### PARÁGRAFO SEGUINTE (apenas contexto, não reescrever) ###
+    {seguinte or "(fim do texto)"}
+
+    ---
+    ### INSTRUÇÃO INCREMENTAL A SER ACRESCENTADA ###
+    {instrucao_incremental}
+
+    ---
+
+    Retorne **SOMENTE O NOVO TEXTO DO PARÁGRAFO {numero}**.
+    """
+    return final_prompt
+
+
+def _planejar_ajuste_paragrafos(texto_revisado: str, instrucao_incremental: str) -> Optional[Tuple[List[str], List[int]]]:
+    """
+    Retorna (segmentos do texto principal, índices dos segmentos a regenerar) quando a
+    instrução cita parágrafos específicos; None para ajustar o texto inteiro.
+    """
+    if not AJUSTE_POR_PARAGRAFO:
+        return None
+    segmentos = paragrafos.segmentar(texto_revisado.strip())
+    indices = paragrafos.indices_paragrafos(segmentos)
+    if len(indices) < 2:
+        return None
+    posicoes = paragrafos.alvos_instrucao(instrucao_incremental, len(indices))
+    if not posicoes:
+        return None
+    print(f"\n--- AJUSTE INCREMENTAL POR PARÁGRAFO: {[p + 1 for p in posicoes]} de {len(indices)} ---")
+    return segmentos, [indices[p] for p in posicoes]
+
+
+def _regenerar_paragrafo(segmentos: List[str], indice: int, instrucao_incremental: str) -> str:
+    indices = paragrafos.indices_paragrafos(segmentos)
+    posicao = indices.index(indice)
+    anterior = segmentos[indices[posicao - 1]] if posicao > 0 else ""
+    seguinte = segmentos[indices[posicao + 1]] if posicao + 1 < len(indices) else ""
+    final_prompt = _prompt_ajuste_paragrafo(anterior, segmentos[indice], seguinte, posicao + 1, instrucao_incremental)
+    novo = get_modelo_texto().generate_content(
+        final_prompt, tarefa="ajuste_paragrafo",
+        tokens_entrada=contar_tokens(segmentos[indice], get_modelo_texto().model)
+    ).strip()
+    if not novo or novo.startswith(PREFIXO_ERRO_LLM):
+        print(f"❌ Falha ao ajustar o parágrafo {posicao + 1}; mantendo o original. {novo}")
+        return segmentos[indice]
+    return novo
+
+
+def _ajustar_paragrafos(segmentos: List[str], alvos: List[int], instrucao_incremental: str) -> Iterator[str]:
+    """Regenera os parágrafos-alvo em paralelo e produz o texto completo, segmento a segmento, na ordem original."""
+    futuros = {
+        indice: executor_pipeline.submit(copiar_contexto(_regenerar_paragrafo), segmentos, indice, instrucao_incremental)
+        for indice in alvos
+    }
+    for indice, segmento in enumerate(segmentos):
+        yield futuros[indice].result() if indice in futuros else segmento
+
+
+def ajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
+    """
+    Aplica uma instrução incremental ao texto já revisado (ResultadoRevisao.texto).
+    Mantém o formato e adiciona as mudanças solicitadas.
+    """
+    with span("ajuste_incremental", caracteres=len(texto_revisado)) as attrs:
+        if not instrucao_incremental:
+            return texto_revisado # Retorna o texto original se não houver instrução
+
+        chave = _chave_ajuste(texto_revisado, instrucao_incremental)
+        response_text = _cache_resposta_get(chave)
+        attrs["cache_hit"] = response_text is not None
+        if response_text is not None:
+            return response_text
+
+        plano = _planejar_ajuste_paragrafos(texto_revisado, instrucao_incremental)
+        attrs["paragrafos_regenerados"] = len(plano[1]) if plano else 0
+
+        try:
+            if plano:
+                # Apenas os parágrafos citados na instrução são regenerados
+                response_text = "".join(_ajustar_paragrafos(*plano, instrucao_incremental))
+                _cache_resposta_set(chave, response_text)
+                print("✅ Ajuste Incremental concluído.")
+                return response_text
+
+            print("\n--- INICIANDO AJUSTE INCREMENTAL ---")
+            final_prompt = _prompt_ajuste_incremental(texto_revisado, instrucao_incremental)
+            # Usa o cliente LLM para gerar o conteúdo
+            response_text = get_modelo_texto().generate_content(
+                final_prompt, tarefa="ajuste", tokens_entrada=contar_tokens(texto_revisado, get_modelo_texto().model)
+            )
+            if response_text.startswith(PREFIXO_ERRO_LLM):
+                return texto_revisado # Mantém o texto revisado se a geração falhar
+            _cache_resposta_set(chave, response_text)
+            print("✅ Ajuste Incremental concluído.")
+            return response_text
+        except Exception as e:
+            print(f"❌ ERRO na Geração do Ajuste Incremental: {str(e)}")
+            return texto_revisado # Fallback para o texto original se falhar
+
+
+def ajuste_incremental_stream(texto_revisado: str, instrucao_incremental: str) -> Iterator[str]:
+    """
+    Versão em streaming de ajuste_incremental. Se a geração falhar antes do primeiro
+    trecho, produz o texto revisado sem alteração; no meio do streaming, levanta RuntimeError.
+    """
+    with span("ajuste_incremental", caracteres=len(texto_revisado), streaming=True) as attrs:
+        if not instrucao_incremental:
+            yield texto_revisado
+            return
+
+        chave = _chave_ajuste(texto_revisado, instrucao_incremental)
+        response_text = _cache_resposta_get(chave)
+        attrs["cache_hit"] = response_text is not None
+        if response_text is not None:
+            yield response_text
+            return
+
+        plano = _planejar_ajuste_paragrafos(texto_revisado, instrucao_incremental)
+        attrs["paragrafos_regenerados"] = len(plano[1]) if plano else 0
+        if plano:
+            trechos = []
+            for trecho in _ajustar_paragrafos(*plano, instrucao_incremental):
+                trechos.append(trecho)
+                yield trecho
+            _cache_resposta_set(chave, "".join(trechos))
+            print("✅ Ajuste Incremental concluído.")
+            return
+
+        print("\n--- INICIANDO AJUSTE INCREMENTAL (streaming) ---")
+        final_prompt = _prompt_ajuste_incremental(texto_revisado, instrucao_incremental)
+        trechos = []
+        tokens_entrada = contar_tokens(texto_revisado, get_modelo_texto().model)
+        for trecho in get_modelo_texto().generate_content_stream(final_prompt, tarefa="ajuste", tokens_entrada=tokens_entrada):
+            if trecho.startswith(PREFIXO_ERRO_LLM):
+                if trechos:
+                    # Parte do ajuste já foi entregue: não há como voltar ao texto revisado
+                    raise RuntimeError(trecho)
+                yield texto_revisado
+                return
+            trechos.append(trecho)
+            yield trecho
+        _cache_resposta_set(chave, "".join(trechos))
         print("✅ Ajuste Incremental concluído.")
-        return response_text
-    except Exception as e:
-        print(f"❌ ERRO na Geração do Ajuste Incremental: {str(e)}")
-        return texto_revisado # Fallback para o texto original se falhar
 # -----------------------------------------------------------
 # V. TESTE PRINCIPAL (main) - EXATAMENTE COMO SOLICITADO
 # -----------------------------------------------------------
@@ -278,16 +1251,16 @@ if __name__ == "__main__":
         print("✅ REVISÃO RAG FINALIZADA")
         print("=" * 70)
         print("\n### RESULTADO RAG COMPLETO ###")
-        print(resultado_rag)
+        print(resultado_rag.como_texto())
         print("=" * 70)
 
         # Etapa 2: Ajuste Incremental
         print("\n" + "#" * 30 + " SEGUNDA ETAPA " + "#" * 30)
         instrucao = input("Insira a INSTRUÇÃO INCREMENTAL (Deixe vazio para finalizar): ")
 
-        if instrucao:
-            # 2. Executa o Ajuste Incremental no resultado do RAG
-            resultado_final = ajuste_incremental(resultado_rag, instrucao)
+        if instrucao and resultado_rag.ok:
+            # 2. Executa o Ajuste Incremental no texto revisado pelo RAG
+            resultado_final = ajuste_incremental(resultado_rag.texto, instrucao)
             
             print("\n" + "=" * 70)
             print("✨ AJUSTE INCREMENTAL CONCLUÍDO")
@@ -295,7 +1268,7 @@ if __name__ == "__main__":
             print("\n### RESULTADO FINAL APÓS AJUSTE INCREMENTAL ###")
             print(resultado_final)
         else:
-            resultado_final = resultado_rag
-            print("Nenhuma instrução incremental fornecida. O resultado final é o resultado RAG.")
+            resultado_final = resultado_rag.texto
+            print("Nenhuma instrução incremental aplicada. O resultado final é o resultado RAG.")
             
         print("=" * 70)
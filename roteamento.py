@@ -0,0 +1,198 @@
+import os
+import json
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from metricas import span
+from orcamento import contar_tokens
+from saida_estruturada import PREFIXO_ERRO_LLM
+
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÃO DOS NÍVEIS DE MODELO
+# -----------------------------------------------------------
+
+# Desativado, todas as chamadas usam o nível "padrao" (comportamento anterior)
+ROTEAMENTO_ATIVO = os.getenv("REVISOR_ROTEAMENTO", "1") == "1"
+
+# Do mais rápido/barato ao mais capaz. Custos em US$ por 1M tokens; velocidade
+# de geração (tokens/s) e latência fixa (s) usadas apenas nas estimativas do orçamento.
+NIVEIS: List[Dict] = [
+    {"nome": "rapido", "modelo": os.getenv("REVISOR_MODELO_RAPIDO", "gpt-4o-mini"),
+     "custo_entrada": 0.15, "custo_saida": 0.60, "tokens_por_s": 90, "latencia_base_s": 0.5},
+    {"nome": "padrao", "modelo": os.getenv("REVISOR_MODELO_PADRAO", "gpt-3.5-turbo"),
+     "custo_entrada": 0.50, "custo_saida": 1.50, "tokens_por_s": 70, "latencia_base_s": 0.5},
+    {"nome": "robusto", "modelo": os.getenv("REVISOR_MODELO_ROBUSTO", "gpt-4o"),
+     "custo_entrada": 2.50, "custo_saida": 10.00, "tokens_por_s": 50, "latencia_base_s": 0.8},
+]
+NIVEL_PADRAO = 1
+
+# Texto de entrada (tokens) até o qual basta o nível rápido (legendas, correções de uma linha)
+LIMITE_TOKENS_RAPIDO = int(os.getenv("REVISOR_LIMITE_TOKENS_RAPIDO", "150"))
+# A partir daqui (manuais, textos longos) usa o nível robusto
+LIMITE_TOKENS_ROBUSTO = int(os.getenv("REVISOR_LIMITE_TOKENS_ROBUSTO", "2000"))
+# Contexto RAG grande (muitos dados a conferir) sobe a revisão intermediária para o nível robusto
+LIMITE_CONTEXTO_ROBUSTO = int(os.getenv("REVISOR_LIMITE_CONTEXTO_ROBUSTO", "1200"))
+
+# Orçamento por chamada: o nível desce até caber nos dois limites (os padrões comportam
+# o nível robusto numa parte de MAX_TOKENS_ENTRADA tokens)
+CUSTO_MAXIMO_USD = float(os.getenv("REVISOR_CUSTO_MAXIMO_USD", "0.06"))
+LATENCIA_MAXIMA_S = float(os.getenv("REVISOR_LATENCIA_MAXIMA_S", "90"))
+# Prazo de cada tentativa (com o roteamento ativo); esgotado, a chamada passa para outro nível (fallback)
+TIMEOUT_TENTATIVA_S = float(os.getenv("REVISOR_TIMEOUT_LLM_S", "120"))
+MAX_TENTATIVAS = int(os.getenv("REVISOR_TENTATIVAS_ROTEAMENTO", "2"))
+
+# Tarefas conhecidas e a fração estimada da saída em relação à entrada
+TAREFAS = {"revisao": 1.2, "ajuste": 1.1, "ajuste_paragrafo": 1.3}
+
+
+# -----------------------------------------------------------
+# II. DECISÃO DE ROTEAMENTO
+# -----------------------------------------------------------
+
+def estimar(nivel: int, tokens_prompt: int, tokens_saida: int) -> Dict[str, float]:
+    config = NIVEIS[nivel]
+    custo = (tokens_prompt * config["custo_entrada"] + tokens_saida * config["custo_saida"]) / 1_000_000
+    latencia = config["latencia_base_s"] + tokens_saida / config["tokens_por_s"]
+    return {"custo_estimado_usd": round(custo, 6), "latencia_estimada_s": round(latencia, 2)}
+
+
+def decidir(tarefa: str, tokens_prompt: int, tokens_entrada: int, tokens_contexto: int = 0) -> Dict:
+    """
+    Escolhe o nível do modelo para uma chamada:
+    1. pelo tamanho do texto de entrada (rápido / padrão / robusto);
+    2. revisões com contexto RAG grande sobem do padrão para o robusto;
+    3. ajustes (sem conferência de dados) descem um nível; ajuste de um parágrafo usa o rápido;
+    4. desce enquanto a estimativa de custo ou latência estourar o orçamento.
+    """
+    if not ROTEAMENTO_ATIVO:
+        return dict(tarefa=tarefa, nivel=NIVEL_PADRAO, modelo=NIVEIS[NIVEL_PADRAO]["modelo"], motivo="roteamento desativado",
+                    tokens_entrada=tokens_entrada, tokens_contexto=tokens_contexto,
+                    **estimar(NIVEL_PADRAO, tokens_prompt, int(tokens_entrada * TAREFAS.get(tarefa, 1.2))))
+
+    if tokens_entrada <= LIMITE_TOKENS_RAPIDO:
+        nivel, motivo = 0, f"entrada curta ({tokens_entrada} tokens)"
+    elif tokens_entrada >= LIMITE_TOKENS_ROBUSTO:
+        nivel, motivo = 2, f"entrada longa ({tokens_entrada} tokens)"
+    else:
+        nivel, motivo = 1, f"entrada média ({tokens_entrada} tokens)"
+    if tarefa == "revisao" and nivel == 1 and tokens_contexto >= LIMITE_CONTEXTO_ROBUSTO:
+        nivel, motivo = 2, motivo + f", contexto grande ({tokens_contexto} tokens)"
+    elif tarefa == "ajuste" and nivel > 0:
+        nivel, motivo = nivel - 1, motivo + ", ajuste incremental"
+    elif tarefa == "ajuste_paragrafo":
+        nivel, motivo = 0, "ajuste de um parágrafo"
+
+    tokens_saida = int(tokens_entrada * TAREFAS.get(tarefa, 1.2)) + 100
+    estimativa = estimar(nivel, tokens_prompt, tokens_saida)
+    while nivel > 0 and (estimativa["custo_estimado_usd"] > CUSTO_MAXIMO_USD
+                         or estimativa["latencia_estimada_s"] > LATENCIA_MAXIMA_S):
+        nivel -= 1
+        motivo += f", orçamento -> {NIVEIS[nivel]['nome']}"
+        estimativa = estimar(nivel, tokens_prompt, tokens_saida)
+    return dict(tarefa=tarefa, nivel=nivel, modelo=NIVEIS[nivel]["modelo"], motivo=motivo,
+                tokens_entrada=tokens_entrada, tokens_contexto=tokens_contexto, **estimativa)
+
+
+def ordem_fallback(nivel: int) -> List[int]:
+    """Nível escolhido primeiro; depois os mais rápidos (mais chance de responder no prazo) e, por fim, os maiores."""
+    return [nivel] + list(range(nivel - 1, -1, -1)) + list(range(nivel + 1, len(NIVEIS)))
+
+
+# -----------------------------------------------------------
+# III. CLASSE RoteadorLLM (Mesma interface do LLMClient)
+# -----------------------------------------------------------
+
+class RoteadorLLM:
+    """
+    Fica na frente dos LLMClient de cada nível e expõe a mesma interface
+    (generate_content / generate_content_stream). Cada chamada escolhe o modelo
+    pela tarefa, tamanho da entrada e do contexto e pelo orçamento; em timeout ou
+    falha transitória, repete em outro nível. As decisões são registradas na
+    etapa "roteamento" das métricas.
+    """
+    def __init__(self, criar_cliente: Callable[[str], object]):
+        self._criar_cliente = criar_cliente
+        self._clientes: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        # Modelo de referência (contagem de tokens e chaves de cache)
+        self.model = NIVEIS[NIVEL_PADRAO]["modelo"]
+        self.client = self._cliente(self.model).client
+        self.assinatura = json.dumps([ROTEAMENTO_ATIVO, [n["modelo"] for n in NIVEIS], LIMITE_TOKENS_RAPIDO,
+                                      LIMITE_TOKENS_ROBUSTO, LIMITE_CONTEXTO_ROBUSTO, CUSTO_MAXIMO_USD, LATENCIA_MAXIMA_S])
+
+    def _cliente(self, modelo: str):
+        with self._lock:
+            if modelo not in self._clientes:
+                self._clientes[modelo] = self._criar_cliente(modelo)
+            return self._clientes[modelo]
+
+    def _decidir(self, prompt: str, tarefa: str, tokens_entrada: Optional[int], tokens_contexto: int) -> Dict:
+        tokens_prompt = contar_tokens(prompt, self.model)
+        if tokens_entrada is None:
+            tokens_entrada = max(0, tokens_prompt - tokens_contexto)
+        with span("roteamento", tarefa=tarefa, tokens_prompt=tokens_prompt) as attrs:
+            decisao = decidir(tarefa, tokens_prompt, tokens_entrada, tokens_contexto)
+            attrs.update(decisao)
+        print(f"🧭 Roteamento ({tarefa}): {decisao['modelo']} [{NIVEIS[decisao['nivel']]['nome']}] — {decisao['motivo']}. "
+              f"Estimativa: US$ {decisao['custo_estimado_usd']:.4f}, {decisao['latencia_estimada_s']}s.")
+        return decisao
+
+    def _tentativas(self, nivel: int) -> List[int]:
+        return ordem_fallback(nivel)[:max(1, MAX_TENTATIVAS)] if ROTEAMENTO_ATIVO else [nivel]
+
+    @staticmethod
+    def _timeout() -> Optional[float]:
+        # Sem roteamento, mantém o prazo e as novas tentativas padrão do SDK
+        return TIMEOUT_TENTATIVA_S if ROTEAMENTO_ATIVO else None
+
+    @staticmethod
+    def _recuperavel(erro: Exception) -> bool:
+        import openai
+        return isinstance(erro, (openai.APITimeoutError, openai.APIConnectionError,
+                                 openai.RateLimitError, openai.InternalServerError))
+
+    @staticmethod
+    def _registrar_fallback(tarefa: str, modelo: str, erro: Exception) -> None:
+        with span("roteamento", tarefa=tarefa, modelo=modelo, fallback=True, motivo=f"falha: {type(erro).__name__}"):
+            pass
+        print(f"⚠️ Roteamento ({tarefa}): {modelo} falhou ({type(erro).__name__}); tentando outro modelo.")
+
+    def generate_content(self, prompt: str, formato_json: bool = False, tarefa: str = "revisao",
+                         tokens_entrada: Optional[int] = None, tokens_contexto: int = 0) -> str:
+        decisao = self._decidir(prompt, tarefa, tokens_entrada, tokens_contexto)
+        print("\n--- Chamando OpenAI Chat Completion ---")
+        erro = None
+        for nivel in self._tentativas(decisao["nivel"]):
+            modelo = NIVEIS[nivel]["modelo"]
+            try:
+                return self._cliente(modelo).gerar(prompt, formato_json, timeout=self._timeout())
+            except Exception as e:
+                erro = e
+                if not self._recuperavel(e):
+                    break
+                self._registrar_fallback(tarefa, modelo, e)
+        print(f"❌ {PREFIXO_ERRO_LLM}: {erro}")
+        return f"{PREFIXO_ERRO_LLM} ({type(erro).__name__}): {str(erro)}"
+
+    def generate_content_stream(self, prompt: str, formato_json: bool = False, tarefa: str = "revisao",
+                                tokens_entrada: Optional[int] = None, tokens_contexto: int = 0) -> Iterator[str]:
+        decisao = self._decidir(prompt, tarefa, tokens_entrada, tokens_contexto)
+        print("\n--- Chamando OpenAI Chat Completion (streaming) ---")
+        erro = None
+        for nivel in self._tentativas(decisao["nivel"]):
+            modelo = NIVEIS[nivel]["modelo"]
+            iniciado = False
+            try:
+                for trecho in self._cliente(modelo).gerar_stream(prompt, formato_json, timeout=self._timeout()):
+                    iniciado = True
+                    yield trecho
+                return
+            except Exception as e:
+                erro = e
+                # Depois do primeiro trecho não há como trocar de modelo sem duplicar o texto
+                if iniciado or not self._recuperavel(e):
+                    break
+                self._registrar_fallback(tarefa, modelo, e)
+        print(f"❌ {PREFIXO_ERRO_LLM}: {erro}")
+        yield f"{PREFIXO_ERRO_LLM} ({type(erro).__name__}): {str(erro)}"
@@ -0,0 +1,223 @@
+import re
+import json
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+
+# -----------------------------------------------------------
+# I. CONTRATO DE SAÍDA DA REVISÃO
+# -----------------------------------------------------------
+
+SECAO_AJUSTES = "🛠️ Ajustes Técnicos e Correções"
+# Prefixo das mensagens de erro produzidas pelo LLMClient (não pelo modelo)
+PREFIXO_ERRO_LLM = "ERRO NA GERAÇÃO DO LLM"
+
+# Códigos de erro do ResultadoRevisao
+ERRO_CLASSIFICACAO = "classificacao"
+ERRO_EMBEDDING = "embedding"
+ERRO_GERACAO = "geracao_llm"
+ERRO_EXECUCAO = "execucao"
+
+# Formato pedido ao LLM: "texto_revisado" vem primeiro para que o streaming mostre o texto
+# assim que ele começa a chegar; fontes e ajustes só são lidos ao final
+FORMATO_JSON = """{
+      "texto_revisado": "<TEXTO COMPLETAMENTE REVISADO E CORRIGIDO, parágrafos separados por \\n\\n>",
+      "fontes": [<números das Fontes do referencial teórico efetivamente usadas, ex: 1, 3>],
+      "ajustes": ["<cada alteração significativa (correção ou enriquecimento), concisa, com a fonte usada>"]
+    }"""
+
+
+@dataclass
+class ResultadoRevisao:
+    """
+    Resultado de reescrever_revisor. `erro` é um dos códigos ERRO_* (None = sucesso)
+    e `mensagem_erro` traz o detalhe para exibição. `fontes` são os registros das
+    passagens citadas pelo modelo; `tempos_ms`, a duração de cada etapa; `formato`,
+    "json" ou "livre" (resposta fora do formato pedido, que não vai para o cache).
+    """
+    texto: str = ""
+    fontes: List[Dict] = field(default_factory=list)
+    ajustes: List[str] = field(default_factory=list)
+    colecao: Optional[str] = None
+    tempos_ms: Dict[str, float] = field(default_factory=dict)
+    erro: Optional[str] = None
+    mensagem_erro: Optional[str] = None
+    cache: Optional[str] = None
+    formato: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.erro is None
+
+    @classmethod
+    def falha(cls, erro: str, mensagem: str, colecao: Optional[str] = None) -> "ResultadoRevisao":
+        return cls(colecao=colecao, erro=erro, mensagem_erro=mensagem)
+
+    def para_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def de_dict(cls, dados: Dict) -> "ResultadoRevisao":
+        return cls(**{chave: valor for chave, valor in dados.items() if chave in cls.__dataclass_fields__})
+
+    def secao_ajustes(self) -> str:
+        """Ajustes e fontes em texto, para exibição."""
+        linhas = [f"- {ajuste}" for ajuste in self.ajustes] or ["Nenhum ajuste informado."]
+        if self.fontes:
+            linhas.append("\nFontes utilizadas:")
+            linhas.extend(f"- {descrever_fonte(fonte)}" for fonte in self.fontes)
+        return "\n".join(linhas)
+
+    def como_texto(self) -> str:
+        """Formato de texto único (texto revisado seguido da seção de ajustes)."""
+        if not self.ok:
+            return self.mensagem_erro or ""
+        return f"{self.texto}\n\n{SECAO_AJUSTES}\n{self.secao_ajustes()}"
+
+
+def descrever_fonte(fonte: Dict) -> str:
+    metadados = fonte.get("metadados") or {}
+    titulo = next((metadados[c] for c in ("titulo", "source", "fonte") if metadados.get(c)), fonte.get("_id"))
+    colecao = f" [{fonte['colecao']}]" if fonte.get("colecao") else ""
+    return f"Fonte {fonte.get('numero')}{colecao}: {titulo}"
+
+
+# -----------------------------------------------------------
+# II. EXTRAÇÃO INCREMENTAL DO TEXTO (Streaming)
+# -----------------------------------------------------------
+
+_INICIO_TEXTO = re.compile(r'"texto_revisado"\s*:\s*"')
+_TRECHO_SIMPLES = re.compile(r'[^"\\]+')
+
+
+class ExtratorTexto:
+    """
+    Extrai o texto revisado da resposta conforme os trechos chegam, sem reler a
+    resposta inteira a cada trecho. Em JSON, decodifica o valor de "texto_revisado";
+    se o modelo responder em texto livre, repassa o texto até a seção de ajustes.
+    """
+    def __init__(self):
+        self.bruto = ""
+        self.modo: Optional[str] = None  # None (aguardando o 1º caractere), "json" ou "livre"
+        self._posicao: Optional[int] = None
+        self._fim = False
+
+    def alimentar(self, trecho: str) -> str:
+        """Acrescenta um trecho da resposta e retorna o texto novo (já decodificado)."""
+        self.bruto += trecho
+        if self.modo is None:
+            inicio = self.bruto.lstrip()
+            if not inicio:
+                return ""
+            self.modo = "json" if inicio[0] in "{`" else "livre"
+        return self._json() if self.modo == "json" else self._livre()
+
+    def finalizar(self) -> str:
+        """Texto ainda retido ao fim da resposta (texto livre sem a seção de ajustes)."""
+        if self.modo != "livre":
+            return ""
+        texto = self.bruto.partition(SECAO_AJUSTES)[0].rstrip()
+        restante = texto[self._posicao or 0:]
+        self._posicao = len(texto)
+        return restante
+
+    def _json(self) -> str:
+        if self._fim:
+            return ""
+        if self._posicao is None:
+            encontrado = _INICIO_TEXTO.search(self.bruto)
+            if not encontrado:
+                return ""
+            self._posicao = encontrado.end()
+        bruto, i, partes = self.bruto, self._posicao, []
+        while i < len(bruto):
+            simples = _TRECHO_SIMPLES.match(bruto, i)
+            if simples:
+                partes.append(simples.group())
+                i = simples.end()
+                continue
+            if bruto[i] == '"':
+                self._fim = True
+                break
+            # Sequência de escape: só é decodificada quando chega completa
+            tamanho = 6 if bruto[i + 1:i + 2] == "u" else 2
+            if tamanho == 6 and bruto[i + 2:i + 3].lower() == "d" and bruto[i + 3:i + 4].lower() in ("8", "9", "a", "b"):
+                tamanho = 12  # par substituto (ex: emoji) em dois \uXXXX
+            sequencia = bruto[i:i + tamanho]
+            if len(sequencia) < tamanho:
+                break
+            try:
+                partes.append(json.loads(f'"{sequencia}"'))
+            except ValueError:
+                partes.append(sequencia)
+            i += tamanho
+        self._posicao = i
+        return "".join(partes)
+
+    def _livre(self) -> str:
+        inicio_secao = self.bruto.find(SECAO_AJUSTES)
+        # Sem a seção ainda, segura um sufixo que pode ser o começo do cabeçalho
+        visivel = self.bruto[:inicio_secao] if inicio_secao >= 0 else self.bruto[:-len(SECAO_AJUSTES)]
+        seguro = len(visivel.rstrip())
+        emitido = self._posicao or 0
+        if seguro <= emitido:
+            return ""
+        self._posicao = seguro
+        return self.bruto[emitido:seguro]
+
+
+# -----------------------------------------------------------
+# III. INTERPRETAÇÃO DA RESPOSTA COMPLETA
+# -----------------------------------------------------------
+
+def _carregar_json(bruto: str) -> Optional[Dict]:
+    texto = re.sub(r"^```(?:json)?\s*|\s*```$", "", bruto.strip())
+    for candidato in (texto, texto[texto.find("{"):texto.rfind("}") + 1]):
+        try:
+            dados = json.loads(candidato)
+        except ValueError:
+            continue
+        if isinstance(dados, dict):
+            return dados
+    return None
+
+
+def _numeros_fontes(valores) -> List[int]:
+    numeros = []
+    for valor in valores if isinstance(valores, list) else []:
+        encontrado = re.search(r"\d+", str(valor))
+        if encontrado and int(encontrado.group()) not in numeros:
+            numeros.append(int(encontrado.group()))
+    return numeros
+
+
+def _lista_textos(valores) -> List[str]:
+    itens = []
+    for valor in valores if isinstance(valores, list) else [valores] if valores else []:
+        if isinstance(valor, dict):
+            valor = "; ".join(str(v) for v in valor.values())
+        if str(valor).strip():
+            itens.append(str(valor).strip())
+    return itens
+
+
+def interpretar_resposta(bruto: str) -> Dict:
+    """
+    Lê a resposta completa do modelo: {"texto", "fontes" (números), "ajustes", "formato"}.
+    Aceita o JSON pedido, JSON truncado (aproveita o texto já decodificado) e,
+    como última opção, texto livre com a seção de ajustes.
+    """
+    dados = _carregar_json(bruto)
+    if dados is not None and isinstance(dados.get("texto_revisado"), str):
+        return {"texto": dados["texto_revisado"].strip(), "fontes": _numeros_fontes(dados.get("fontes")),
+                "ajustes": _lista_textos(dados.get("ajustes")), "formato": "json"}
+
+    extrator = ExtratorTexto()
+    texto = extrator.alimentar(bruto)
+    if extrator.modo == "json" and texto.strip():
+        return {"texto": texto.strip(), "fontes": [], "ajustes": [], "formato": "json_incompleto"}
+
+    texto, _, secao = bruto.partition(SECAO_AJUSTES)
+    ajustes = [linha.strip().lstrip("-*•").strip() for linha in secao.splitlines()]
+    return {"texto": texto.strip(), "fontes": _numeros_fontes(re.findall(r"Fonte\s+\d+", secao)),
+            "ajustes": [ajuste for ajuste in ajustes if ajuste], "formato": "livre"}
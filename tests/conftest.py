@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Módulos planos na raiz do repositório; caches e filas dos testes ficam num diretório temporário
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("REVISOR_CACHE_DIR", tempfile.mkdtemp(prefix="revisor_testes_"))
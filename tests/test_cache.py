@@ -0,0 +1,44 @@
+import time
+
+import cache
+from cache import CacheDisco
+
+
+def _soma(disco: CacheDisco) -> int:
+    return disco._conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM cache").fetchone()[0]
+
+
+def _total(disco: CacheDisco) -> int:
+    return disco._conn.execute("SELECT tamanho FROM total").fetchone()[0]
+
+
+def test_remove_os_menos_acessados(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DISCO_INTERVALO_ACESSO_S", 0)
+    disco = CacheDisco(str(tmp_path / "c.sqlite3"), max_bytes=30)
+    for chave in "abc":
+        disco.set(chave, b"x" * 10)
+        time.sleep(0.01)
+    assert disco.get("a") == b"x" * 10  # "a" passa a ser o mais recente
+    disco.set("d", b"y" * 10)
+    assert disco.get("b") is None
+    assert disco.get("a") is not None and disco.get("c") is not None and disco.get("d") is not None
+    assert _total(disco) == _soma(disco) == 30
+
+
+def test_substituicao_e_expiracao_mantem_o_total(tmp_path):
+    disco = CacheDisco(str(tmp_path / "c.sqlite3"), max_bytes=1000, ttl=0.05)
+    disco.set("a", b"x" * 10)
+    disco.set("a", b"x" * 25)
+    assert _total(disco) == 25
+    time.sleep(0.1)
+    assert disco.get("a") is None
+    disco.set("b", b"y")
+    assert _total(disco) == _soma(disco) == 1
+
+
+def test_total_compartilhado_entre_conexoes(tmp_path):
+    caminho = str(tmp_path / "c.sqlite3")
+    primeiro, segundo = CacheDisco(caminho, max_bytes=100), CacheDisco(caminho, max_bytes=100)
+    for i in range(30):
+        (primeiro if i % 2 else segundo).set(f"k{i % 13}", b"z" * (7 + i % 5))
+    assert _total(primeiro) == _soma(primeiro) <= 100
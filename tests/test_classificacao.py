@@ -0,0 +1,19 @@
+import classificacao
+from classificacao import pre_classificar
+
+
+def test_pre_classificacao_local():
+    assert pre_classificar("Orondis® é um fungicida para a soja") == ("PRODUTO", 6 / 8)
+    assert pre_classificar("Texto sem palavras-chave") == (None, 0.0)
+
+
+def test_chave_do_cache_muda_com_as_regras(monkeypatch):
+    chave = classificacao._chave_texto("texto")
+    monkeypatch.setattr(classificacao, "REGRAS_LOCAIS", {"PRODUTO": [(r"\bnovo\b", 3)]})
+    classificacao._impressao_classificacao.cache_clear()
+    try:
+        assert classificacao._chave_texto("texto") != chave
+    finally:
+        monkeypatch.undo()
+        classificacao._impressao_classificacao.cache_clear()
+    assert classificacao._chave_texto("texto") == chave
@@ -0,0 +1,73 @@
+from collections import deque
+
+import pytest
+import requests
+
+import conexao_banco
+import limites
+from conexao_banco import CircuitoAbertoError, Disjuntor, TransporteHTTP
+
+
+def _resposta(status: int) -> requests.Response:
+    resposta = requests.Response()
+    resposta.status_code = status
+    resposta.url = "http://astra.teste/colecao"
+    resposta._content = b"{}"
+    return resposta
+
+
+class SessaoFalsa:
+    """Devolve (ou levanta) os resultados programados, um por chamada de post."""
+    def __init__(self, *resultados):
+        self.resultados = deque(resultados)
+        self.chamadas = 0
+
+    def post(self, url, json=None, timeout=None):
+        self.chamadas += 1
+        resultado = self.resultados.popleft()
+        if isinstance(resultado, Exception):
+            raise resultado
+        return _resposta(resultado)
+
+
+@pytest.fixture
+def transporte(monkeypatch):
+    monkeypatch.setattr(conexao_banco, "ASTRA_BACKOFF_BASE", 0)
+    monkeypatch.setattr(limites, "PAUSA_BASE_S", 0.001)
+    transporte = TransporteHTTP({}, provedor="teste_http", max_tentativas=3)
+    transporte.disjuntor = Disjuntor(limite_falhas=2, espera=60)
+    return transporte
+
+
+def test_repete_5xx_e_erros_de_conexao(transporte):
+    transporte.session = SessaoFalsa(503, requests.exceptions.ConnectionError(), 200)
+    assert transporte.post("http://astra.teste/colecao", {}).status_code == 200
+    assert transporte.session.chamadas == 3
+    assert transporte.metricas()["retentativas"] == 2
+
+
+def test_nao_repete_4xx(transporte):
+    transporte.session = SessaoFalsa(400)
+    with pytest.raises(requests.exceptions.HTTPError):
+        transporte.post("http://astra.teste/colecao", {})
+    assert transporte.session.chamadas == 1
+    assert transporte.disjuntor.estado == "fechado"
+
+
+def test_429_volta_para_a_fila_sem_gastar_tentativa(transporte):
+    transporte.max_tentativas = 1
+    transporte.session = SessaoFalsa(429, 429, 200)
+    assert transporte.post("http://astra.teste/colecao", {}).status_code == 200
+    assert transporte.metricas()["limitadas"] == 2
+
+
+def test_disjuntor_abre_apos_falhas_consecutivas(transporte):
+    transporte.session = SessaoFalsa(*[503] * 6)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.HTTPError):
+            transporte.post("http://astra.teste/colecao", {})
+    assert transporte.disjuntor.estado == "aberto"
+    chamadas = transporte.session.chamadas
+    with pytest.raises(CircuitoAbertoError):
+        transporte.post("http://astra.teste/colecao", {})
+    assert transporte.session.chamadas == chamadas
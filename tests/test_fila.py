@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+import fila
+from fila import FilaTarefas, CONCLUIDA
+
+
+@pytest.fixture
+def tarefas(tmp_path, monkeypatch):
+    monkeypatch.setattr(fila, "FILA_CONCESSAO_S", 0.2)
+    return FilaTarefas(str(tmp_path / "fila.sqlite3"))
+
+
+def test_entrada_identica_reaproveita_a_tarefa(tarefas):
+    assert tarefas.submeter("texto", "PRODUTO") == tarefas.submeter("texto", "PRODUTO")
+    assert tarefas.submeter("texto", "CULTURA") != tarefas.submeter("texto", "PRODUTO")
+
+
+def test_concessao_renovada_nao_e_reassumida(tarefas):
+    tarefas.submeter("texto")
+    reservada = tarefas._reservar()
+    for _ in range(4):
+        time.sleep(0.1)
+        assert tarefas._renovar(reservada["id"], reservada["dono"])
+    assert tarefas._reservar() is None
+
+
+def test_concessao_expirada_e_reassumida_e_o_dono_antigo_nao_grava(tarefas):
+    id_tarefa = tarefas.submeter("texto")
+    antiga = tarefas._reservar()
+    time.sleep(0.3)
+    nova = tarefas._reservar()
+    assert nova["id"] == id_tarefa and nova["dono"] != antiga["dono"]
+    assert not tarefas._atualizar(id_tarefa, antiga["dono"], estado=CONCLUIDA, resultado="{}")
+    assert not tarefas._renovar(id_tarefa, antiga["dono"])
+    assert tarefas._atualizar(id_tarefa, nova["dono"], estado=CONCLUIDA, resultado="{}")
+    assert tarefas.consultar(id_tarefa)["estado"] == CONCLUIDA
@@ -0,0 +1,56 @@
+import pytest
+
+import limites
+from limites import AgendadorProvedor, BaldeFichas
+
+
+class Limitado(Exception):
+    status_code = 429
+
+
+def test_balde_devolucao_restaura_as_fichas():
+    balde = BaldeFichas(por_minuto=6, capacidade=100)
+    balde.consumir(60)
+    balde.consumir(-60)  # registrar_uso(estimados=60, reais=0)
+    assert balde.fichas == pytest.approx(100)
+
+
+def test_balde_inativo_nao_espera():
+    balde = BaldeFichas(por_minuto=0)
+    balde.consumir(1000)
+    assert balde.espera(1000, 0.0) == 0.0
+
+
+@pytest.fixture
+def agendador(monkeypatch):
+    monkeypatch.setattr(limites, "PAUSA_BASE_S", 0.001)
+    agendador = AgendadorProvedor("teste_limites", rpm=0, tpm=6)
+    agendador.tokens = BaldeFichas(por_minuto=6, capacidade=100)  # reposição desprezível no teste
+    monkeypatch.setitem(limites._agendadores, "teste_limites", agendador)
+    return agendador
+
+
+def test_executar_reserva_tokens_uma_vez_apesar_dos_429(agendador):
+    chamadas = []
+
+    def funcao():
+        chamadas.append(1)
+        if len(chamadas) < 3:
+            raise Limitado()
+        return "ok"
+
+    assert limites.executar("teste_limites", funcao, tokens=50) == "ok"
+    assert len(chamadas) == 3
+    assert agendador.tokens.fichas == pytest.approx(50, abs=0.5)
+
+
+def test_executar_propaga_outros_erros_sem_repetir(agendador):
+    chamadas = []
+
+    def funcao():
+        chamadas.append(1)
+        raise ValueError("falha")
+
+    with pytest.raises(ValueError):
+        limites.executar("teste_limites", funcao, tokens=10)
+    assert len(chamadas) == 1
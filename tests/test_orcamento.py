@@ -0,0 +1,46 @@
+from orcamento import contar_tokens, cortar_por_tokens, dividir_por_tokens, empacotar_contexto
+
+
+def test_cortar_texto_que_cabe_fica_igual():
+    assert cortar_por_tokens("Texto curto.", 50) == "Texto curto."
+
+
+def test_cortar_preenche_o_orcamento_por_palavras():
+    texto = "Primeira frase curta. " + "palavra " * 300
+    cortado = cortar_por_tokens(texto, 50)
+    assert cortado.startswith("Primeira frase curta. palavra")
+    assert cortado.endswith("...")
+    # Completa o orçamento com a frase seguinte (no máximo uma palavra de folga)
+    assert 50 - contar_tokens("palavra ") - 1 <= contar_tokens(cortado) <= 50
+
+
+def test_cortar_trecho_sem_espacos_em_caracteres():
+    cortado = cortar_por_tokens("x" * 2000, 20)
+    assert cortado.endswith("...")
+    assert 15 <= contar_tokens(cortado) <= 20
+
+
+def test_dividir_respeita_o_limite_sem_perder_conteudo():
+    paragrafos = ["Frase um. Frase dois. Frase tres." for _ in range(10)]
+    frase_enorme = " ".join(f"termo{i}" for i in range(400))
+    texto = "\n\n".join(paragrafos + [frase_enorme])
+    partes = dividir_por_tokens(texto, 60)
+    assert len(partes) > 1
+    assert all(contar_tokens(parte) <= 60 for parte in partes)
+    assert " ".join(partes).split() == texto.split()
+
+
+def test_empacotar_ordena_remove_repetidas_e_respeita_orcamento():
+    base = "O fungicida deve ser aplicado na dose de 2,5 L/ha no inicio da safra de soja."
+    registros = [
+        {"_id": "b", "conteudo": "Outro assunto: manejo de plantas daninhas no milho safrinha.", "similaridade": 0.7},
+        {"_id": "a", "conteudo": base, "similaridade": 0.9},
+        {"_id": "a2", "conteudo": base + " Repetido.", "similaridade": 0.8},
+        {"_id": "vazio", "conteudo": "", "similaridade": 0.99},
+    ]
+    escolhidos = empacotar_contexto(registros, max_tokens=200)
+    assert [r["_id"] for r in escolhidos] == ["a", "b"]
+    assert all(r["tokens"] == contar_tokens(r["conteudo"]) for r in escolhidos)
+
+    limitados = empacotar_contexto(registros, max_tokens=contar_tokens(base) + 5)
+    assert sum(r["tokens"] for r in limitados) <= contar_tokens(base) + 5
@@ -0,0 +1,29 @@
+import pytest
+
+from paragrafos import alvos_instrucao
+
+
+@pytest.mark.parametrize("instrucao, esperado", [
+    ("Aumente o segundo parágrafo em 30 palavras", [1]),
+    ("Acrescente dados de dose no segundo parágrafo", [1]),
+    ("Corrija a dose no parágrafo 3", [2]),
+    ("Simplifique o 2º e o 3º parágrafos", [1, 2]),
+    ("Deixe o último parágrafo mais formal", [3]),
+])
+def test_paragrafos_citados(instrucao, esperado):
+    assert alvos_instrucao(instrucao, 4) == esperado
+
+
+@pytest.mark.parametrize("instrucao", [
+    "Deixe o texto mais formal",                                  # não cita parágrafo
+    "Revise cada parágrafo do texto",                             # vale para o texto todo
+    "Corrija o sexto parágrafo",                                  # parágrafo inexistente
+    "Remova o segundo parágrafo",
+    "Adicione um parágrafo final com a conclusão",
+    "Junte o segundo e o terceiro parágrafos",
+    "Divida o segundo parágrafo em dois",
+    "Mova a frase sobre dose para o primeiro parágrafo",
+    "Troque a ordem do segundo e do terceiro parágrafos",
+])
+def test_instrucoes_do_texto_inteiro(instrucao):
+    assert alvos_instrucao(instrucao, 4) is None
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from saida_estruturada import ExtratorTexto, interpretar_resposta, SECAO_AJUSTES
+
+
+TEXTO = 'Olá "mundo"\n\nSegundo parágrafo com \\ barra, tab\te emoji 🌱 fim.'
+RESPOSTA = json.dumps({"texto_revisado": TEXTO, "fontes": [1], "ajustes": ["x"]})  # ensure_ascii: \uXXXX e pares
+
+
+def _extrair(trechos):
+    extrator = ExtratorTexto()
+    texto = "".join(extrator.alimentar(trecho) for trecho in trechos)
+    return texto + extrator.finalizar()
+
+
+def test_extrator_json_inteiro():
+    assert _extrair([RESPOSTA]) == TEXTO
+
+
+def test_extrator_json_caractere_a_caractere():
+    # Cada escape (\n, \", \\, \uXXXX e o par substituto do emoji) chega cortado no meio
+    assert _extrair(list(RESPOSTA)) == TEXTO
+
+
+@pytest.mark.parametrize("corte", range(1, 13))
+def test_extrator_par_substituto_dividido(corte):
+    resposta = '{"texto_revisado": "a\\ud83c\\udf31b"}'
+    inicio = resposta.index("\\ud83c")
+    trechos = [resposta[:inicio + corte], resposta[inicio + corte:]]
+    assert _extrair(trechos) == "a🌱b"
+
+
+def test_extrator_para_no_fim_do_texto():
+    trechos = ['{"texto_revisado": "fim', '", "fontes": [1], "ajustes": ["nao e texto"]}']
+    assert _extrair(trechos) == "fim"
+
+
+def test_extrator_texto_livre_retem_a_secao_de_ajustes():
+    resposta = f"Texto revisado livre.\n\n{SECAO_AJUSTES}\n- Ajuste 1"
+    assert _extrair([resposta[:10], resposta[10:30], resposta[30:]]) == "Texto revisado livre."
+
+
+def test_interpretar_json():
+    bruto = json.dumps({"texto_revisado": " Texto. ", "fontes": ["Fonte 2", 1, 2], "ajustes": ["a", {"x": "b"}]})
+    assert interpretar_resposta(f"```json\n{bruto}\n```") == {
+        "texto": "Texto.", "fontes": [2, 1], "ajustes": ["a", "b"], "formato": "json"}
+
+
+def test_interpretar_json_incompleto():
+    resposta = interpretar_resposta('{"texto_revisado": "Parte do texto que foi cort')
+    assert resposta["formato"] == "json_incompleto"
+    assert resposta["texto"] == "Parte do texto que foi cort"
+
+
+def test_interpretar_texto_livre():
+    resposta = interpretar_resposta(f"Texto livre.\n\n{SECAO_AJUSTES}\n- Corrigida a dose (Fonte 3)\n* Outro")
+    assert resposta == {"texto": "Texto livre.", "fontes": [3],
+                        "ajustes": ["Corrigida a dose (Fonte 3)", "Outro"], "formato": "livre"}